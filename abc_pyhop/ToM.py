@@ -1,20 +1,124 @@
 import models
-import copy
+import copy, itertools, logging, collections
 import solution
 
+"""
+The optimal plans of one teammate, stored as a trie. Plans that start with the same
+(action, resulting state) steps share those nodes, so N plans that differ in a few
+navigation steps cost little more than one. A node at depth d holds the d-th action
+of a plan and the state after it; each Plan points at its leaf.
+"""
+class PlanTrie(object):
+
+    class Node(object):
+        __slots__ = ['action', 'state', 'parent', 'depth', 'children', 'num_plans']
+
+        def __init__(self, action, state, parent):
+            self.action = action
+            self.state = state
+            self.parent = parent
+            self.depth = 0 if parent == None else parent.depth + 1
+            self.children = {}
+            self.num_plans = 0 # Plans ending at this node
+
+        # The node on this node's path at the given depth
+        def ancestor(self, depth):
+            node = self
+            while node.depth > depth:
+                node = node.parent
+            return node
+
+        # Actions of the path from depth start (exclusive) down to this node
+        def actions_after(self, start=0):
+            to_return = []
+            node = self
+            while node.depth > start:
+                to_return.append(node.action)
+                node = node.parent
+            to_return.reverse()
+            return to_return
+
+        def states_after(self, start=0):
+            to_return = []
+            node = self
+            while node.depth > start:
+                to_return.append(node.state)
+                node = node.parent
+            to_return.reverse()
+            return to_return
+
+    def __init__(self):
+        self.root = PlanTrie.Node(None, None, None)
+        self.num_nodes = 0
+        self.cost_index = solution.CostIndex() # Costs of the actions in the trie
+
+    # Returns the leaf for the plan, sharing every existing prefix
+    def insert(self, actions, states):
+        node = self.root
+        for (action, state) in zip(actions, states):
+            key = (action, id(state))
+            child = node.children.get(key)
+            if child == None:
+                child = PlanTrie.Node(action, state, node)
+                node.children[key] = child
+                self.num_nodes += 1
+                self.cost_index.add(action)
+            node = child
+        node.num_plans += 1
+        return node
+
+    # Drops a plan's leaf, and every node that no longer leads to a plan
+    def remove(self, leaf):
+        leaf.num_plans -= 1
+        node = leaf
+        while node.parent != None and node.num_plans == 0 and len(node.children) == 0:
+            del node.parent.children[(node.action, id(node.state))]
+            self.num_nodes -= 1
+            node = node.parent
+
+
+"""
+One plan in a ToM distribution. Besides the plan's likelihood and position (idx), it
+keeps the cursor of the teammate following it (cur_step, mental_world), which used to
+live in a separate AgentMind per plan.
+"""
 class Plan(object):
 
-    def __init__(self, self_name, actions, states):
+    # cost_index costs the plan's actions; usually the trie's, shared by all of its plans
+    def __init__(self, self_name, leaf, problem, cost_index=None):
         self.name = self_name
-        self.actions = actions
-        self.states = states
+        self.leaf = leaf
+        self.cost_index = cost_index if cost_index != None else solution.CostIndex(leaf.actions_after())
         self.idx = 0
         self.done = False
         self.likelihood = None
 
+        # Teammate following this plan
+        self.problem = problem
+        self.mental_world = problem.copy()
+        self.cur_step = 0
+        self.mind_done = (leaf.depth == 0)
+
+    def __len__(self):
+        return self.leaf.depth
+
+    @property
+    def actions(self):
+        return self.leaf.actions_after()
+
+    @property
+    def states(self):
+        return self.leaf.states_after()
+
     def get_actions(self):
         return self.actions
 
+    # i-th state of the plan, indexed like a list
+    def get_state(self, i):
+        if i < 0:
+            i += len(self)
+        return self.leaf.ancestor(i+1).state
+
     def get_likelihood(self):
         return self.get_likelihood
 
@@ -34,78 +138,96 @@ class Plan(object):
 
         self.idx += 1
 
-        if self.idx == len(self.actions):
+        if self.idx == len(self):
             self.done = True
-        
+
+    # Only actions on cells whose cost changed since the index was last updated are re-costed
     def get_projected_cost(self, world):
-        return sum([world.cost_func(world, a) for a in self.actions[self.idx:]])
+        self.cost_index.update(world)
+        return sum([self.cost_index.cost[a] for a in self.leaf.actions_after(self.idx)])
 
     # Return the probability of observing loc at idx
     def get_obs_prob(self, loc, idx):
         if idx <= 0:
             return 0.5
-        if idx > len(self.states):
-            idx = len(self.states)
-        # print("Get_obs_prob for loc:{} and idx:{}".format(loc, idx))
-        # print(self.states[idx-1].at)
-        return int(self.states[idx-1].at[self.name] == loc)
+        if idx > len(self):
+            idx = len(self)
+        return int(self.get_state(idx-1).at[self.name] == loc)
 
 
 # A distribution of minds
 class ToM(object):
 
-    def __init__(self, self_name, other_name, other_solution, world):
-        self.name = self_name, 
+    # limit caps the number of plans kept per solution; None keeps all optimal plans
+    def __init__(self, self_name, other_name, other_solution, world, limit=None):
+        self.name = self_name,
         self.other_name = other_name
-        self.agent_minds = {}
+        self.plans = collections.OrderedDict() # Used as an ordered set
+        self.trie = PlanTrie()
+        self.limit = limit
+        self.log = logging.getLogger('ToM.{}.{}'.format(other_name, world.name))
+        self.log.setLevel(logging.CRITICAL)
         self.add_solutions(other_solution) # World is the starting
 
     def add_solutions(self, other_solution, p_factor=1):
         num_plans = other_solution.get_num_opt_plans()
+        if self.limit != None:
+            num_plans = min(num_plans, self.limit)
         world = other_solution.problem
-        for (actions, states) in other_solution.get_all_plans():
-            p = Plan(other_solution.agent, actions, states)
+        # Plans are streamed from the solution, never built up as a list
+        for (actions, states) in itertools.islice(other_solution.iter_plans(), self.limit):
+            p = Plan(other_solution.agent, self.trie.insert(actions, states), world, self.trie.cost_index)
             p.set_likelihood(1.0/num_plans * p_factor)
-            self.agent_minds[p] = self.make_agent_model(p, world)
-
-    # Make AgentMind Model for a given plan
-    def make_agent_model(self, p, world):   
-        teammate = models.AgentMind(self.other_name, copy.deepcopy(world))
-        sol = solution.Solution(world, self.name, p.actions, p.states)
-        teammate.set_solution(sol)
+            self.plans[p] = None
+
+    # Make AgentMind Model for a given plan. It shares the plan's mental world.
+    def make_agent_model(self, p):
+        teammate = models.AgentMind(self.other_name, p.mental_world, makeLog=False, copy_world=False)
+        teammate.log = self.log
+        teammate.solution = solution.Solution(p.problem, self.name, p.actions, p.states)
+        teammate.actions = teammate.solution.get_actions()
+        teammate.states = teammate.solution.get_states()
+        teammate.cur_step = p.cur_step
+        teammate.done = p.mind_done
+        teammate.success = (len(p) == 0)
         return teammate
 
     def get_num_plans(self):
-        return len(self.agent_minds.keys())
+        return len(self.plans)
 
     def get_plans(self):
-        return self.agent_minds.keys()
+        return self.plans.keys()
+
+    def remove_plan(self, plan):
+        del self.plans[plan]
+        self.trie.remove(plan.leaf)
 
     def step(self):
-        for plan, teammate in self.agent_minds.items():
+        for plan in self.plans:
             plan.step()
-            if not teammate.is_done():
-                teammate.mental_world = teammate.states[teammate.cur_step]
-                teammate.cur_step += 1
-                if teammate.cur_step >= len(teammate.actions):
-                    teammate.done = True
+            if not plan.mind_done:
+                plan.mental_world = plan.get_state(plan.cur_step)
+                plan.cur_step += 1
+                if plan.cur_step >= len(plan):
+                    plan.mind_done = True
 
     def step_back(self):
-        for plan, teammate in self.agent_minds.items():
+        for plan in self.plans:
             plan.step_back()
-            teammate.cur_step -= 1
-            if teammate.cur_step <= 0:
-                teammate.mental_world = teammate.solution.problem
+            plan.cur_step -= 1
+            if plan.cur_step <= 0:
+                plan.mental_world = plan.problem
             else:
-                teammate.mental_world = teammate.states[teammate.cur_step]
-            teammate.done = False
-            
+                plan.mental_world = plan.get_state(plan.cur_step)
+            plan.mind_done = False
+
     def update_plan_dist(self, old_plan, replacement_sol):
-        del self.agent_minds[old_plan]
+        self.remove_plan(old_plan)
         self.add_solutions(replacement_sol, p_factor=old_plan.likelihood)
 
+    # Builds an AgentMind per plan on demand, for code that simulates the teammate
     def get_agent_minds(self):
-        return self.agent_minds
+        return collections.OrderedDict((p, self.make_agent_model(p)) for p in self.plans)
 
 
 
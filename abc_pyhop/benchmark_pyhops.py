@@ -1,161 +1,244 @@
-""" 
+"""
 This file is used to benchmar the performance of the different versions of pyhop.
+
+For every planner (a Planner.get_HPlanner_* factory) and board size, the first few
+problems of problems/ are planned for each of their agents. Per (planner, board) case
+we report wall time, node expansions (method decompositions + operator applications),
+A* expansions, pruned branches, the peak openset size, State deepcopies and copy-on-write
+copies (all from a pyhop.PlanStats), peak memory and the total cost of the plans found. Problems are planned with their uncertainties applied, so navigation runs over
+uneven costs. Results can be written to a JSON file and compared against a stored
+baseline:
+
+    python benchmark_pyhops.py --boards 5x5,8x8 --out bench.json
+    python benchmark_pyhops.py --boards 5x5,8x8 --baseline bench.json
+
+--check-trees instead checks the distance trees kept across cost edits (see check_distance_trees):
+
+    python benchmark_pyhops.py --check-trees --boards 8x8,12x12
 """
 
 from __future__ import print_function
-from pyhop import *
+import argparse
+import functools
+import json
+import multiprocessing
 import random
+import resource
+import sys
 import time
-import collections
-import matplotlib.pyplot as plt
 
-import rovers_world_operators
-import rovers_world_methods
 from random_rovers_world import *
-import problem_bank
-
-def single_agent_benchmark():
-
-    num_repeat = 7
-    board_X = range(4, 6)
-    board_Y = range(3, 5)
-    world_gen_times = {}
-    board_size_times = {}
-    num_solutions_times = {}
-    num_recurse_calls = {}
-
-    for x in board_X:
-        for y in board_Y:
-            board_size = x*y
-            print ('board size: ', x, y)
-            world_gen_sum = 0
-            board_size_sum = 0
-
-
-            for i in range(num_repeat):
-                start = time.time()
-                world = get_random_world(x, y)
-                end = time.time()
-                world_gen_sum += (end-start)
-
-                print_board(world)
-
-                start = time.time()
-                solutions = pyhop(world, 'agent1', verbose=0, all_solutions=True)
-                end = time.time()
-                board_size_sum += (end-start)
-                num_recurse_calls[len(solutions)] = get_num_recurse_calls()
-                num_solutions_times[len(solutions)] = end-start
-                print('find {} solutions for board of size {}'.format(len(solutions), board_size))
-                print('num_recurse_calls', num_recurse_calls)
-                print('num_solutions_times', num_solutions_times)           
-    
-    # plot time with respect to the number of solutions found.
-    od_num_solutions_times = collections.OrderedDict(sorted(num_solutions_times.items()))
-    print('Ordered od_num_solutions_time', od_num_solutions_times)
-    od_num_recurse_calls = collections.OrderedDict(sorted(num_recurse_calls.items()))
-    print('Ordered od_num_recurse_calls', od_num_recurse_calls)
-    
-    plt.plot(od_num_solutions_times.keys(), od_num_solutions_times.values())
-    plt.plot(od_num_recurse_calls.keys(), od_num_recurse_calls.values())
-    plt.show()
-
-def benchmark_amortized(verbose=0):
-    world = get_random_world(6, 5)
-
-    print_board(world)
-
-    start = time.time()
-    solutions_a = pyhop(world, 'agent1', verbose, all_solutions=True, amortize=False) # only one solution
-    end = time.time()
-    print ('before:', end-start)
-    print ('num_recurse calls', get_num_recurse_calls())
-    start = time.time()
-    solutions_b = pyhop(world, 'agent1', verbose, all_solutions=True, amortize=True) # only one solution
-    end = time.time()
-    print ('after:', end-start)
-    print ('num_recurse calls', get_num_recurse_calls())
-    
-    print('solution_a size: ', len(solutions_a))
-    print('solution_b size: ', len(solutions_b))
-
-def benchmark_compare_a_star(verbose=0):
-    world = get_random_world(6, 5)
-
-    print_board(world)
-
-    # Get all solutions using Hierarchical Decompositions for navigating (Baseline3)
-    world.settings['a-star'] = False
-    start = time.time()
-    solutions_a = pyhop(world, 'agent1', verbose, all_solutions=True, amortize=False) # only one solution
-    end = time.time()
-
-    print ('before:', end-start)
-    print('num solutions found:', len(solutions_a))
-    print ('num_recurse calls', get_num_recurse_calls())
-    
-    # Get all solutions using A-star for navigating
-    world.settings['a-star'] = True
-    start = time.time()
-    solutions_b = pyhop(world, 'agent1', 0, all_solutions=True, amortize=False) # only one solution
-    end = time.time()
-    print ('after:', end-start)
-    print('num solutions found:', len(solutions_b))
-    print ('num_recurse calls', get_num_recurse_calls())
-    
-# Benchmark for how long navigaton takes for random navigation problems
-def benchmark_a_star(verbose=0):
-    
-    num_worlds = 1
-    num_problems = 1
-    num_repeat = 5
-    problem_bank = {}
-    
-    planner = Planner.get_HPlanner_v14()
-
-    for i in range(num_worlds):
-        # world = get_random_world(10, 10) # Defaut to 10 x 10
-        # world.uncertainties = get_uncertainty_fun(world, num_step=100, a_prob=0.5)
-        # world.uncertainties(world, 0)
-
-        world = make_rand_nav_problem(10, 10)
-        world.uncertainties(world, 0)
-
-        # Get all solutions using A-star for navigating
-        print_board(world)
-        if verbose: 
-            print_board(world)
-            print_state(world)
-        
-        world.a_star = True
-
-        for j in range(num_problems):
-            # Make a navigation problem
-            random_loc = random.choice(world.loc_available.keys())
-            world.goals['A1'] = [('navigate', 'A1', random_loc)]
-            world.settings['verbose'] = 0
-            
-            print("Goal: {}".format(world.goals['A1']))
-
-            for k in range(num_repeat):
-                start = time.time()
-                sol = planner.plan(world, 'A1')[0]
-                end = time.time()
-                
-                print ('time:', end-start)
-                print ('problem: ', world.goals)
-                print ('solutiON; ', sol)
-                
-                print ('solution length', len(sol.get_actions()))
-                problem_bank[world.goals['A1'][0]] = end-start
-
-                if (end-start) > 1:
-                    print_board(world)
-                    print ('solution', solutions_b)
-                    print ('*** Re-run problem with verbose=3')
-                    world.settings['verbose'] = 2
-                    pyhop(world, 'agent1', 3, all_solutions=True, amortize=False) # only one solution
-                    raw_input("Above problem took too long... {} seconds".format(end-start))
+from planners import *
+import pyhop # After the star imports, which bring in the pyhop() function
+import problems as ProblemLib
+import navigation
+
+PLANNERS = {
+    'v14': Planner.get_HPlanner_v14,
+    'v15': Planner.get_HPlanner_v15,
+    'v16': Planner.get_HPlanner_v16,
+    'v17': Planner.get_HPlanner_v17,
+    'bb': Planner.get_HPlanner_bb,
+    'bb_prob': Planner.get_HPlanner_bb_prob,
+    'bb_all': Planner.get_HPlanner_bb_all,
+    'bb_bf': functools.partial(Planner.get_HPlanner_bb, best_first=True),
+    'bb_prob_bf': functools.partial(Planner.get_HPlanner_bb_prob, best_first=True),
+}
+DEFAULT_PLANNERS = ['v14', 'v16', 'bb', 'bb_prob']
+DEFAULT_BOARDS = [(5, 5), (6, 6), (8, 8)]
+NUM_PROBLEMS = 5
+NUM_REPEAT = 3 # Timed runs per case; the fastest is reported
+SEED = 0
+
+def get_case_name(planner_name, board, oracle=False):
+    return "{}{}@{}x{}".format(planner_name, '_oracle' if oracle else '', board[0], board[1])
+
+# Plans every agent of every problem once; returns the total cost of the first plans
+def plan_all(planner, problems):
+    total_cost = 0
+    num_plans = 0
+    for problem in problems:
+        planner.clear_plan_library()
+        for agent in sorted(problem.goals.keys()):
+            solutions = planner.plan(problem, agent, rng=pyhop.RNG(SEED))
+            if solutions and solutions[0] not in (None, False):
+                total_cost += solutions[0].get_cost()
+                num_plans += 1
+    return (total_cost, num_plans)
+
+"""
+One benchmark case. Planning is timed without stats (the best of num_repeat runs), then
+repeated collecting a pyhop.PlanStats; every run is seeded the same, so all find the same plans.
+"""
+def run_case(planner_name, board, num_problems=NUM_PROBLEMS, oracle=False, num_repeat=NUM_REPEAT):
+    (x, y) = board
+    problems = ProblemLib.find_problems(x, y, NUM_ROCKS=1, NUM_SOILS=1, RAND_PROB=0.3, limit=num_problems)
+    for problem in problems:
+        problem.uncertainties(problem, 0)
+    planner = PLANNERS[planner_name](oracle=oracle)
+
+    wall_time = None
+    for i in range(num_repeat):
+        start = time.time()
+        (plan_cost, num_plans) = plan_all(planner, problems)
+        if wall_time == None or time.time() - start < wall_time:
+            wall_time = time.time() - start
+
+    stats = pyhop.PlanStats()
+    with pyhop.collect_stats(stats):
+        plan_all(planner, problems)
+
+    return {
+        'planner': planner.name,
+        'board': [x, y],
+        'num_problems': len(problems),
+        'num_plans': num_plans,
+        'wall_time': wall_time,
+        'expansions': stats.decompositions + stats.operator_calls,
+        'nav_expansions': stats.nav_expansions,
+        'pruned': stats.pruned,
+        'openset_peak': stats.openset_peak,
+        'deepcopies': stats.deepcopies,
+        'copies': stats.copies,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, # ru_maxrss is in KB on Linux
+        'plan_cost': plan_cost,
+    }
+
+def run_case_args(args):
+    return run_case(*args)
+
+"""
+Runs every case, each in a fresh worker process so that its peak memory is its own
+(isolate=False runs them in this process; peak memory is then cumulative).
+"""
+def run_benchmark(planner_names=DEFAULT_PLANNERS, boards=DEFAULT_BOARDS, num_problems=NUM_PROBLEMS, \
+        oracle=False, isolate=True, num_repeat=NUM_REPEAT):
+    cases = {}
+    for planner_name in planner_names:
+        for board in boards:
+            args = (planner_name, board, num_problems, oracle, num_repeat)
+            if isolate:
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(run_case_args, (args,))
+                finally:
+                    pool.terminate()
+            else:
+                result = run_case(*args)
+            cases[get_case_name(planner_name, board, oracle)] = result
+            print("{}\t{:.3f}s\t{} expansions\t{} deepcopies\t{} copies\t{:.1f}MB\tcost {}".format(
+                get_case_name(planner_name, board, oracle), result['wall_time'], result['expansions'],
+                result['deepcopies'], result['copies'], result['peak_rss_mb'], result['plan_cost']))
+    return {'python': sys.version.split()[0], 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'cases': cases}
+
+"""
+Compares a benchmark run to a baseline run; returns the regressions found.
+Counts and plan costs are deterministic and must not grow; wall time and peak memory
+may grow by a factor of tolerance before they count as a regression.
+"""
+def compare(results, baseline, tolerance=0.2):
+    regressions = []
+    for (name, case) in sorted(results['cases'].items()):
+        base = baseline['cases'].get(name)
+        if base == None:
+            print("{}\tnot in baseline".format(name))
+            continue
+        print("{}\ttime x{:.2f}\texpansions x{:.2f}\tdeepcopies x{:.2f}\tmemory x{:.2f}".format(name,
+            ratio(case['wall_time'], base['wall_time']), ratio(case['expansions'], base['expansions']),
+            ratio(case['deepcopies'], base['deepcopies']), ratio(case['peak_rss_mb'], base['peak_rss_mb'])))
+        for field in ['expansions', 'nav_expansions', 'deepcopies', 'copies']:
+            if case[field] > base.get(field, case[field]):
+                regressions.append("{}: {} {} > {}".format(name, field, case[field], base[field]))
+        for field in ['wall_time', 'peak_rss_mb']:
+            if case[field] > base[field] * (1 + tolerance):
+                regressions.append("{}: {} {:.3f} > {:.3f}".format(name, field, case[field], base[field]))
+        if abs(case['plan_cost'] - base['plan_cost']) > 1e-6:
+            regressions.append("{}: plan_cost {} != {}".format(name, case['plan_cost'], base['plan_cost']))
+    return regressions
+
+def ratio(value, base):
+    if base == 0:
+        return float('inf') if value > 0 else 1.0
+    return float(value) / base
+
+"""
+Checks the distance trees navigation.distance_tree hands out after cost edits against
+freshly built ones. Each problem (uncertainties applied) gets num_edits rounds of a few
+random set_item('cost', ...) writes; after each round the trees of every sink, for both
+navigate (step=1) and cost_lower_bound (step=0), must have the fresh distances and a
+next_loc chain that reaches the sink. Returns the mismatches found.
+"""
+def check_distance_trees(boards=DEFAULT_BOARDS, num_problems=NUM_PROBLEMS, num_edits=10, seed=SEED):
+    rng = random.Random(seed)
+    errors = []
+    for (x, y) in boards:
+        for problem in ProblemLib.find_problems(x, y, NUM_ROCKS=1, NUM_SOILS=1, RAND_PROB=0.3, limit=num_problems):
+            problem.uncertainties(problem, 0)
+            state = problem.copy()
+            num_cells = state.grid.num_cells
+            sinks = range(1, num_cells + 1)
+            for edit in range(num_edits + 1):
+                if edit > 0:
+                    state = state.copy()
+                    for i in range(rng.choice([1, 2, 3])):
+                        loc = rng.randint(1, num_cells)
+                        state.set_item('cost', loc, max(0, state.cost[loc] + rng.choice([-1, 1, 2])))
+                for step in [0, 1]:
+                    for sink in sinks:
+                        tree = navigation.distance_tree(state, sink, step)
+                        fresh = navigation.DistanceTree(state, sink, step)
+                        for loc in sinks:
+                            if abs(tree.dist[loc] - fresh.dist[loc]) > 1e-9:
+                                errors.append("{} edit {} step {} sink {}: dist[{}] {} != {}".format(
+                                    problem.name, edit, step, sink, loc, tree.dist[loc], fresh.dist[loc]))
+                            elif tree.dist[loc] != navigation.INF:
+                                (cur, hops) = (loc, 0)
+                                while cur != sink and hops <= num_cells:
+                                    (cur, hops) = (tree.next_loc[cur], hops + 1)
+                                if cur != sink:
+                                    errors.append("{} edit {} step {} sink {}: next_loc from {} never reaches the sink".format(
+                                        problem.name, edit, step, sink, loc))
+    return errors
+
+def parse_boards(arg):
+    return [tuple(int(n) for n in board.split('x')) for board in arg.split(',')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the planners on problems/')
+    parser.add_argument('--planners', default=','.join(DEFAULT_PLANNERS),
+        help='comma-separated, from: ' + ','.join(sorted(PLANNERS)))
+    parser.add_argument('--boards', default=','.join('{}x{}'.format(x, y) for (x, y) in DEFAULT_BOARDS))
+    parser.add_argument('--problems', type=int, default=NUM_PROBLEMS, help='problems per board')
+    parser.add_argument('--repeat', type=int, default=NUM_REPEAT, help='timed runs per case')
+    parser.add_argument('--oracle', action='store_true', help='plan with the distance oracle')
+    parser.add_argument('--no-isolate', action='store_true', help='run all cases in this process')
+    parser.add_argument('--out', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed time/memory growth')
+    parser.add_argument('--check-trees', action='store_true', help='only check repaired distance trees against fresh ones')
+    args = parser.parse_args(argv)
+
+    if args.check_trees:
+        errors = check_distance_trees(parse_boards(args.boards), args.problems)
+        for error in errors[:20]:
+            print("MISMATCH " + error)
+        print("{} distance tree mismatches".format(len(errors)))
+        return 1 if errors else 0
+
+    results = run_benchmark(args.planners.split(','), parse_boards(args.boards), args.problems, \
+        args.oracle, not args.no_isolate, args.repeat)
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        return 1 if regressions else 0
+    return 0
 
 
 # Generic Bencharmking method
@@ -220,7 +303,6 @@ def test_planner(planner1):
     print("avg planner1_time: {}".format(sum(planner1_time)/len(planner1_time)))
 
 
-from planners import *
 # These two are practically the same
 # benchmark(Planner.get_HPlanner_v10(), Planner.get_HPlanner_v13())
 
@@ -239,26 +321,6 @@ from planners import *
 # test_planner(Planner.get_HPlanner_v13())
 # test_planner(Planner.get_HPlanner_v14())
 # test_planner(Planner.get_HPlanner_bb_prob())
-# test_planner(Planner.get_HPlanner_v13())
-
-# benchmark_amortized(verbose=0)
-
-# single_agent_benchmark()
-
-# benchmark_compare_a_star()
-
-benchmark_a_star(verbose=0)
-
-
-
-
-
-
-
-
-
-
-
-
-
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -213,7 +213,7 @@ class BoardFrame(Tkinter.Frame):
                 else:
                     occupied[(i, j)] = str(thing)
 
-        for i in world.cost.keys():
+        for i in world.loc.keys():
             if world.cost[i] > world.MAX_COST:
                 occupied[world.loc[i]] = "X"
 
@@ -4,6 +4,7 @@ import problems as ProblemLib
 from pprint import pprint
 import statistics
 import sys
+import result_store
 class SimulationParameters(object):
     def __init__(self, planner, model, coc, num_repeat=1):
         self.planner = planner
@@ -71,22 +72,16 @@ class LineIdentifier(object):
 class Key(object):
 	def __init__(self):
 		pass
-def parse_board_simulation(filename):
-	f = open(filename, 'r')
-	sim_param = {}
-
-	for line in f:
-		r = SimResult(*line.split('\t'))
-		x, y, p_id, rand_range, a_prob_, t = r.problem_name.split('_')
-		sim_param_key = r.planner + '\t' + r.model + '\t' + str(r.CoC) + '\t' + x + '\t' + y
-		if sim_param_key in sim_param:
-			sim_param[sim_param_key].append(r.final_cost)
-		else:
-			sim_param[sim_param_key] = [r.final_cost]
+# Writes the mean final cost per planner, model, CoC and board of a per-simulation file
+def write_board_averages(filename, out_name):
+	results = result_store.read_results_file(filename)
+	out = open(out_name, 'a')
+	for g in result_store.group_by(results, ['planner', 'model', 'CoC', 'board_x', 'board_y']):
+		out.write('\t'.join([g['planner'], g['model'], str(float(g['CoC'])), str(g['board_x']), str(g['board_y']), \
+			str(float(g['mean'])), str(g['count'])]) + '\n')
 
-	out = open('results/DetPlanner_over_board_averaged.txt', 'a')
-	for key, vals in sim_param.items():
-		out.write(key + '\t' + str(sum(vals)/len(vals)) + '\t' + str(len(vals)) + '\n')
+def parse_board_simulation(filename):
+	write_board_averages(filename, 'results/DetPlanner_over_board_averaged.txt')
 
 
 # Compare two raw file and output a raw-file that contains the intersection of problems
@@ -109,50 +104,20 @@ def parse_intersection(subset_file, file_name, out_name, re_write=True):
 
 
 def parse_avg_to_lines(filename, out_name):
-	f = open(filename, 'r')
-	sim_param = {}
-
-	for line in f:
-		r = SimResult(*line.split('\t')[:9])
-		x, y, p_id, rand_range, a_prob_, t = r.problem_name.split('_')
-		sim_param_key = r.planner + '\t' + r.model + '\t' + str(r.CoC) + '\t' + x + '\t' + y
-		if sim_param_key in sim_param:
-			sim_param[sim_param_key].append(r.final_cost)
-		else:
-			sim_param[sim_param_key] = [r.final_cost]
-
-	out = open(out_name, 'a')
-	for key, vals in sim_param.items():
-		out.write(key + '\t' + str(sum(vals)/len(vals)) + '\t' + str(len(vals)) + '\n')
+	write_board_averages(filename, out_name)
 
 
 def parse_raw(filename):
-	f = open(filename, 'r')
-	sim_param = {}
-	for line in f:
-		r = SimResult(*line.split('\t')[:9])
-		x, y, p_id, rand_range, a_prob_, t = r.problem_name.split('_')
-		# sim_param_key = ProblemParameters(x, y, 2, 2, rand_range, a_prob_)
-		# sim_param_key = Key()
-		# sim_param_key.planner = r.planner
-		# sim_param_key.model = r.model
-		# sim_param_key.CoC = r.CoC
-		# sim_param_key.problem_name = r.problem_name
-		sim_param_key = r.planner + '\t' + r.model + '\t' + str(r.CoC) + '\t' + r.problem_name
-		if sim_param_key in sim_param:
-			sim_param[sim_param_key].append(r.final_cost)
-		else:
-			sim_param[sim_param_key] = [r.final_cost]
+	results = result_store.read_results_file(filename)
 
 	# Compute average over repeated problems
 	problem_avg = {}
 	problems = {}
-	for key, vals in sim_param.items():
-		planner, model, CoC, problem_name = key.split('\t')
-		# avg = sum(vals)/len(vals)
-		avg = statistics.median(vals)
-		n = len(vals)
-		problem_avg[key] = avg
+	for g in result_store.group_by(results, ['planner', 'model', 'CoC', 'problem_name']):
+		model, CoC, problem_name = g['model'], str(float(g['CoC'])), g['problem_name']
+		avg = float(g['median'])
+		n = g['count']
+		problem_avg[(g['planner'], model, CoC, problem_name)] = avg
 
 		problem_key = problem_name + '\t' + CoC
 		if problem_key in problems:
@@ -1,7 +1,7 @@
 """
 Mental Models for agents
 """
-import copy, sys, logging
+import copy, sys, logging, itertools, time
 from random_rovers_world import *
 from plantree import *
 from solution import *
@@ -16,11 +16,67 @@ class CommMessage():
     def __repr__(self):
         return "{}\t--->\t{}:\t{}".format(self.sender, self.receiver, self.msg)
 
+"""
+Solutions of the plans made by EX_COST, by (agent name, fingerprint of the world planned in).
+A hit also needs the world to equal (State.__eq__) the one planned in, so that worlds
+whose fingerprints collide never share a plan.
+Within a timestep an agent plans for the same teammate in the same world many times over
+(for each diff, with and without communicating, and for each plan of its ToM), so each
+world is planned once. A world that is a planned world with a few cells made costlier is
+not planned either when the planner can reuse its solution (Planner.reuse_solutions).
+The cache is cleared when the timestep changes.
+"""
+class PlanCache(object):
+
+    def __init__(self):
+        self.solutions = {} # (agent name, fingerprint): [(world, solution)]
+        self.planned = {} # agent name: [(world, solution)] of the worlds actually planned
+        self.step = None
+        self.hits = 0
+        self.reuses = 0
+        self.misses = 0
+
+    # The solution for agent_name in world at timestep step, or None if it must be planned
+    def get(self, step, agent_name, world, planner):
+        if step != self.step:
+            self.solutions = {}
+            self.planned = {}
+            self.step = step
+        for (cached_world, solution) in self.solutions.get((agent_name, world.fingerprint()), []):
+            if cached_world == world:
+                self.hits += 1
+                return solution
+        for (base, base_solution) in self.planned.get(agent_name, []):
+            solutions = planner.reuse_solutions(base, [base_solution], world)
+            if solutions != None:
+                self.reuses += 1
+                self.add(agent_name, world, solutions[0])
+                return solutions[0]
+        self.misses += 1
+        return None
+
+    def put(self, agent_name, world, solution):
+        world = self.add(agent_name, world, solution)
+        self.planned.setdefault(agent_name, []).append((world, solution))
+
+    # Keeps a copy of world, which holds its values if world is written to later
+    def add(self, agent_name, world, solution):
+        world = world.copy()
+        self.solutions.setdefault((agent_name, world.fingerprint()), []).append((world, solution))
+        return world
+
+    def __repr__(self):
+        return "PlanCache(hits={}, reuses={}, misses={})".format(self.hits, self.reuses, self.misses)
+
 # Every Agent has an AgentMind (generic)
 class AgentMind(object):
 
+    LOGGER_IDS = itertools.count() # Unique logger names, without drawing from the simulation's rng
+    PLAN_TIME = None # Seconds an anytime planner may spend per planning call; None plans to the end
+    CACHE_PLANS = True # EX_COST plans each (agent, world) once per timestep
+
     def make_logger(self):
-        self.log = logging.getLogger('{}.{}.{}'.format(self.name, self.mental_world.name, int(random.random()*1000)))
+        self.log = logging.getLogger('{}.{}.{}'.format(self.name, self.mental_world.name, next(AgentMind.LOGGER_IDS)))
         self.log.setLevel(logging.CRITICAL)
         # file_handler = logging.FileHandler('logs/AgentMind_{}.log'.format(self.name))
         # formatter = logging.Formatter('%(asctime)s-%(name)s-%(levelname)s(%(lineno)d):%(message)s')
@@ -36,9 +92,9 @@ class AgentMind(object):
         - It's current position in the plan
         - A history of past steps
     """
-    def __init__(self, name, world, makeLog=True):
+    def __init__(self, name, world, makeLog=True, copy_world=True):
         self.name = name
-        self.mental_world = copy.deepcopy(world)
+        self.mental_world = copy.deepcopy(world) if copy_world else world
         self.goal = world.goals[name]
         
         self.planner = None
@@ -54,6 +110,7 @@ class AgentMind(object):
         self.observations = []
         self.voided_msgs = []
         self.sent_msgs = []
+        self.plan_cache = PlanCache()
 
         self.done = False
         self.success = False
@@ -124,31 +181,34 @@ class AgentMind(object):
     # Determine whether or not to re-plan
     def replan_q(self):
 
-        self.log.info("Agent: {} replan?".format(self.name))
+        self.log.info("Agent: %s replan?", self.name)
         # If agent solution is SolutionTree, then we evaluate cost relative to new world. 
         # If new cost is greater than old, then re-plan
         # if isinstance(self.solution, SolutionTree):
         #     new_exp_cost = self.solution.get_exp_cost(self.mental_world)
-        #     self.log.info("Agent has SolutionTree: checking if self.cost {} == new expected cost {}".format(self.solution.cost, new_exp_cost))
+        #     self.log.info("Agent has SolutionTree: checking if self.cost %s == new expected cost %s", self.solution.cost, new_exp_cost)
         #     return self.solution.cost == new_exp_cost
 
-        cur_world = copy.deepcopy(self.mental_world)
-        (simulated, end_world, accum_cost) = self.simulate(self.name, cur_world, self.actions[self.cur_step:])
+        # act() copies the world it steps, so the mental world is simulated as it is
+        (simulated, end_world, accum_cost) = self.simulate(self.name, self.mental_world, self.actions[self.cur_step:])
         if simulated:
-            self.log.info("Simulation success, no need for re-plan. Accum_cost:{}".format(accum_cost))
+            self.log.info("Simulation success, no need for re-plan. Accum_cost:%s", accum_cost,
+                extra={'event': 'replan', 'agent': self.name, 'replan': False, 'cost': accum_cost})
             return False
         else:
-            self.log.info ("Agent: {}; Type: {}; must replan !!!".format(self.name, type(self)))
+            self.log.info("Agent: %s; Type: %s; must replan !!!", self.name, type(self),
+                extra={'event': 'replan', 'agent': self.name, 'replan': True, 'cost': accum_cost})
             return True
 
     def simulate(self, agent_name, cur_world, step_actions):
-        self.log.info("Simulating Agent {}'s world with actions: {}; world:\n{}".format(agent_name, step_actions, print_board_str(cur_world)))
+        self.log.info("Simulating Agent %s's world with actions: %s; world:\n%s",
+            agent_name, step_actions, BoardStr(cur_world))
         accum_cost = 0
         num_steps = 0
         for action in step_actions:
             next_world = act(cur_world, action)
             if next_world == False:
-                self.log.info('Simulation failed at step: {} after cost: {}'.format(num_steps, accum_cost))
+                self.log.info('Simulation failed at step: %s after cost: %s', num_steps, accum_cost)
                 return (False, cur_world, accum_cost)
             else:
                 cur_world = next_world
@@ -166,25 +226,27 @@ class AgentMind(object):
         loc_diff = [] # NOTE TODO: For now it is only location diff
         # at_diff = [] # Note TODO: For now also include object locaitons
 
+        # Only the cells and objects within sight are looked at. What is seen is collected in
+        # a WorldDelta and patched into the mental world at the end.
+        seen = WorldDelta()
         my_l = self.mental_world.at[self.name]
-        for l in self.mental_world.loc.keys(): # Look at all the locations
-            if AgentMind.visible(my_l, l, real_world, range=2) and self.mental_world.cost[l] != real_world.cost[l]:
+        for l in real_world.grid.visible_from(my_l, 2):
+            if seen.get(self.mental_world, 'cost', l) != real_world.cost[l]:
                 # Can see traps that are far away
                 if real_world.cost[l] > real_world.MAX_COST or self.mental_world.cost[l] > real_world.MAX_COST:
-                    self.mental_world.cost[l] = real_world.cost[l]
+                    seen.set('cost', l, real_world.cost[l])
                     loc_diff.append((l, real_world.cost[l]))
 
             # Identify differences in cost
-            if AgentMind.visible(my_l, l, real_world) and self.mental_world.cost[l] != real_world.cost[l]:
-                self.mental_world.cost[l] = real_world.cost[l]
+            if l == my_l and seen.get(self.mental_world, 'cost', l) != real_world.cost[l]:
+                seen.set('cost', l, real_world.cost[l])
                 loc_diff.append((l, real_world.cost[l]))
-            
-        for (obj, loc) in real_world.at.items():
-            if loc != None and AgentMind.visible(my_l, loc, real_world) and self.mental_world.at[obj] != real_world.at[obj]:
-                self.mental_world.at[obj] = real_world.at[obj]
-        for (obj, loc) in self.mental_world.at.items():
-            if loc != None and AgentMind.visible(my_l, loc, self.mental_world) and self.mental_world.at[obj] != real_world.at[obj]:
-                self.mental_world.at[obj] = real_world.at[obj]
+
+        for l in real_world.grid.visible_from(my_l, 0):
+            for obj in AgentMind.objects_at(real_world, l) + AgentMind.objects_at(self.mental_world, l):
+                if self.mental_world.at[obj] != real_world.at[obj]:
+                    seen.set('at', obj, real_world.at[obj])
+        seen.apply(self.mental_world)
 
         # Return a list of locations and their new cost
         return loc_diff # TODO: also include other differences inthe observation.
@@ -195,9 +257,21 @@ class AgentMind(object):
         b_x, b_y = world.loc[B]
         return((abs(a_x - b_x)**2 + abs(a_y - b_y)**2) <= range)
     
+    # Objects at cell in world, through an index of world.at kept in its memo
+    @staticmethod
+    def objects_at(world, cell):
+        memo = world.memo('at')
+        by_cell = memo.get('by_cell')
+        if by_cell == None:
+            by_cell = memo['by_cell'] = {}
+            for (obj, loc) in world.at.items():
+                if loc != None:
+                    by_cell.setdefault(loc, []).append(obj)
+        return by_cell.get(cell, [])
+
     # Returns a simple copy of current agent
     def simple_copy(self):
-        other = AgentMind(self.name, copy.deepcopy(self.mental_world), makeLog=False)
+        other = AgentMind(self.name, self.mental_world.copy(), makeLog=False, copy_world=False)
         other.goal = self.goal
         other.solution = self.solution
         other.planTree = self.planTree
@@ -220,33 +294,51 @@ class AgentMind(object):
         if len(incomingMsgs) == 0: 
             return False
 
-        self.log.info("Simulation: {}".format(sim))
-        self.log.info("Agent {} is handling incoming communications:\n\t{}".format(self.name, communications))
+        self.log.info("Simulation: %s", sim)
+        self.log.info("Agent %s is handling incoming communications:\n\t%s", self.name, communications)
         # TODO: given communication, return a set of differences that are new
         # NOTE: assume only location-availability information is given
-        self.log.info("\t incomming messages: {}".format(incomingMsgs))
+        self.log.info("\t incomming messages: %s", incomingMsgs)
 
+        received = WorldDelta()
         for incomingMsg in incomingMsgs:
             self.add_history('received {} from {}'.format(incomingMsg.msg, incomingMsg.sender), 0)
             
             (loc, new_cost) = incomingMsg.msg
-            if self.mental_world.cost[loc] != new_cost:
-                self.mental_world.cost[loc] = new_cost
+            if received.get(self.mental_world, 'cost', loc) != new_cost:
+                received.set('cost', loc, new_cost)
+        received.apply(self.mental_world)
 
-        self.log.info("Agent {} finished handling incomming communication. New world:\n{}"
-            .format(self.name, print_board_str(self.mental_world)))
+        self.log.info("Agent %s finished handling incomming communication. New world:\n%s",
+            self.name, BoardStr(self.mental_world))
         return True
 
+    # self.planner.plan, within PLAN_TIME for anytime planners
+    def plan_for(self, world, agent_name):
+        if self.PLAN_TIME == None:
+            return self.planner.plan(world, agent_name)
+        return self.planner.plan(world, agent_name, deadline=time.time() + self.PLAN_TIME)
+
+    # First solution of plan_for(world, agent_name), through the plan cache
+    def cached_plan(self, world, agent_name):
+        if not self.CACHE_PLANS:
+            return self.plan_for(world, agent_name)[0]
+        solution = self.plan_cache.get(self.global_step, agent_name, world, self.planner)
+        if solution is None:
+            solution = self.plan_for(world, agent_name)[0]
+            self.plan_cache.put(agent_name, world, solution)
+        return solution
+
     # Returns True if new plan is initated
     def replan(self, stuck, verbose=0):
-        self.log.info("replanning...verbose:{}".format(verbose))
+        self.log.info("replanning...verbose:%s", verbose)
         
         # If the new expected cost is lower, then update plan.
-        temp_mental_world = copy.deepcopy(self.mental_world)
-        temp_mental_world.visited[self.name] = set()
+        temp_mental_world = self.mental_world.copy()
+        temp_mental_world.mutable('visited')[self.name] = set()
         temp_mental_world.verbose = verbose
-        solutions = self.planner.plan(temp_mental_world, self.name)
-        solution = random.choice(solutions)
+        solutions = self.plan_for(temp_mental_world, self.name)
+        solution = get_rng(self.mental_world).choice(solutions)
 
         if solution == False: 
             self.add_history('None', sys.maxint)
@@ -256,11 +348,14 @@ class AgentMind(object):
 
         # Look at potential Plans
         potential_plan_cost = solution.get_cost()
-        self.log.info("Potential plan Cost: {}".format(potential_plan_cost))
+        self.log.info("Potential plan Cost: %s", potential_plan_cost)
         
         # Replace current plan if stuck or new plan is better
-        cur_project_cost = sum(self.mental_world.cost_func(self.mental_world, a) for a in self.actions[self.cur_step:])
-        self.log.info("Projected Current Plan Cost: {}".format(cur_project_cost))
+        if self.solution != None:
+            cur_project_cost = self.solution.get_projected_cost(self.mental_world, self.cur_step)
+        else:
+            cur_project_cost = sum(self.mental_world.cost_func(self.mental_world, a) for a in self.actions[self.cur_step:])
+        self.log.info("Projected Current Plan Cost: %s", cur_project_cost)
         if stuck or (potential_plan_cost < cur_project_cost): #Cost function. assuming cost_action is 1
             self.mental_world = temp_mental_world
             self.set_solution(solution)
@@ -279,7 +374,7 @@ class AgentMind(object):
         # 1. Step and verify
         cur_action = self.get_cur_action()
         
-        self.log.info("STEP: {}".format(cur_action))
+        self.log.info("STEP: %s", cur_action, extra={'event': 'step', 'agent': self.name, 'action': cur_action})
         
         self.mental_world = act(self.mental_world, cur_action)
         assert(self.mental_world != False) 
@@ -315,7 +410,7 @@ class AgentFullComm(AgentMind):
         if len(diffs) == 0 or diffs == None:
             return ([], [])
 
-        self.log.info("Agent {} communicates ... {}".format(self.name, diffs))
+        self.log.info("Agent %s communicates ... %s", self.name, diffs)
         to_return = []
         for receiver_name in self.mental_world.goals.keys():
             if receiver_name != self.name:
@@ -349,7 +444,7 @@ class AgentRandComm(AgentMind):
                 continue
             for diff in diffs:
                 commMsg = CommMessage(self.name, receiver_name, diff)
-                if random.random() < 0.5:
+                if get_rng(self.mental_world).random() < 0.5:
                     to_comm.append(commMsg)
                 else:
                     void_comm.append(commMsg)
@@ -367,19 +462,21 @@ class AgentNoComm(AgentMind):
     # In this Agent Type, we do not communicate.
     def communicate(self, diffs):
         super(AgentNoComm, self).communicate(diffs)
-        self.log.info("Agent {} communicates ... None".format(self.name))
+        self.log.info("Agent %s communicates ... None", self.name)
         return ([], []) # No comm # TODO: the second-return should indicate messages Not sent
    
 
 # Agents with ToM Capabilities
 class AgentToM(AgentMind):
+    PLAN_LIMIT = None # Max plans per teammate model; None keeps every optimal plan
+
     def __init__(self, name, world, args=[]):
         super(AgentToM, self).__init__(name, world)
         self.ToMs = {}
         solutions_by_agent = args[0]
         for a in world.goals.keys():
             if a != self.name:
-                tom = ToM(self.name, a, solutions_by_agent[a], world)
+                tom = ToM(self.name, a, solutions_by_agent[a], world, limit=self.PLAN_LIMIT)
                 self.ToMs[a] = tom
 
     def step(self, real_world, commMsgs=None):
@@ -398,7 +495,7 @@ class AgentSmartComm(AgentMind):
         self.teammates = {}
         for a in world.goals.keys():
             if a != self.name:
-                teammate = AgentMind(a, copy.deepcopy(world))
+                teammate = AgentMind(a, world)
                 teammate.set_solution(solutions_by_agent[a]) # <-- The type of solution is the same as the agent's solution type (PlanTree or Linear)
                 self.teammates[a] = teammate
                 # We want to keep track of each teammate's plan and the relative cost of each plan. 
@@ -412,7 +509,7 @@ class AgentSmartComm(AgentMind):
 
         # For each teammte, compare the expected cost of communicating with not-communicating
         if len(diffs) == 0:
-            self.log.info("Agent {} observed no diff, so have nothing to communicate".format(self.name))
+            self.log.info("Agent %s observed no diff, so have nothing to communicate", self.name)
             return ([], [])
 
         to_comm = []
@@ -420,21 +517,23 @@ class AgentSmartComm(AgentMind):
 
         for (teammate_name, teammate) in self.teammates.items():
             for diff in diffs:            
-                self.log.info("AgentSmartComm.communicate ... Should Agent {} communicate <{}> to teammate: {}?"
-                    .format(self.name, diff, teammate_name))
+                self.log.info("AgentSmartComm.communicate ... Should Agent %s communicate <%s> to teammate: %s?",
+                    self.name, diff, teammate_name)
                 commMsg = CommMessage(self.name, teammate_name, diff)
                 
                 # Assuming that the teammate has already completed the current step
                 # because the message doesn't get delivered until the next timestep.
-                self.log.info("teammate world:\n{}".format(print_board_str(teammate.mental_world)))
+                self.log.info("teammate world:\n%s", BoardStr(teammate.mental_world))
                 
                 # If we communicate
                 cost_comm = self.comm_cost(teammate.simple_copy(), diff)
                 # If we don't communicate
                 cost_no_comm = self.no_comm_cost(teammate.simple_copy(), diff)
                 
-                self.log.warning("Agent {} decided to COMM_{} msg:{} given cost of comm: {} and no-comm: {}..."
-                    .format(self.name, (cost_comm<=cost_no_comm), diff, cost_comm, cost_no_comm))
+                self.log.warning("Agent %s decided to COMM_%s msg:%s given cost of comm: %s and no-comm: %s...",
+                    self.name, (cost_comm<=cost_no_comm), diff, cost_comm, cost_no_comm,
+                    extra={'event': 'comm_decision', 'agent': self.name, 'teammate': teammate_name, 'diff': diff,
+                        'communicate': cost_comm <= cost_no_comm, 'cost_comm': cost_comm, 'cost_no_comm': cost_no_comm})
 
                 if cost_comm <= cost_no_comm:
                     to_comm.append(commMsg)
@@ -447,7 +546,7 @@ class AgentSmartComm(AgentMind):
 
 
     def comm_cost(self, other, diff):
-        self.log.info("Evaluating the cost IF we were to communicate {} to {}".format(diff, other))
+        self.log.info("Evaluating the cost IF we were to communicate %s to %s", diff, other)
         to_return = self.mental_world.COST_OF_COMM # Cost of comm
 
         # By the time other receives message
@@ -460,33 +559,32 @@ class AgentSmartComm(AgentMind):
         # Pretend to send message and update teammate's world
         other.incoming_comm([CommMessage(self.name, other.name, diff)], sim=True)
 
-        self.log.info("in COMM_COST: Other agent's ({}) mental world: \n{}".format(other.name, print_board_str(other.mental_world)))
+        self.log.info("in COMM_COST: Other agent's (%s) mental world: \n%s", other.name, BoardStr(other.mental_world))
         
         # Pretend to re-plan with new info # no need to check for re-plan
         new_cost_to_finish, sol = self.EX_COST(other.mental_world, other, self.mental_world)
-        self.log.info("The expected cost for agent {} to accomplish {} is: {} with plan:\n{}"
-            .format(other.name, other.goal, new_cost_to_finish, sol.get_actions()))
+        self.log.info("The expected cost for agent %s to accomplish %s is: %s with plan:\n%s",
+            other.name, other.goal, new_cost_to_finish, sol.get_actions())
 
         to_return += new_cost_to_finish
-        self.log.info("Agent {}: The cost of communicating is {} + {} = {}"
-            .format(self.name, self.mental_world.COST_OF_COMM, new_cost_to_finish, to_return))
+        self.log.info("Agent %s: The cost of communicating is %s + %s = %s",
+            self.name, self.mental_world.COST_OF_COMM, new_cost_to_finish, to_return)
         return to_return
 
 
     def no_comm_cost(self, other, diff):
 
-        self.log.info("Agent {} is simulating agent {}'s world \n{}\n\
+        self.log.info("Agent %s is simulating agent %s's world \n%s\n\
             ...for no-comm,\n\
-            ...regarding on diffs: {}\n\
-            ... with actions: {}"
-            .format(self.name, other.name, print_board_str(other.mental_world),
-                diff, other.get_rest_actions()))
+            ...regarding on diffs: %s\n\
+            ... with actions: %s", self.name, other.name, BoardStr(other.mental_world),
+                diff, other.get_rest_actions())
 
         # projected_other_world = act(copy.deepcopy(self.mental_world), other.actions[self.cur_step])
-        # self.log.info("Other agent's mental world: \n{}".format(print_board_str(projected_other_world)))
+        # self.log.info("Other agent's mental world: \n%s", BoardStr(projected_other_world))
         
         # (simulated, world, cost) = self.simulate(other.name, projected_other_world, other.actions[self.cur_step+1:])
-        # self.log.info("... result -- Simulated: {} with actions: {}; Cost: {}".format(simulated, other.actions[self.cur_step+1:], cost))
+        # self.log.info("... result -- Simulated: %s with actions: %s; Cost: %s", simulated, other.actions[self.cur_step+1:], cost)
 
         # By the time other receives message
         if other.is_done():
@@ -498,8 +596,9 @@ class AgentSmartComm(AgentMind):
         # Simulation? What is the expected cost of original plan relative to new world
         other.incoming_comm([CommMessage(self.name, other.name, diff)], sim=True)
 
-        self.log.info("in NO_COMM_COST: Other agent's ({}) mental world: \n{}".format(other.name, print_board_str(other.mental_world)))
-        self.log.info("... Other agent's State.visited: {}".format(other.mental_world.visited))
+        self.log.info("in NO_COMM_COST: Other agent's (%s) mental world: \n%s",
+            other.name, BoardStr(other.mental_world))
+        self.log.info("... Other agent's State.visited: %s", other.mental_world.visited)
 
         # if simulated is True, then the cost of the cost for the rest of the plan
         # if isinstance(self.solution, SolutionTree):
@@ -507,9 +606,10 @@ class AgentSmartComm(AgentMind):
         #     cost = other.solution.get_exp_cost(self.mental_world)
         #     return cost
 
-        (simulated, world, cost) = self.simulate(other.name, copy.deepcopy(other.mental_world), other.get_rest_actions())
+        (simulated, world, cost) = self.simulate(other.name, other.mental_world, other.get_rest_actions())
 
-        self.log.info("... result -- Simulated: {} with actions: {}; Cost: {}".format(simulated, other.get_rest_actions(), cost))
+        self.log.info("... result -- Simulated: %s with actions: %s; Cost: %s",
+            simulated, other.get_rest_actions(), cost)
 
         if simulated:
             return cost
@@ -519,8 +619,8 @@ class AgentSmartComm(AgentMind):
             replan_cost = self.mental_world.COST_REPLAN
             newplan_cost = self.EX_COST(world, other, self.mental_world)[0]
             total_cost = cost + replan_cost + newplan_cost
-            self.log.info("\n\tlost-cost: {} + replan-cost: {} + newplan-cost: {} = {}"
-                .format(cost, replan_cost, newplan_cost, total_cost))
+            self.log.info("\n\tlost-cost: %s + replan-cost: %s + newplan-cost: %s = %s",
+                cost, replan_cost, newplan_cost, total_cost)
             return total_cost
 
 
@@ -542,20 +642,22 @@ class AgentSmartComm(AgentMind):
         (where agent1.agent2 means agent1's belief of agent2's world)
     """
     def EX_COST(self, agent_world, agent, rel_world):
-        world = copy.deepcopy(agent_world)
-        agent.log.info("AgentSmartComm.EX_COST: computing expected cost of agent {} with goal {} in world \n{}".format(agent.name, agent.goal, print_board_str(world)))
-        self.log.info("AgentSmartComm.EX_COST: computing expected cost of agent {} with goal {} in world \n{}".format(agent.name, agent.goal, print_board_str(world)))
+        world = agent_world.copy()
+        agent.log.info("AgentSmartComm.EX_COST: computing expected cost of agent %s with goal %s in world \n%s",
+            agent.name, agent.goal, BoardStr(world))
+        self.log.info("AgentSmartComm.EX_COST: computing expected cost of agent %s with goal %s in world \n%s",
+            agent.name, agent.goal, BoardStr(world))
 
         # Construct plan using agent_world
-        world.visited[agent.name] = set()
-        sol = self.planner.plan(world, agent.name)[0]
+        world.mutable('visited')[agent.name] = set()
+        sol = self.cached_plan(world, agent.name)
         if sol == False:
             return (sys.maxint, 'None')
         
         # Compute Cost using relative world
         total_cost = sol.get_exp_cost(rel_world)
-        agent.log.info("AgentSmartComm.EX_COST: expected cost cost is {} for actions {}".format(total_cost, sol.get_actions()))
-        self.log.info("AgentSmartComm.EX_COST: expected cost cost is {} for actions {}".format(total_cost, sol.get_actions()))
+        agent.log.info("AgentSmartComm.EX_COST: expected cost cost is %s for actions %s", total_cost, sol.get_actions())
+        self.log.info("AgentSmartComm.EX_COST: expected cost cost is %s for actions %s", total_cost, sol.get_actions())
         return (total_cost, sol)
 
 
@@ -572,8 +674,8 @@ class AgentSmartComm(AgentMind):
                 teammate.cur_step += 1
                 if teammate.cur_step >= len(teammate.actions):
                     teammate.done = True
-        self.log.info("GlobalTime: {} Agent: {} Action: {}".format(self.global_step, self.name, hist))
-        # self.log.info("GlobalTime: {} Agent: {} Action: {}".format(self.global_step, t_name, teammate_action))
+        self.log.info("GlobalTime: %s Agent: %s Action: %s", self.global_step, self.name, hist)
+        # self.log.info("GlobalTime: %s Agent: %s Action: %s", self.global_step, t_name, teammate_action)
         return hist
 
 
@@ -591,7 +693,7 @@ class AgentSmartCommII(AgentSmartComm):
         hist = super(AgentSmartCommII, self).step(real_world)
 
         # Given the messages to be communicated, we update our belief of teammate's plan.
-        self.log.info("Gven the messages to be communicated: \n\t{}\nWe update our belief of teammates plan.".format(commMsgs))
+        self.log.info("Gven the messages to be communicated: \n\t%s\nWe update our belief of teammates plan.", commMsgs)
         for commMsg in commMsgs:
             # Update teammate's World
             teammate = self.teammates[commMsg.receiver]
@@ -599,12 +701,12 @@ class AgentSmartCommII(AgentSmartComm):
                 continue
             (loc, new_cost) = commMsg.msg
             if teammate.mental_world.cost[loc] != new_cost:
-                teammate.mental_world.cost[loc] = new_cost
+                WorldDelta().set('cost', loc, new_cost).apply(teammate.mental_world)
 
-            # update teammate's Plan, potentially
-            (new_cost, solution) = self.EX_COST(copy.deepcopy(teammate.mental_world), teammate, teammate.mental_world)
+            # update teammate's Plan, potentially (EX_COST plans on its own copy of the world)
+            (new_cost, solution) = self.EX_COST(teammate.mental_world, teammate, teammate.mental_world)
             teammate.set_solution(solution) # Setting cur_step = 0
-            self.log.info("\n\n Updated teammate {}'s solution. New solution: \n\t{}".format(teammate.name, solution))
+            self.log.info("\n\n Updated teammate %s's solution. New solution: \n\t%s", teammate.name, solution)
 
         return hist
 
@@ -627,7 +729,7 @@ class AgentSmartEstimate(AgentToM):
 
         # For each teammte, compare the expected cost of communicating with not-communicating
         if len(diffs) == 0:
-            self.log.info("Agent {} observed no diff, so have nothing to communicate".format(self.name))
+            self.log.info("Agent %s observed no diff, so have nothing to communicate", self.name)
             return ([], [])
 
         to_comm = []
@@ -636,8 +738,8 @@ class AgentSmartEstimate(AgentToM):
         # For each teammate
         for (teammate_name, other_ToM) in self.ToMs.items():
             for diff in diffs:
-                self.log.info("AgentSmartEstimate.communicate ... Should Agent {} communicate <{}> to teammate: {}?"
-                    .format(self.name, diff, teammate_name))
+                self.log.info("AgentSmartEstimate.communicate ... Should Agent %s communicate <%s> to teammate: %s?",
+                    self.name, diff, teammate_name)
 
                 commMsg = CommMessage(self.name, teammate_name, diff)                
                 cost_comm = 0
@@ -647,13 +749,15 @@ class AgentSmartEstimate(AgentToM):
                 for (plan, teammate) in other_ToM.get_agent_minds().items():
                     # Assuming that the teammate has already completed the current step
                     # because the message doesn't get delivered until the next timestep.
-                    self.log.info("teammate world:\n{}".format(print_board_str(teammate.mental_world)))
+                    self.log.info("teammate world:\n%s", BoardStr(teammate.mental_world))
                     
                     cost_comm += self.comm_cost(teammate.simple_copy(), diff) * plan.likelihood
                     cost_no_comm += self.no_comm_cost(teammate.simple_copy(), diff) * plan.likelihood
                 
-                self.log.warning("Agent {} decided to COMM_{} msg:{} given cost of comm: {} and no-comm: {}..."
-                    .format(self.name, (cost_comm<=cost_no_comm), diff, cost_comm, cost_no_comm))
+                self.log.warning("Agent %s decided to COMM_%s msg:%s given cost of comm: %s and no-comm: %s...",
+                    self.name, (cost_comm<=cost_no_comm), diff, cost_comm, cost_no_comm,
+                    extra={'event': 'comm_decision', 'agent': self.name, 'teammate': teammate_name, 'diff': diff,
+                        'communicate': cost_comm <= cost_no_comm, 'cost_comm': cost_comm, 'cost_no_comm': cost_no_comm})
 
                 if cost_comm <= cost_no_comm:
                     to_comm.append(commMsg)
@@ -676,7 +780,7 @@ class AgentSmartEstimate(AgentToM):
         # TODO: This means that communication should also include "FROM" in addition to "TO"
 
     def comm_cost(self, other, diff):
-        self.log.info("Evaluating the cost IF we were to communicate {} to {}".format(diff, other))
+        self.log.info("Evaluating the cost IF we were to communicate %s to %s", diff, other)
         to_return = self.mental_world.COST_OF_COMM # Cost of comm
 
         # By the time other receives message
@@ -689,27 +793,26 @@ class AgentSmartEstimate(AgentToM):
         # Pretend to send message and update teammate's world
         other.incoming_comm([CommMessage(self.name, other.name, diff)], sim=True)
 
-        self.log.info("in COMM_COST: Other agent's ({}) mental world: \n{}".format(other.name, print_board_str(other.mental_world)))
+        self.log.info("in COMM_COST: Other agent's (%s) mental world: \n%s", other.name, BoardStr(other.mental_world))
         
         # Pretend to re-plan with new info
         new_cost_to_finish, sol = self.EX_COST(other.mental_world, other, self.mental_world)
-        self.log.info("The expected cost for agent {} to accomplish {} is: {} with plan:\n{}"
-            .format(other.name, other.goal, new_cost_to_finish, sol.get_actions()))
+        self.log.info("The expected cost for agent %s to accomplish %s is: %s with plan:\n%s",
+            other.name, other.goal, new_cost_to_finish, sol.get_actions())
 
         to_return += new_cost_to_finish
-        self.log.info("Agent {}: The cost of communicating is {} + {} = {}"
-            .format(self.name, self.mental_world.COST_OF_COMM, new_cost_to_finish, to_return))
+        self.log.info("Agent %s: The cost of communicating is %s + %s = %s",
+            self.name, self.mental_world.COST_OF_COMM, new_cost_to_finish, to_return)
         return to_return
 
 
     def no_comm_cost(self, other, diff):
 
-        self.log.info("Agent {} is simulating agent {}'s world \n{}\n\
+        self.log.info("Agent %s is simulating agent %s's world \n%s\n\
             ...for no-comm,\n\
-            ...regarding on diffs: {}\n\
-            ... with actions: {}"
-            .format(self.name, other.name, print_board_str(other.mental_world),
-                diff, other.get_rest_actions()))
+            ...regarding on diffs: %s\n\
+            ... with actions: %s", self.name, other.name, BoardStr(other.mental_world),
+                diff, other.get_rest_actions())
 
         # By the time other receives message
         if other.is_done():
@@ -721,13 +824,15 @@ class AgentSmartEstimate(AgentToM):
         # Simulation? What is the expected cost of original plan relative to new world
         other.incoming_comm([CommMessage(self.name, other.name, diff)], sim=True)
 
-        self.log.info("in NO_COMM_COST: Other agent's ({}) mental world: \n{}".format(other.name, print_board_str(other.mental_world)))
-        self.log.info("... Other agent's State.visited: {}".format(other.mental_world.visited))
+        self.log.info("in NO_COMM_COST: Other agent's (%s) mental world: \n%s",
+            other.name, BoardStr(other.mental_world))
+        self.log.info("... Other agent's State.visited: %s", other.mental_world.visited)
         
         costs = 0
-        (simulated, world, cost) = self.simulate(other.name, copy.deepcopy(other.mental_world), other.get_rest_actions())
+        (simulated, world, cost) = self.simulate(other.name, other.mental_world, other.get_rest_actions())
         costs += cost
-        self.log.info("... result -- Simulated: {} with actions: {}; Cost: {}".format(simulated, other.get_rest_actions(), cost))
+        self.log.info("... result -- Simulated: %s with actions: %s; Cost: %s",
+            simulated, other.get_rest_actions(), cost)
 
 
         if simulated:
@@ -739,8 +844,8 @@ class AgentSmartEstimate(AgentToM):
             replan_cost = self.mental_world.COST_REPLAN
             newplan_cost = self.EX_COST(world, other, self.mental_world)[0]
             total_cost = cost + replan_cost + newplan_cost
-            self.log.info("\n\tlost-cost: {} + replan-cost: {} + newplan-cost: {} = {}"
-                .format(cost, replan_cost, newplan_cost, total_cost))
+            self.log.info("\n\tlost-cost: %s + replan-cost: %s + newplan-cost: %s = %s",
+                cost, replan_cost, newplan_cost, total_cost)
             return total_cost
     
     """
@@ -751,19 +856,21 @@ class AgentSmartEstimate(AgentToM):
         (where agent1.agent2 means agent1's belief of agent2's world)
     """
     def EX_COST(self, agent_world, agent, rel_world):
-        agent.log.info("AgentSmartEstimate.EX_COST: computing expected cost of agent {} with goal {} in world \n{}".format(agent.name, agent.goal, print_board_str(agent_world)))
-        self.log.info("AgentSmartEstimate.EX_COST: computing expected cost of agent {} with goal {} in world \n{}".format(agent.name, agent.goal, print_board_str(agent_world)))
-        world = copy.deepcopy(agent_world)
+        agent.log.info("AgentSmartEstimate.EX_COST: computing expected cost of agent %s with goal %s in world \n%s",
+            agent.name, agent.goal, BoardStr(agent_world))
+        self.log.info("AgentSmartEstimate.EX_COST: computing expected cost of agent %s with goal %s in world \n%s",
+            agent.name, agent.goal, BoardStr(agent_world))
+        world = agent_world.copy()
 
         # Construct plan using agent_world
-        world.visited[agent.name] = set()
-        sol = self.planner.plan(world, agent.name)[0]
+        world.mutable('visited')[agent.name] = set()
+        sol = self.cached_plan(world, agent.name)
         if sol == False:
             return (sys.maxint, 'None')
         cost = sol.get_exp_cost(rel_world)
 
-        # agent.log.info("AgentSmartComm.EX_COST: expected cost cost is {} for actions {}".format(total_cost, sol.get_actions()))
-        # self.log.info("AgentSmartComm.EX_COST: expected cost cost is {} for actions {}".format(total_cost, sol.get_actions()))
+        # agent.log.info("AgentSmartComm.EX_COST: expected cost cost is %s for actions %s", total_cost, sol.get_actions())
+        # self.log.info("AgentSmartComm.EX_COST: expected cost cost is %s for actions %s", total_cost, sol.get_actions())
         return (cost, sol)
 
 
@@ -777,18 +884,19 @@ class AgentSmartEstimateII(AgentSmartEstimate):
         hist = super(AgentSmartEstimateII, self).step(real_world)
 
         # Given the messages to be communicated, we update our belief of teammate's plan.
-        self.log.info("Gven the messages to be communicated: \n\t{}\nWe update our belief of teammates plan.".format(commMsgs))
+        self.log.info("Gven the messages to be communicated: \n\t%s\nWe update our belief of teammates plan.", commMsgs)
         for commMsg in commMsgs:
             # Update teammate's World
             teammate_ToM = self.ToMs[commMsg.receiver]
             (loc, new_cost) = commMsg.msg
+            told = WorldDelta().set('cost', loc, new_cost) # Patched into the world of every plan
             
             for (plan, teammate) in teammate_ToM.get_agent_minds().items():
-                teammate.mental_world.cost[loc] = new_cost
+                told.apply(teammate.mental_world)
 
 
                 # update teammate's Plan, potentially
-                (replan_cost, solution) = self.EX_COST(copy.deepcopy(teammate.mental_world), teammate, teammate.mental_world)
+                (replan_cost, solution) = self.EX_COST(teammate.mental_world, teammate, teammate.mental_world)
                 if (replan_cost < plan.get_projected_cost(teammate.mental_world)):
                     # Update
                     # print("Update teammate ToM Model({}-->{})".format(self.name, teammate.name))
@@ -836,7 +944,7 @@ class AgentSmartBPR(AgentSmartEstimate):
                 denum = sum([p.likelihood for p in sender_ToM.get_plans()])
                 for plan in sender_ToM.get_plans():
                     if plan.likelihood == 0:
-                        del sender_ToM.agent_minds[plan]
+                        sender_ToM.remove_plan(plan)
                     else:
                         plan.set_likelihood(plan.likelihood/denum)
 
@@ -846,10 +954,11 @@ class AgentSmartBPR(AgentSmartEstimate):
                 # Take 1 step back
                 sender_ToM.step_back()
                 # Then apply observation to this mental model (Replan on sender)
+                told = WorldDelta().set('cost', loc, new_cost)
                 for (plan, sender) in sender_ToM.get_agent_minds().items():
-                    sender.mental_world.cost[loc] = new_cost
+                    told.apply(sender.mental_world)
                     # update teammate's Plan, potentially
-                    (replan_cost, solution) = self.EX_COST(copy.deepcopy(sender.mental_world), sender, sender.mental_world)
+                    (replan_cost, solution) = self.EX_COST(sender.mental_world, sender, sender.mental_world)
                     if (replan_cost < plan.get_projected_cost(sender.mental_world)):
                         # Update
                         sender_ToM.update_plan_dist(plan, solution)
@@ -866,18 +975,19 @@ class AgentSmartBPRII(AgentSmartBPR):
         hist = super(AgentSmartBPRII, self).step(real_world)
 
         # Given the messages to be communicated, we update our belief of teammate's plan.
-        self.log.info("Gven the messages to be communicated: \n\t{}\nWe update our belief of teammates plan.".format(commMsgs))
+        self.log.info("Gven the messages to be communicated: \n\t%s\nWe update our belief of teammates plan.", commMsgs)
         for commMsg in commMsgs:
             # Update teammate's World
             teammate_ToM = self.ToMs[commMsg.receiver]
             (loc, new_cost) = commMsg.msg
+            told = WorldDelta().set('cost', loc, new_cost) # Patched into the world of every plan
             
             for (plan, teammate) in teammate_ToM.get_agent_minds().items():
-                teammate.mental_world.cost[loc] = new_cost
+                told.apply(teammate.mental_world)
 
 
                 # update teammate's Plan, potentially
-                (replan_cost, solution) = self.EX_COST(copy.deepcopy(teammate.mental_world), teammate, teammate.mental_world)
+                (replan_cost, solution) = self.EX_COST(teammate.mental_world, teammate, teammate.mental_world)
                 if (replan_cost < plan.get_projected_cost(teammate.mental_world)):
                     # Update
                     # print("Update teammate ToM Model({}-->{})".format(self.name, teammate.name))
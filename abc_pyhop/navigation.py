@@ -6,9 +6,14 @@ The navigation function replaces the navigation-method in the rovers-world defin
 It returns a sequence of primitive actions. 
 """
 from __future__ import print_function
-import pprint, pyhop, random, math, heapq, time
+import pprint, pyhop, random, math, heapq, time, array, copy
 import random_rovers_world
 
+"""
+The open set is a heap with lazy deletion: improving a node's g-score pushes a new
+entry, and entries that no longer match the node's best f-score are skipped when popped.
+Ties on f are broken by location, or at random (from the state's generator) when SAMPLE is set.
+"""
 def a_star(state, agent, sink, SAMPLE=False):
 	VERBOSE = False
 
@@ -17,56 +22,30 @@ def a_star(state, agent, sink, SAMPLE=False):
 		print('*** A* from {} to {} ***'.format(source, sink))
 		start = time.time()
 
+	rng = pyhop.get_rng(state) if SAMPLE else None
 	closed_set = set() # Set of nodes that have already been evaluated
-	openset = [] # Set of tentative nodes to be evaluated. Initially containing the start node
+	openset = [] # Heap of (f_score, tie_break, location). Initially containing the start node
 	came_from = {} # Keep track of parents for path-reconstruction
 
 	g_score = {} # Cost from start along best known path
 	g_score[source] = 0
 	# Estimated total cost from start to goal through y
 	f_score = {}
-	new_f_score = g_score[source] + heuristic(state, source, sink)
-	f_score[source] = new_f_score
-	heapq.heappush(openset, (new_f_score, source))
-	
-	# Inverse mapping: maps f_score to an array of locations (Should always contain the same items as openset)
-	inverse_f_scores = {}
-	inverse_f_scores[new_f_score] = [source]
-
+	f_score[source] = g_score[source] + heuristic(state, source, sink)
+	heapq.heappush(openset, (f_score[source], tie_break(source, rng), source))
 
+	stats = pyhop.STATS
 	NUM_ITER = 0
 	while len(openset) != 0:
+		if stats.enabled: stats.saw_nav_openset(len(openset))
+		(cur_f_score, _, current) = heapq.heappop(openset) # Want the node in openset with lowest f-score
+		if current in closed_set or cur_f_score != f_score[current]:
+			continue # Stale entry
 		NUM_ITER += 1
-		
-		# Instead of popping the first one, we first pop to get the min f-score
-		# Then we find all nodes with min f-score
-		# Then we remove a random one
-		(cur_f_score, current) = heapq.heappop(openset) # Want the node in openset with lowest f-score
+		if stats.enabled: stats.nav_expansions += 1
 		if VERBOSE:
 			print ('iteration', NUM_ITER)
 			print ('\tcurrently picked: ', (cur_f_score, current))
-			print ('\topenset: ', openset)
-			print ('\tinverse_f_scores:', inverse_f_scores) 
-
-		if SAMPLE and len(inverse_f_scores[cur_f_score]) > 1 :
-			if VERBOSE:
-				print ('*** Has multiple locations with the same f-score')
-			# If there are multiple values in the openset with the same min score
-			heapq.heappush(openset, (cur_f_score, current)) # First put it back
-			if VERBOSE: print ('put back... openset', openset)
-
-			to_pop_loc = random.choice(inverse_f_scores[cur_f_score]) # pick a random location
-			if VERBOSE: print ('randomly picked location... ', to_pop_loc)
-
-			inverse_f_scores[cur_f_score].remove(to_pop_loc) # remove from inverse_f_socre
-			openset.remove((cur_f_score, to_pop_loc)) # Remove from heap
-			heapq.heapify(openset)
-			
-			current = to_pop_loc
-		else:
-			inverse_f_scores[cur_f_score].remove(current)
-
-		
 
 		if current == sink:
 			return to_actions(reconstruct_path(came_from, sink), agent)
@@ -78,27 +57,173 @@ def a_star(state, agent, sink, SAMPLE=False):
 			task = ('navigate_op', agent, current, neighbor)
 			tentative_g_score = g_score[current] + state.cost_func(state, task) + 1
 
-			if (not (neighbor in openset)) or tentative_g_score < g_score[neighbor]:
+			if (neighbor not in g_score) or tentative_g_score < g_score[neighbor]:
 				came_from[neighbor] = current
 				g_score[neighbor] = tentative_g_score
-				new_f_score = g_score[neighbor] + heuristic(state, neighbor, sink)
-				f_score[neighbor] = new_f_score
-
-				# Add to inverse_f_scores
-				if new_f_score in inverse_f_scores.keys():
-					if neighbor not in inverse_f_scores[new_f_score]:
-						inverse_f_scores[new_f_score].append(neighbor)
-				else: 
-					inverse_f_scores[new_f_score] = [neighbor]
-
-				if (not((f_score[neighbor], neighbor) in openset)):
-					heapq.heappush(openset, (f_score[neighbor], neighbor))
+				f_score[neighbor] = tentative_g_score + heuristic(state, neighbor, sink)
+				heapq.heappush(openset, (f_score[neighbor], tie_break(neighbor, rng), neighbor))
 
 	if VERBOSE: 
 		print('no path found')
 
 	return False
 
+# Secondary heap key: the location itself, or a random key to pick uniformly among equal f-scores
+def tie_break(loc, rng):
+	if rng != None:
+		return rng.random()
+	return loc
+
+"""
+Distance oracle. A DistanceTree holds every cell's shortest distance to one sink, found
+by searching backwards from the sink, so any agent's path to that sink is read off in
+O(path length). Trees are memoized on the state's cost table, so every state sharing the
+table shares them. When cells are written through State.set_item (the uncertainty
+function, observations, communication) the next query does not search again: it repairs
+the tree of the previous table, LPA*/D* Lite style, starting from the written cells
+(State.previous_changes) and touching only the cells whose distance changed. The
+previous tree stays with the states still on the old table, so the repaired tree takes
+its own copy of the dist and next_loc arrays (a C-level copy); any other write to the
+table builds a new tree. This relies on a move's cost depending only on the cost table.
+Moves are charged as a_star charges them, cost plus step; with step=0 the distances are
+pure plan costs, a lower bound on the cost of any path a_star can return.
+"""
+INF = float('inf')
+
+class DistanceTree(object):
+
+	def __init__(self, state, sink, step=1):
+		self.sink = sink
+		self.step = step
+		self.dist = array.array('d', [INF] * (state.grid.num_cells + 1))
+		self.next_loc = array.array('i', [0] * (state.grid.num_cells + 1)) # Next step towards sink
+		self.dist[sink] = 0
+		# Dijkstra from the sink, walking the moves backwards
+		openset = [(0, sink)]
+		while len(openset) != 0:
+			(cur_dist, current) = heapq.heappop(openset)
+			if cur_dist != self.dist[current]:
+				continue # Stale entry
+			for neighbor in get_neighbors(state, current):
+				tentative_dist = self.through(state, neighbor, current)
+				if tentative_dist < self.dist[neighbor]:
+					self.dist[neighbor] = tentative_dist
+					self.next_loc[neighbor] = current
+					heapq.heappush(openset, (tentative_dist, neighbor))
+
+	# Trees are never changed once built (see repaired), so deep copies of a state share them
+	def __deepcopy__(self, memo):
+		return self
+
+	# Distance from loc to the sink when moving to neighbor first
+	def through(self, state, loc, neighbor):
+		return self.dist[neighbor] + state.cost_func(state, ('navigate_op', None, loc, neighbor)) + self.step
+
+	# A copy of this tree, repaired for state's cost table, which differs in the cells changed.
+	# Only for step > 0 (see repair); step=0 trees are rebuilt.
+	def repaired(self, state, changed):
+		assert self.step > 0, "DistanceTree.repaired needs moves that cost more than 0"
+		tree = copy.copy(self)
+		tree.dist = self.dist[:]
+		tree.next_loc = self.next_loc[:]
+		tree.repair(state, changed)
+		return tree
+
+	"""
+	Every cell keeps a lookahead (rhs): its best distance through a neighbor, with
+	next_loc pointing at that neighbor. Only the neighbors of changed cells start out
+	inconsistent (rhs != dist). These are settled in order of min(dist, rhs). A cell
+	whose rhs dropped takes it and offers it to its neighbors. A cell whose rhs rose is
+	reset to INF and queued again, and neighbors that went through it recompute their rhs.
+	This is only correct when every move costs more than 0 (cell costs >= 0 and step > 0).
+	With free moves a raised cell can be settled again through cells that still route
+	through it, which leaves stale distances and next_loc cycles.
+	"""
+	def repair(self, state, changed):
+		dist = self.dist
+		next_loc = self.next_loc
+		rhs = {} # Lookaheads that differ from dist
+		openset = [] # Heap of (min(dist, rhs), location)
+
+		def recompute(loc):
+			best = INF
+			for neighbor in get_neighbors(state, loc):
+				alt = self.through(state, loc, neighbor)
+				if alt < best:
+					(best, next_loc[loc]) = (alt, neighbor)
+			rhs[loc] = best
+
+		def queue(loc):
+			if rhs[loc] != dist[loc]:
+				heapq.heappush(openset, (min(rhs[loc], dist[loc]), loc))
+
+		# Moving into a changed cell costs something else now
+		for loc in changed:
+			for neighbor in get_neighbors(state, loc):
+				if neighbor != self.sink:
+					recompute(neighbor)
+					queue(neighbor)
+
+		while len(openset) != 0:
+			(key, current) = heapq.heappop(openset)
+			lookahead = rhs.get(current, dist[current])
+			if lookahead == dist[current] or key != min(lookahead, dist[current]):
+				continue # Consistent, or a stale entry
+			if lookahead < dist[current]:
+				dist[current] = lookahead
+				for neighbor in get_neighbors(state, current):
+					if neighbor != self.sink:
+						alt = self.through(state, neighbor, current)
+						if alt < rhs.get(neighbor, dist[neighbor]):
+							rhs[neighbor] = alt
+							next_loc[neighbor] = current
+							queue(neighbor)
+			else:
+				dist[current] = INF
+				for loc in get_neighbors(state, current) + (current,):
+					if loc != self.sink and (loc == current or next_loc[loc] == current):
+						recompute(loc)
+						queue(loc)
+
+	# Cheapest path from source to the sink
+	def path(self, source):
+		if self.dist[source] == INF:
+			return False
+		path = [source]
+		while path[-1] != self.sink:
+			path.append(self.next_loc[path[-1]])
+		return path
+
+def distance_tree(state, sink, step=1):
+	key = ('distance_tree', sink, step)
+	memo = state.memo('cost')
+	tree = memo.get(key)
+	if tree == None:
+		previous = state.previous_memo('cost')
+		changed = state.previous_changes('cost')
+		# Repairs need moves that cost more than 0; with step=0 a free cell makes a free move
+		if previous != None and key in previous and changed != None and step > 0:
+			tree = previous[key].repaired(state, changed)
+		else:
+			tree = DistanceTree(state, sink, step)
+		memo[key] = tree
+	return tree
+
+# Cost of the cheapest path from source to sink, as a_star would charge it
+def distance(state, source, sink):
+	return distance_tree(state, sink).dist[source]
+
+# Lower bound on the plan cost of navigating from source to sink, for pyhop.declare_estimate
+def cost_lower_bound(state, source, sink):
+	return distance_tree(state, sink, step=0).dist[source]
+
+# Drop-in replacement for a_star
+def oracle_path(state, agent, sink):
+	path = distance_tree(state, sink).path(state.at[agent])
+	if path == False:
+		return False
+	return to_actions(path, agent)
+
 def to_actions(path, agent):
 	to_return = []
 	for i in range(len(path)-1):
@@ -106,31 +231,11 @@ def to_actions(path, agent):
 	return to_return
 
 def get_neighbors(state, current):
-	neighbors = []
-	(cur_x, cur_y) = state.loc[current]
-	# Neighbor above
-	# if cur_x != 0 and state.loc_available[current-state.prop['num_col']]:
-	if cur_x != 0:
-		neighbors.append(current-state.prop['num_col'])
-	# Neighbor below
-	# if cur_x != state.prop['num_row'] - 1 and state.loc_available[current+state.prop['num_col']]:
-	if cur_x != state.prop['num_row'] - 1:
-		neighbors.append(current + state.prop['num_col'])
-	# Neighbor Left
-	# if cur_y != 0 and state.loc_available[current-1]:
-	if cur_y != 0:
-		neighbors.append(current-1)
-	# Neighbor Right
-	# if cur_y != state.prop['num_col']-1 and state.loc_available[current+1]:
-	if cur_y != state.prop['num_col']-1:
-		neighbors.append(current+1)
-	return neighbors
+	# Above, below, left, right; see random_rovers_world.Grid
+	return state.grid.neighbors[current]
 
 def heuristic(state, source, sink):
-	(source_x, source_y) = state.loc[source]
-	(sink_x, sink_y) = state.loc[sink]
-
-	return abs((source_x - sink_x)) + abs((source_y - sink_y)) + state.cost[source] + state.cost[sink]
+	return state.grid.manhattan_to(sink)[source] + state.cost[source] + state.cost[sink]
 
 def reconstruct_path(came_from, current):
 	to_return = [current]
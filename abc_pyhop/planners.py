@@ -14,9 +14,105 @@ class Planner():
 	def __init__(self):
 		self.planner = None
 		self.name = None
+		self.plan_library = None # Only set for planners that memoize subplans
+		self.anytime = False # Set for planners that take a budget (the seek_bb planners)
+		self.searches = {} # agent: (problem fingerprint, copy of the problem, unfinished pyhop.BBSearch)
 
-	def plan(self, problem, agent):
-		return self.planner(problem, agent)
+	# rng (a pyhop.RNG) seeds every random choice made while planning on problem and its copies;
+	# a given pyhop.PlanStats collects the counters of this call.
+	# deadline (a time.time() value) and max_expansions bound the search of anytime planners,
+	# which then return the best plans found so far; other planners ignore them.
+	def plan(self, problem, agent, rng=None, stats=None, deadline=None, max_expansions=None):
+		if rng != None:
+			pyhop.set_rng(problem, rng)
+		budget = {}
+		if self.anytime and (deadline != None or max_expansions != None):
+			budget = {'deadline': deadline, 'max_expansions': max_expansions}
+		if stats == None:
+			return self.planner(problem, agent, **budget)
+		with pyhop.collect_stats(stats):
+			return self.planner(problem, agent, **budget)
+
+	# Returns (solutions, pyhop.PlanStats of the call)
+	def plan_with_stats(self, problem, agent, rng=None):
+		stats = pyhop.PlanStats()
+		solutions = self.plan(problem, agent, rng, stats)
+		return (solutions, stats)
+
+	"""
+	plan() for each of worlds, e.g. the hypothetical mental worlds of a communication
+	decision, which differ from each other in a few cells' cost. A world is only planned
+	if no world planned before it in the batch has solutions it can reuse (see
+	reuse_solutions); reused solutions share the planned tree. Returns one list of
+	solutions per world, in order.
+	"""
+	def plan_batch(self, worlds, agent, rng=None, stats=None):
+		planned = [] # (world, solutions) of the worlds actually planned
+		to_return = []
+		for world in worlds:
+			solutions = None
+			for (base, base_solutions) in planned:
+				solutions = Planner.reuse_solutions(base, base_solutions, world)
+				if solutions != None:
+					break
+			if solutions == None:
+				solutions = self.plan(world, agent, rng, stats)
+				planned.append((world, solutions))
+			to_return.append(solutions)
+		return to_return
+
+	"""
+	The solutions planned in base, for world; None unless world is base with some cells made
+	costlier that no optimal plan of the solutions enters. Every optimal plan then costs what
+	it did, and no other plan got cheaper, so planning again would find the same costs.
+	"""
+	@staticmethod
+	def reuse_solutions(base, solutions, world):
+		changed_attrs = base.changed_attrs(world)
+		if len(changed_attrs) == 0:
+			return solutions
+		if changed_attrs != set(['cost']):
+			return None
+		changed = [loc for loc in range(len(base.cost)) if base.cost[loc] != world.cost[loc]]
+		if any(world.cost[loc] < base.cost[loc] for loc in changed):
+			return None
+		entered = set()
+		for solution in solutions:
+			if solution in (None, False):
+				return None
+			entered.update(task[3] for task in solution.iter_opt_tasks() if task[0] == 'navigate_op')
+		if not entered.isdisjoint(changed):
+			return None
+		return [solution.recosted(world) for solution in solutions]
+
+	# Subplans and unfinished searches are only valid for one problem
+	def clear_plan_library(self):
+		if self.plan_library != None:
+			self.plan_library.clear()
+		self.searches = {}
+
+	"""
+	pyhop.seek_bb for an anytime planner. Without a budget the search runs to the end.
+	With one, a search cut short is kept, and the next call for the same agent on an
+	equal problem (same fingerprint, then State.__eq__) resumes it instead of starting over.
+	The root of a kept search is handed out frozen (Node.frozen), so solutions built on it
+	do not change when the search is resumed.
+	"""
+	def seek_bb(self, problem, agent, all_plans, best_first, deadline=None, max_expansions=None):
+		if deadline == None and max_expansions == None:
+			return pyhop.seek_bb(problem, problem.goals[agent], verbose=problem.verbose,
+				all_plans=all_plans, best_first=best_first)
+		fingerprint = problem.fingerprint()
+		(cached_fingerprint, cached_problem, search) = self.searches.pop(agent, (None, None, None))
+		if search == None or cached_fingerprint != fingerprint or problem != cached_problem:
+			search = pyhop.BBSearch(problem, problem.goals[agent], verbose=problem.verbose,
+				all_plans=all_plans, best_first=best_first)
+			cached_problem = problem.copy() # Keeps the values the search started from
+		root = search.run(deadline, max_expansions)
+		if not search.done():
+			self.searches[agent] = (fingerprint, cached_problem, search)
+			root = root.frozen()
+		return root
 
 	@staticmethod
 	def make_sol_obj(solutions, problem, agent):
@@ -28,11 +124,15 @@ class Planner():
 		return sol_objs
 
 	""" Below defines the set of possible planners currently in the lib """
+	# With oracle=True, the A* planners read shortest paths off navigation.distance_tree
+	# instead of running navigation.a_star for every navigate task.
+	# With best_first=True, the branch-and-bound planners run seek_bb best-first (see pyhop.seek_bb)
 	@staticmethod
 	def get_HPlanner_v10():	# Returns the out-of-the-box pyshop planner
 		v10 = Planner()
 		def v10_plan(problem, agent):
 			problem.a_star = False
+			problem.oracle = False
 			problem.rand = True
 			return pyhop.seek_plan(problem,problem.goals[agent],[],0)
 		v10.planner = v10_plan
@@ -43,6 +143,7 @@ class Planner():
 		v10 = Planner()
 		def v10_plan(problem, agent):
 			problem.a_star = True
+			problem.oracle = False
 			problem.rand = True
 			return pyhop.seek_plan(problem,problem.goals[agent],[],0)
 		v10.planner = v10_plan
@@ -54,6 +155,7 @@ class Planner():
 		v13 = Planner()
 		def v13_plan(problem, agent):
 			problem.a_star = False # TODO: need to debug no-a-* first before using v13
+			problem.oracle = False
 			problem.rand = False
 			solutions = pyhop.seek_plan_v13(problem,problem.goals[agent],[],[],0)
 
@@ -68,10 +170,11 @@ class Planner():
 		return v13
 
 	@staticmethod
-	def get_HPlanner_v14(): # Modified version of original pyhop for sampling + A* for navigation
+	def get_HPlanner_v14(oracle=False): # Modified version of original pyhop for sampling + A* for navigation
 		v14 = Planner()
 		def v14_plan(problem, agent):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = False # False for debugging
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
@@ -87,15 +190,16 @@ class Planner():
 			return Planner.make_sol_obj(solutions, problem, agent)
 			
 		v14.planner = v14_plan
-		v14.name = "Det_Astar_OnePlan"
+		v14.name = "Det_Astar_OnePlan" + ("_Oracle" if oracle else "")
 		return v14
 
 
 	@staticmethod
-	def get_HPlanner_v15(): # Modified version of original pyhop for sampling + A* for navigation
+	def get_HPlanner_v15(oracle=False): # Modified version of original pyhop for sampling + A* for navigation
 		v15 = Planner()
 		def v15_plan(problem, agent):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = True # Only difference from v14
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
@@ -108,15 +212,16 @@ class Planner():
 				return solutions
 			return Planner.make_sol_obj(solutions, problem, agent)
 		v15.planner = v15_plan
-		v15.name = "Rand_Astar_OnePlan"
+		v15.name = "Rand_Astar_OnePlan" + ("_Oracle" if oracle else "")
 		return v15
 
 
 	@staticmethod
-	def get_HPlanner_v17(): # Modified version of original pyhop for sampling + A* for navigation
+	def get_HPlanner_v17(oracle=False): # Modified version of original pyhop for sampling + A* for navigation
 		v17 = Planner()
 		def v17_plan(problem, agent):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = True # Only difference from v14
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
@@ -132,10 +237,31 @@ class Planner():
 			return Planner.make_sol_obj(solutions, problem, agent)
 
 		v17.planner = v17_plan
-		v17.name = "Rand_Astar_OnePlan2"
+		v17.name = "Rand_Astar_OnePlan2" + ("_Oracle" if oracle else "")
 		return v17
 
 
+	@staticmethod
+	def get_HPlanner_v16(max_library_size=10000, oracle=False): # Deterministic A* planner that reuses subplans across replans
+		v16 = Planner()
+		v16.plan_library = pyhop.PlanLibrary(max_library_size)
+		def v16_plan(problem, agent):
+			problem.a_star = True
+			problem.oracle = oracle
+			problem.rand = False
+			if not hasattr(problem, 'verbose'):
+				problem.verbose = 0
+			solutions = pyhop.seek_plan_all_r(problem, problem.goals[agent], [], 0, verbose=problem.verbose, \
+				all_plans=False, library=v16.plan_library)
+			# If there is no solution
+			if solutions[0] == False:
+				return solutions
+			return Planner.make_sol_obj(solutions, problem, agent)
+		v16.planner = v16_plan
+		v16.name = "Det_Astar_OnePlan_Lib" + ("_Oracle" if oracle else "")
+		return v16
+
+
 	@staticmethod
 	def get_HPlanner_v12():		
 		# - Probablistic: if there are multiple ways to achieve the same cost, then random;
@@ -147,6 +273,7 @@ class Planner():
 		v12 = Planner()
 		def v12_plan(problem, agent):
 			problem.a_star = True # For performance
+			problem.oracle = False
 			problem.rand = True
 			return pyhop.seek_plan_all(problem, problem.goals[agent], plan=[], depth=0, all_plans=False)
 		v12.planner = v12_plan
@@ -160,6 +287,7 @@ class Planner():
 		v20 = Planner()
 		def v20_plan(problem, agent):
 			problem.a_star = False # For performance
+			problem.oracle = False
 			problem.rand = True
 			return pyhop.seek_plan_all(problem, problem.goals[agent], plan=[], depth=0, all_plans=True)
 		v20.planner = v20_plan
@@ -167,15 +295,16 @@ class Planner():
 
 
 	@staticmethod
-	def get_HPlanner_bb():		
+	def get_HPlanner_bb(oracle=False, best_first=False):		
 		# Returns the first result found
 		v20 = Planner()
-		def v20_plan(problem, agent):
+		def v20_plan(problem, agent, deadline=None, max_expansions=None):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = False
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
-			root = pyhop.seek_bb(problem, problem.goals[agent], verbose=problem.verbose, all_plans=False)
+			root = v20.seek_bb(problem, agent, False, best_first, deadline, max_expansions)
 			return [SolutionTree(root, agent, rand=False)]
 			
 			# # Even though we get the root, this planner imitates the result of a linear planner.
@@ -185,42 +314,47 @@ class Planner():
 			# return Planner.make_sol_obj(solutions, problem, agent)
 
 		v20.planner = v20_plan
-		v20.name = "Det_HTN_BB"
+		v20.anytime = True
+		v20.name = "Det_HTN_BB" + ("_BF" if best_first else "") + ("_Oracle" if oracle else "")
 		return v20
 
 
 	# Is able to reason expected cost over different decompositions.
 	@staticmethod
-	def get_HPlanner_bb_prob():		
+	def get_HPlanner_bb_prob(oracle=False, best_first=False):		
 		# Returns ALL possible plans
 		# - No Explanation
 		v20 = Planner()
-		def v20_plan(problem, agent):
+		def v20_plan(problem, agent, deadline=None, max_expansions=None):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = True
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
-			root = pyhop.seek_bb(problem, problem.goals[agent], verbose=problem.verbose, all_plans=True)
+			root = v20.seek_bb(problem, agent, True, best_first, deadline, max_expansions)
 			return [SolutionTree(root, agent, rand=True)]
 
 		v20.planner = v20_plan
-		v20.name = "Rand_HTN_BB"
+		v20.anytime = True
+		v20.name = "Rand_HTN_BB" + ("_BF" if best_first else "") + ("_Oracle" if oracle else "")
 		return v20
 
 
 	@staticmethod
-	def get_HPlanner_bb_all():		
+	def get_HPlanner_bb_all(oracle=False, best_first=False):		
 		# Returns ALL possible plans
 		# - No Explanation
 		v20 = Planner()
-		def v20_plan(problem, agent):
+		def v20_plan(problem, agent, deadline=None, max_expansions=None):
 			problem.a_star = True
+			problem.oracle = oracle
 			problem.rand = True
 			if not hasattr(problem, 'verbose'):
 				problem.verbose = 0
-			root = pyhop.seek_bb(problem, problem.goals[agent], verbose=problem.verbose, all_plans=True)
+			root = v20.seek_bb(problem, agent, True, best_first, deadline, max_expansions)
 			return [SolutionTree(root, agent, rand=False)]
 
 		v20.planner = v20_plan
-		v20.name = "RAND_HTN_BB"
+		v20.anytime = True
+		v20.name = "RAND_HTN_BB" + ("_BF" if best_first else "") + ("_Oracle" if oracle else "")
 		return v20
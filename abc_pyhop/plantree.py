@@ -1,5 +1,5 @@
 from __future__ import print_function
-import copy, sys, pprint
+import copy, sys, pprint, itertools
 from pyhop import *
 import rovers_world_operators
 import rovers_world_methods
@@ -111,7 +111,7 @@ class Node(object):
         self.level = 0
         self.name = str(tasks)
         self.state = state
-        self.before_state = copy.deepcopy(state)
+        self.before_state = state.copy()
         self.post_state = self.before_state
         self.children = []
         self.cost = sys.maxint
@@ -125,6 +125,7 @@ class Node(object):
         self.completed = False
         self.success = None
         self.plans = None
+        self.generation = 0 # On a search's root: bumped whenever the search expands the tree
 
         if parent != None:
             self.level = parent.level + 1
@@ -157,6 +158,24 @@ class Node(object):
             child.left = self.children[len(self.children)-1]
             self.children.append(child)
 
+    # A copy of the tree below this node that later expansions of this one do not change.
+    # Only the nodes are copied; their states are shared, as the search never writes them.
+    def frozen(self):
+        copies = {}
+        to_copy = [self]
+        while len(to_copy) != 0:
+            node = to_copy.pop()
+            copies[id(node)] = copy.copy(node)
+            to_copy += node.children
+        for new_node in copies.values():
+            new_node.parent = copies.get(id(new_node.parent), new_node.parent)
+            new_node.left = copies.get(id(new_node.left), new_node.left)
+            new_node.right = copies.get(id(new_node.right), new_node.right)
+            new_node.children = [copies[id(child)] for child in new_node.children]
+            if isinstance(new_node, orNode):
+                new_node.good_children = [copies[id(child)] for child in new_node.good_children]
+        return copies[id(self)]
+
 class andNode(Node):
     def __init__(self, state, parent, tasks):
         super(andNode, self).__init__(state,parent,  tasks)
@@ -221,52 +240,40 @@ class andNode(Node):
         return 0
 
     def get_all_plans(self):
-        to_return = []
         if self.success:
-            for child in self.children:
-                cplan = child.get_all_plans() # a list of lists.
-                # print("\tCPLAN: {}".format(cplan))
-                prev = to_return + []
-                # print("\tPREV: {}".format(prev))
-                to_return = []
-
-                if prev == []:
-                    to_return = cplan + []
-                else:
-                    for p in prev:
-                        for q in cplan:
-                            to_return.append(p + q)
-                # print("\tTO RETURN: {}".format(to_return))
-            # print("AND NODE: returning... for task {} : {}".format(self, to_return))
-            return to_return
+            return list(self.iter_all_plans())
         else:
             return None
 
+    # Lazy get_all_plans, one list of actions at a time.
+    def iter_all_plans(self):
+        if not self.success:
+            return
+        # As in the eager version, a child without plans discards the plans joined before it
+        start = 0
+        for i, child in enumerate(self.children):
+            if next(child.iter_all_plans(), None) is None:
+                start = i + 1
+        joined = join_plans([c.iter_all_plans for c in self.children[start:]], lambda p, q: p + q)
+        for plan in joined:
+            yield plan
+
     # Actions only
     def get_all_opt_plans(self):
-        to_return = []
         if self.success:
-            for child in self.children:
-                cplan = child.get_all_opt_plans() # a list of lists.
-                prev = to_return + []
-                to_return = []
-
-                if prev == []:
-                    to_return = cplan + []
-                else:
-                    for p in prev:
-                        (pa, ps) = p
-                        for q in cplan:
-                            (qa, qs) = q
-                            sol = (pa + qa, ps + qs)
-                            to_return.append(sol)
-
-                if cplan == []:
-                    to_return = prev
-            return to_return
+            return list(self.iter_all_opt_plans())
         else:
             return None
 
+    # Lazy get_all_opt_plans, one (actions, states) pair at a time.
+    def iter_all_opt_plans(self):
+        if not self.success:
+            return
+        joined = join_plans([c.iter_all_opt_plans for c in self.children], \
+            lambda p, q: (p[0] + q[0], p[1] + q[1]))
+        for plan in joined:
+            yield plan
+
     # Propagating lower-bound cost for AND-NODE
     def report_lb_cost(self, child):
 
@@ -304,7 +311,7 @@ class orNode(Node):
 
         if VERBOSE: print("ORNODE: ... cur_node {} is an OPERATOR".format(self))
         operator = operators[self.task[0]]
-        new_state = operator(copy.deepcopy(self.before_state),*self.task[1:])
+        new_state = apply_operator(operator, self.before_state.copy(), self.task)
         if new_state:
             self.post_state = new_state
             self.success = True
@@ -331,6 +338,7 @@ class orNode(Node):
                     openset.append(self.right)
                 else:
                     if VERBOSE: print("PLANTREE.UPDATE: DECIDED NOT to add next-node: {} with parent {}".format(self.right, self.parent))
+                    count_pruned()
             
             if VERBOSE: print("Found plan for node {} as: ".format(self))
             if VERBOSE: print(self.get_plan())
@@ -401,6 +409,7 @@ class orNode(Node):
                         openset.append(self.right)
                     else:
                         if VERBOSE: print("PLANTREE.UPDATE: DECIDED NOT to add next-node: {} with parent {}".format(self.right, self.parent))
+                        count_pruned()
 
             elif child.completed and child.success:
                 # Found better plan
@@ -444,7 +453,7 @@ class orNode(Node):
 
         success_children = [c for c in self.good_children]
         if rand:
-            return random.choice(success_children).get_plan(rand)
+            return get_rng(self.state).choice(success_children).get_plan(rand)
         return success_children[0].get_plan(rand)
 
     def get_num_plans(self):
@@ -471,31 +480,53 @@ class orNode(Node):
 
     def get_all_plans(self):
         if self.success:
-            # print("All opt plans for {}: ".format(self))
-            to_return = []
-            if len(self.children) == 0:
-                to_return = [[self.task]]
-            else:
-                for c in self.children:
-                    # print ("\tGood child: {}".format(c))
-                    if c.success:
-                        to_return += c.get_all_plans()
-            # print("returning... for task {} : {}".format(self, to_return))
-            return to_return
+            return list(self.iter_all_plans())
         return
 
+    def iter_all_plans(self):
+        if not self.success:
+            return
+        if len(self.children) == 0:
+            yield [self.task]
+            return
+        for c in self.children:
+            if c.success:
+                for plan in c.iter_all_plans():
+                    yield plan
+
     # Actions and States
     def get_all_opt_plans(self):
         if self.success:
-            to_return = []
-            if len(self.children) == 0:
-                to_return = [([self.task], [self.post_state])]
-            else:
-                for c in self.good_children:
-                    if c.success:
-                        to_return += c.get_all_opt_plans() # Adding distinct plans together
-            return to_return
+            return list(self.iter_all_opt_plans())
         return
 
+    def iter_all_opt_plans(self):
+        if not self.success:
+            return
+        if len(self.children) == 0:
+            yield ([self.task], [self.post_state])
+            return
+        for c in self.good_children:
+            if c.success:
+                for plan in c.iter_all_opt_plans(): # Adding distinct plans together
+                    yield plan
 
 
+"""
+Lazily joins the plans of an AND-node's children: yields every combination of one
+plan per child, concatenated in child order with join(p, q). plan_iters are functions
+returning a fresh iterator over one child's plans. Children without plans are skipped.
+"""
+def join_plans(plan_iters, join, found=False):
+    if len(plan_iters) == 0:
+        if found: yield None # The empty suffix
+        return
+    plans = plan_iters[0]()
+    first = next(plans, None)
+    if first is None:
+        for plan in join_plans(plan_iters[1:], join, found):
+            yield plan
+        return
+    for plan in itertools.chain([first], plans):
+        for rest in join_plans(plan_iters[1:], join, True):
+            yield plan if rest is None else join(plan, rest)
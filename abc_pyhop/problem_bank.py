@@ -42,9 +42,9 @@ def maze_1():
 	world.visited['A1'].add(17)
 
 	# Set Traps
-	world.cost[12] = sys.maxint
-	world.cost[13] = sys.maxint
-	world.cost[18] = sys.maxint
+	world.mutable('cost')[12] = sys.maxint
+	world.mutable('cost')[13] = sys.maxint
+	world.mutable('cost')[18] = sys.maxint
 
 	return world
 
@@ -65,11 +65,11 @@ def maze_2():
 	world.visited['A1'].add(12)
 
 	# Set Traps
-	world.cost[7] = sys.maxint
-	world.cost[8] = sys.maxint
-	world.cost[13] = sys.maxint
-	world.cost[18] = sys.maxint
-	world.cost[17] = sys.maxint
+	world.mutable('cost')[7] = sys.maxint
+	world.mutable('cost')[8] = sys.maxint
+	world.mutable('cost')[13] = sys.maxint
+	world.mutable('cost')[18] = sys.maxint
+	world.mutable('cost')[17] = sys.maxint
 
 	return world
 
@@ -91,13 +91,13 @@ def maze_3():
 	world.visited['A1'].add(12)
 
 	# Set Traps
-	world.cost[4] = sys.maxint
-	world.cost[7] = sys.maxint
-	world.cost[8] = sys.maxint
-	world.cost[13] = sys.maxint
-	world.cost[18] = sys.maxint
-	world.cost[17] = sys.maxint
-	world.cost[22] = sys.maxint
+	world.mutable('cost')[4] = sys.maxint
+	world.mutable('cost')[7] = sys.maxint
+	world.mutable('cost')[8] = sys.maxint
+	world.mutable('cost')[13] = sys.maxint
+	world.mutable('cost')[18] = sys.maxint
+	world.mutable('cost')[17] = sys.maxint
+	world.mutable('cost')[22] = sys.maxint
 	
 	return world
 
@@ -119,16 +119,16 @@ def maze_4():
 	world.goals['A1'] = [('navigate', 'A1', 78)]
 
 	# Set Traps
-	world.cost[43] = sys.maxint
-	world.cost[34] = sys.maxint
-	world.cost[25] = sys.maxint
-	world.cost[37] = sys.maxint
-	world.cost[47] = sys.maxint
-	world.cost[57] = sys.maxint
-	world.cost[67] = sys.maxint
-	world.cost[77] = sys.maxint
-	world.cost[87] = sys.maxint
-	world.cost[97] = sys.maxint
+	world.mutable('cost')[43] = sys.maxint
+	world.mutable('cost')[34] = sys.maxint
+	world.mutable('cost')[25] = sys.maxint
+	world.mutable('cost')[37] = sys.maxint
+	world.mutable('cost')[47] = sys.maxint
+	world.mutable('cost')[57] = sys.maxint
+	world.mutable('cost')[67] = sys.maxint
+	world.mutable('cost')[77] = sys.maxint
+	world.mutable('cost')[87] = sys.maxint
+	world.mutable('cost')[97] = sys.maxint
 
 	return world
 
@@ -150,16 +150,16 @@ def maze_5():
 	world.goals['A1'] = [('navigate', 'A1', 51)]
 
 	# Set Traps
-	world.cost[49] = sys.maxint
-	world.cost[57] = sys.maxint
-	world.cost[58] = sys.maxint
-	world.cost[59] = sys.maxint
-	world.cost[66] = sys.maxint
-	world.cost[68] = sys.maxint
-	world.cost[75] = sys.maxint
-	world.cost[85] = sys.maxint
-	world.cost[86] = sys.maxint
-	world.cost[53] = sys.maxint
+	world.mutable('cost')[49] = sys.maxint
+	world.mutable('cost')[57] = sys.maxint
+	world.mutable('cost')[58] = sys.maxint
+	world.mutable('cost')[59] = sys.maxint
+	world.mutable('cost')[66] = sys.maxint
+	world.mutable('cost')[68] = sys.maxint
+	world.mutable('cost')[75] = sys.maxint
+	world.mutable('cost')[85] = sys.maxint
+	world.mutable('cost')[86] = sys.maxint
+	world.mutable('cost')[53] = sys.maxint
 
 	return world
 
@@ -240,7 +240,7 @@ def navigate_replan_team_2():
 
 	traps = [7, 8, 10, 11, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26, 28, 29]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.uncertainties = replan_2_rand
 	return world
@@ -274,7 +274,7 @@ def navigate_replan_team_3():
 
 	traps = [7, 8, 10, 11, 13, 14, 16, 17, 19, 20, 22, 23, 25, 26, 27, 28, 29]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.uncertainties = replan_3_rand
 	world.ID = "navigate_replan_team_3"
@@ -309,7 +309,7 @@ def navigate_replan_team_4():
 
 	traps = [15, 16, 19, 20, 22, 23, 26, 27, 29, 30, 33, 34, 36, 37, 40, 41]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.uncertainties = replan_4_rand
 	world.ID = "navigate_replan_team_4"
@@ -344,7 +344,7 @@ def navigate_replan_team_4p():
 
 	traps = [2, 4, 6, 38, 39, 15, 16, 19, 20, 22, 23, 26, 27, 29, 30, 33, 34, 36, 37, 40, 41]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.ID = "navigate_replan_team_4p"
 	return world
@@ -378,7 +378,7 @@ def navigate_replan_team_5():
 
 	traps = [15, 16, 19, 18, 22, 23, 26, 25, 29, 30, 33, 32, 36, 37, 40, 39]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.uncertainties = replan_5_rand
 	world.ID = "navigate_replan_team_5"
@@ -410,7 +410,7 @@ def navigate_replan_team_6():
 
 	traps = [23]
 	for t in traps:
-		world.cost[t] = sys.maxint
+		world.mutable('cost')[t] = sys.maxint
 
 	world.uncertainties = replan_6_rand
 	world.ID = "navigate_replan_team_6"
@@ -439,7 +439,7 @@ def navigate_replan_team_7():
 	world.visited['A2'] = set()
 	world.visited['A2'].add(41)
 
-	world.cost[41] = 10
+	world.mutable('cost')[41] = 10
 
 	world.uncertainties = replan_7_rand
 	world.ID = "navigate_replan_team_7"
@@ -509,14 +509,14 @@ def dummy_world():
 	world.goals['A2'] = [('get_rock_data', 'A1')]
 
 	# Set Traps
-	world.cost[41] = sys.maxint
-	world.cost[42] = sys.maxint
-	world.cost[43] = sys.maxint
-	world.cost[44] = sys.maxint
-	world.cost[47] = sys.maxint
-	world.cost[48] = sys.maxint
-	world.cost[49] = sys.maxint
-	world.cost[50] = sys.maxint
+	world.mutable('cost')[41] = sys.maxint
+	world.mutable('cost')[42] = sys.maxint
+	world.mutable('cost')[43] = sys.maxint
+	world.mutable('cost')[44] = sys.maxint
+	world.mutable('cost')[47] = sys.maxint
+	world.mutable('cost')[48] = sys.maxint
+	world.mutable('cost')[49] = sys.maxint
+	world.mutable('cost')[50] = sys.maxint
 
 	return world
 
@@ -548,66 +548,66 @@ Uncertainties Library
 def replan_1_rand(world, idx):
 	print("*** *** Calling replan_1_rand *** ")
 	if idx == 0:
-		world.cost[14] = sys.maxint
+		world.mutable('cost')[14] = sys.maxint
 
 def replan_2_rand(world, idx):
 	if idx == 0:
-		world.cost[27] = sys.maxint
+		world.mutable('cost')[27] = sys.maxint
 
 def replan_3_rand(world, idx):
 	if idx == 0:
-		world.cost[27] = 1
+		world.mutable('cost')[27] = 1
 
 def replan_4_rand(world, idx):
 	if idx == 0:
-		world.cost[2] = sys.maxint
-		world.cost[4] = sys.maxint
-		world.cost[6] = sys.maxint
-		world.cost[38] = sys.maxint
-		world.cost[39] = sys.maxint
+		world.mutable('cost')[2] = sys.maxint
+		world.mutable('cost')[4] = sys.maxint
+		world.mutable('cost')[6] = sys.maxint
+		world.mutable('cost')[38] = sys.maxint
+		world.mutable('cost')[39] = sys.maxint
 
 def replan_5_rand(world, idx):
 	if idx == 0:
-		world.cost[2] = sys.maxint
-		world.cost[4] = sys.maxint
-		world.cost[6] = sys.maxint
-		world.cost[38] = sys.maxint
-		world.cost[21] = sys.maxint
-		world.cost[35] = sys.maxint
+		world.mutable('cost')[2] = sys.maxint
+		world.mutable('cost')[4] = sys.maxint
+		world.mutable('cost')[6] = sys.maxint
+		world.mutable('cost')[38] = sys.maxint
+		world.mutable('cost')[21] = sys.maxint
+		world.mutable('cost')[35] = sys.maxint
 
 def replan_6_rand(world, idx):
 	if idx == 1:
-		world.cost[14] = 10
-		world.cost[13] = 10
-		world.cost[15] = 10
+		world.mutable('cost')[14] = 10
+		world.mutable('cost')[13] = 10
+		world.mutable('cost')[15] = 10
 
 def replan_7_rand(world, idx):
 	if idx == 0:
-		world.cost[32] = 15
-		world.cost[23] = 10
-		world.cost[14] = 2
+		world.mutable('cost')[32] = 15
+		world.mutable('cost')[23] = 10
+		world.mutable('cost')[14] = 2
 
 def replan_decompose_1(world, idx):
 	print("*** Calling re-lan_decompose_1 for uncertainties ***")
 	if world.has_soil_analysis['A1']:
 		print("*** *** hadding uncertainties, case 3 ***")
-		world.cost[17] = sys.maxint
-		world.cost[23] = sys.maxint
-		world.cost[29] = sys.maxint
+		world.mutable('cost')[17] = sys.maxint
+		world.mutable('cost')[23] = sys.maxint
+		world.mutable('cost')[29] = sys.maxint
 		return
 	if world.has_soil_sample['A1']:
 		print("*** *** hadding uncertainties, case 2 ***")
-		world.cost[16] = sys.maxint
+		world.mutable('cost')[16] = sys.maxint
 		return
 	if idx == 1:
 		print("*** *** hadding uncertainties, case 1 ***")
-		world.cost[13] = sys.maxint
-		world.cost[8] = sys.maxint
+		world.mutable('cost')[13] = sys.maxint
+		world.mutable('cost')[8] = sys.maxint
 		return
 
 def test_exp_cost_rand(world, idx):
 	if idx == 0:
-		world.cost[5] = 3
+		world.mutable('cost')[5] = 3
 
 
 
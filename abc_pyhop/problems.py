@@ -2,9 +2,12 @@
 Write a set of problems to file;
 Given a problem id or set of attributes, fetch problem from file. 
 """
-import time, math, sys
+import time, math, sys, os, re, zlib, sqlite3, logging
 import random_rovers_world as rrw
 
+PROBLEM_DIR = "problems"
+LOG = logging.getLogger('problems')
+
 def write_problems_to_file(problems, file_name=None, file_obj=None):
 	if file_name == None and file_obj == None:
 		assert False, "Must specify file_name OR file_obj"
@@ -104,16 +107,132 @@ def parse_problem(problem_array):
 	return rrw.make_world(p_name, board_x, board_y, num_soils, num_rocks, max_cost, rand_range, rand_prob, AT, GOALS, SEQ, RANDs)
 
 
+"""
+An indexed store of the problems in PROBLEM_DIR/*.txt. Each problem is one row with its
+filter fields as columns, indexed together, and its text line zlib-compressed; a query
+returns StoredProblem records, and only the ones asked for are parsed into worlds.
+The text files stay the source of truth: a file is (re-)imported when its size or
+modification time differs from when it was last imported.
+"""
+class ProblemStore():
+
+	COLUMNS = ['name', 'board_x', 'board_y', 'num_soils', 'num_rocks', 'max_cost', 'rand_range', 'rand_prob']
+	FILE_NAME = re.compile(r'problem_(?:A(\d+)_)?X(\d+)_Y(\d+)\.txt$')
+
+	def __init__(self, db_name=None, problem_dir=PROBLEM_DIR):
+		self.problem_dir = problem_dir
+		if db_name == None:
+			db_name = os.path.join(problem_dir, 'problems.db')
+		self.conn = sqlite3.connect(db_name)
+		self.conn.executescript("""
+			CREATE TABLE IF NOT EXISTS problems (
+				id INTEGER PRIMARY KEY, source TEXT, num_agent INTEGER,
+				name TEXT, board_x INTEGER, board_y INTEGER, num_soils INTEGER, num_rocks INTEGER,
+				max_cost REAL, rand_range REAL, rand_prob REAL, data BLOB);
+			CREATE INDEX IF NOT EXISTS problems_by_params ON problems
+				(num_agent, board_x, board_y, num_rocks, num_soils, rand_range, rand_prob, max_cost);
+			CREATE INDEX IF NOT EXISTS problems_by_name ON problems (name);
+			CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+			""")
+
+	# Imports the problem files of the given board that changed since they were last imported
+	# (num_agent None: the files of every number of agents)
+	def sync(self, BOARD_X, BOARD_Y, num_agent=2):
+		for file_name in sorted(os.listdir(self.problem_dir)):
+			match = self.FILE_NAME.match(file_name)
+			if match == None:
+				continue
+			(file_agents, board_x, board_y) = match.groups()
+			file_agents = 2 if file_agents == None else int(file_agents)
+			if (int(board_x), int(board_y)) != (BOARD_X, BOARD_Y) or num_agent not in (None, file_agents):
+				continue
+			stat = os.stat(os.path.join(self.problem_dir, file_name))
+			imported = self.conn.execute("SELECT size, mtime FROM sources WHERE source = ?", (file_name,)).fetchone()
+			if imported != (stat.st_size, stat.st_mtime):
+				self.import_file(file_name)
+
+	# Bulk import of one problems/*.txt file, replacing what was imported from it before
+	def import_file(self, file_name):
+		(num_agent, board_x, board_y) = self.FILE_NAME.match(file_name).groups()
+		num_agent = 2 if num_agent == None else int(num_agent)
+		path = os.path.join(self.problem_dir, file_name)
+		stat = os.stat(path)
+
+		def rows():
+			for line in open(path, 'r'):
+				problem_array = line.rstrip('\n').split('\t')
+				if len(problem_array) < 8:
+					continue
+				yield [file_name, num_agent] + problem_array[0:8] + [sqlite3.Binary(zlib.compress(line))]
+
+		with self.conn:
+			self.conn.execute("DELETE FROM problems WHERE source = ?", (file_name,))
+			self.conn.executemany("INSERT INTO problems (source, num_agent, {}, data) VALUES (?, ?, {}, ?)".format(
+				', '.join(self.COLUMNS), ', '.join(['?'] * len(self.COLUMNS))), rows())
+			self.conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (file_name, stat.st_size, stat.st_mtime))
+		LOG.info("imported %s", path)
+
+	# Problems matching every filter that is not None, in file order; only the board's files are (re)imported
+	def find(self, BOARD_X, BOARD_Y, problem_name=None, num_agent=2, MAX_COST=None, \
+		RAND_RANGE=None, RAND_PROB=None, NUM_ROCKS=None, NUM_SOILS=None, limit=sys.maxint):
+
+		self.sync(BOARD_X, BOARD_Y, num_agent)
+
+		filters = zip(['num_agent'] + self.COLUMNS,
+			[num_agent, problem_name, BOARD_X, BOARD_Y, NUM_SOILS, NUM_ROCKS, MAX_COST, RAND_RANGE, RAND_PROB])
+		filters = [(column, value) for (column, value) in filters if value != None]
+		query = "SELECT name, data FROM problems WHERE {} ORDER BY id LIMIT ?".format(
+			' AND '.join('{} = ?'.format(column) for (column, value) in filters))
+		limit = -1 if limit == sys.maxint else limit
+		return [StoredProblem(name, data) for (name, data) in
+			self.conn.execute(query, [value for (column, value) in filters] + [limit])]
+
+	def close(self):
+		self.conn.close()
+
+# A problem row of the ProblemStore; parsed into a world on the first call to world()
+class StoredProblem():
+
+	def __init__(self, name, data):
+		self.name = name
+		self.data = data
+		self._world = None
+
+	def world(self):
+		if self._world == None:
+			line = zlib.decompress(str(self.data))
+			self._world = parse_problem(line.rstrip('\n').split('\t'))
+		return self._world
+
+	def __repr__(self):
+		return "StoredProblem({})".format(self.name)
+
+STORE = [None] # Opened on the first find_problems
+def get_store():
+	if STORE[0] == None:
+		STORE[0] = ProblemStore()
+	return STORE[0]
+
+# Problems from the store, as worlds
 def find_problems(BOARD_X, BOARD_Y, problem_name=None, num_agent=2, MAX_COST=None, \
 	RAND_RANGE=None, RAND_PROB=None, NUM_ROCKS=None, NUM_SOILS=None, limit=sys.maxint):
 
+	to_return = [p.world() for p in get_store().find(BOARD_X, BOARD_Y, problem_name, num_agent, MAX_COST, \
+		RAND_RANGE, RAND_PROB, NUM_ROCKS, NUM_SOILS, limit)]
+	LOG.info("returning %d problems", len(to_return))
+	return to_return
+
+# The same search by scanning the problem's text file
+def scan_problems(BOARD_X, BOARD_Y, problem_name=None, num_agent=2, MAX_COST=None, \
+	RAND_RANGE=None, RAND_PROB=None, NUM_ROCKS=None, NUM_SOILS=None, limit=sys.maxint):
+
 	to_return = []
 	num_p_found = 0
 
 	if num_agent==2:
-		problem_file = open("problems/problem_X{}_Y{}.txt".format(BOARD_X, BOARD_Y), 'r')
+		problem_file = open("{}/problem_X{}_Y{}.txt".format(PROBLEM_DIR, BOARD_X, BOARD_Y), 'r')
 	else:
-		problem_file = open("problems/problem_A{}_X{}_Y{}.txt".format(num_agent, BOARD_X, BOARD_Y), 'r')
+		problem_file = open("{}/problem_A{}_X{}_Y{}.txt".format(PROBLEM_DIR, num_agent, BOARD_X, BOARD_Y), 'r')
 
 	for line in problem_file:
 		problem_array = line.split('\t')
@@ -96,38 +96,286 @@ Pyhop provides the following classes and functions:
 
 
 from __future__ import print_function
-import copy,sys, pprint, random
+import copy,sys, pprint, random, collections, array, time, contextlib
 ############################################################
 # States and goals
 
+"""
+What State.memo keeps per attribute: the attribute value the memo dict was made for (None
+once the value was written through mutable()), the memo dict (None once dropped), the
+memo before the last change and the keys changed since it (see previous_changes).
+"""
+Memo = collections.namedtuple('Memo', 'value memo previous changes')
+
 class State():
     """A state is just a collection of variable bindings."""
     def __init__(self,name):
         self.__name__ = name
 
+    """
+    Attributes not set on the state itself are looked up on its static part
+    (state.__static__), which is shared by every copy of the state.
+    """
+    def __getattr__(self, attr):
+        if attr[0:2] != '__':
+            static = self.__dict__.get('__static__')
+            if static is not None:
+                return getattr(static, attr)
+        raise AttributeError(attr)
+
+    """
+    Copy-on-write copy. The new state shares every attribute value with this
+    one; whichever side writes first must take its own clone through mutable().
+    Replacing an attribute outright (state.x = ...) is always safe.
+    """
+    def copy(self):
+        if STATS.enabled:
+            STATS.copies += 1
+        new_state = copy.copy(self)
+        # Neither side owns the shared values any more
+        self.__owned__ = set()
+        new_state.__owned__ = set()
+        # Cached hashes stay valid for the shared values
+        new_state.__hashes__ = dict(self.__dict__.get('__hashes__', {}))
+        # So do memos
+        new_state.__memos__ = dict(self.__dict__.get('__memos__', {}))
+        return new_state
+
+    """
+    Returns attr's value, cloning it first if it is still shared with another state.
+    All in-place writes should go through here, since it also drops attr's cached hash
+    and memo.
+    """
+    def mutable(self, attr):
+        value = getattr(self, attr)
+        hashes = self.__dict__.get('__hashes__')
+        if hashes: hashes.pop(attr, None)
+        memos = self.__dict__.get('__memos__')
+        cached = memos.get(attr) if memos else None
+        if cached is not None:
+            # The memo is kept only as the previous memo; what the caller writes is not known
+            memos[attr] = Memo(None, None, cached.previous if cached.memo is None else cached.memo, None)
+        owned = self.__dict__.get('__owned__')
+        if owned is None or attr in owned:
+            return value
+        value = copy.deepcopy(value)
+        setattr(self, attr, value)
+        owned.add(attr)
+        return value
+
+    """
+    attr[key] = value, written through mutable(). The hash of an array attribute is then
+    updated rather than dropped (the old entry XORed out, the new one in; see hash_value),
+    so a single-cell write does not rehash the whole array. key is also recorded as changed
+    since the previous memo (see previous_changes).
+    """
+    def set_item(self, attr, key, value):
+        hashes = self.__dict__.get('__hashes__')
+        cached = hashes.get(attr) if hashes else None
+        memos = self.__dict__.get('__memos__')
+        memo_before = memos.get(attr) if memos else None
+        value_before = getattr(self, attr)
+        old = value_before[key]
+        container = self.mutable(attr)
+        container[key] = value
+        if cached is not None and isinstance(container, array.array):
+            value_hash = cached[2] ^ hash((key, old)) ^ hash((key, container[key]))
+            hashes[attr] = (container, hash((attr, value_hash)), value_hash)
+        if memo_before is not None:
+            changes = None
+            if memo_before.memo is not None and memo_before.value is value_before:
+                changes = frozenset([key]) # The first write since the memo was made
+            elif memo_before.memo is None and memo_before.changes is not None:
+                changes = memo_before.changes | frozenset([key])
+            memos[attr] = memos[attr]._replace(changes=changes)
+
+    """
+    A dict for caching values derived from attr, e.g. search trees over the cost table.
+    Copies that still share attr's value share the memo; it is dropped when attr is
+    replaced or written through mutable(). The dropped memo stays reachable through
+    previous_memo() for one more change, so caches can be repaired instead of rebuilt;
+    previous_changes() tells which keys of attr changed since.
+    """
+    def memo(self, attr):
+        memos = self.__dict__.get('__memos__')
+        if memos is None:
+            memos = self.__memos__ = {}
+        value = getattr(self, attr)
+        cached = memos.get(attr)
+        if cached is None or cached.value is not value:
+            (previous, changes) = (None, None)
+            if cached is not None and cached.memo is None:
+                (previous, changes) = (cached.previous, cached.changes) # Dropped by mutable()
+            elif cached is not None:
+                previous = cached.memo # attr was replaced outright
+            cached = Memo(value, {}, previous, changes)
+            memos[attr] = cached
+        return cached.memo
+
+    """ The memo attr had before its last change, or None """
+    def previous_memo(self, attr):
+        self.memo(attr)
+        return self.__memos__[attr].previous
+
+    """
+    The keys of attr written since previous_memo() was current, all through set_item();
+    None if attr was also written or replaced some other way
+    """
+    def previous_changes(self, attr):
+        self.memo(attr)
+        return self.__memos__[attr].changes
+
+    """
+    Zobrist-style fingerprint: the XOR of one hash per attribute. Each attribute
+    hash is cached against the value object it was computed from, so after an
+    operator only the attributes it replaced are hashed again.
+    """
+    def fingerprint(self):
+        hashes = self.__dict__.get('__hashes__')
+        if hashes is None:
+            hashes = self.__hashes__ = {}
+        h = 0
+        for (attr, value) in self.__dict__.items():
+            if attr[0:2] == '__': continue
+            cached = hashes.get(attr)
+            if cached is None or cached[0] is not value:
+                value_hash = hash_value(value)
+                cached = (value, hash((attr, value_hash)), value_hash)
+                hashes[attr] = cached
+            h ^= cached[1]
+        return h
+
     """ Two states are equal if their attributes have the same face values """
     def __eq__(self, other):
-        attrs_self = sorted(dir(self))
-        attrs_other = sorted(dir(other))
-        if attrs_self == attrs_other:
-            for attr in attrs_self:
-                if attr[0:2] =='__': continue
-                if getattr(self, attr) != getattr(other, attr): 
-                    print('not equ', attr)
-                    return False
-            return True
-        else: return False
+        if self is other: return True
+        if not isinstance(other, State): return False
+        attrs_self = [attr for attr in self.__dict__ if attr[0:2] != '__']
+        attrs_other = [attr for attr in other.__dict__ if attr[0:2] != '__']
+        if len(attrs_self) != len(attrs_other) or self.fingerprint() != other.fingerprint():
+            return False
+        for attr in attrs_self:
+            if attr not in other.__dict__: return False
+            value_self = self.__dict__[attr]
+            value_other = other.__dict__[attr]
+            if value_self is not value_other and value_self != value_other:
+                return False
+        return self.__dict__.get('__static__') == other.__dict__.get('__static__')
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
-    def __hash__(self):
-        attrs = sorted(dir(self))
-        values = []
+    """ Names of the attributes whose values differ between this state and other """
+    def changed_attrs(self, other):
+        attrs = set(attr for attr in self.__dict__ if attr[0:2] != '__')
+        attrs.update(attr for attr in other.__dict__ if attr[0:2] != '__')
+        to_return = set()
         for attr in attrs:
-            if attr[0:2] != '__':
-                values.append(str(getattr(self, attr)))
-        return hash(frozenset(values + attrs))
+            if attr not in self.__dict__ or attr not in other.__dict__:
+                to_return.add(attr)
+                continue
+            value_self = self.__dict__[attr]
+            value_other = other.__dict__[attr]
+            if value_self is not value_other and value_self != value_other:
+                to_return.add(attr)
+        if self.__dict__.get('__static__') != other.__dict__.get('__static__'):
+            to_return.add('__static__')
+        return to_return
+
+    def __hash__(self):
+        return self.fingerprint()
+
+SET_TAG = 'set' # Mixed into the hash of every set element
+
+"""
+Order-independent hash of a fluent value, consistent with == on dicts, sets and sequences.
+Dict, set and array entries are each hashed with their key (or a tag) before they are
+XORed together, so that sets of small ints do not cancel out, and so that an array's hash
+can be updated one entry at a time (State.set_item).
+"""
+def hash_value(value):
+    if isinstance(value, dict):
+        h = len(value)
+        for item in value.items():
+            h ^= hash((item[0], hash_value(item[1])))
+        return h
+    if isinstance(value, (set, frozenset)):
+        h = len(value)
+        for item in value:
+            h ^= hash((SET_TAG, item))
+        return h
+    if isinstance(value, (list, tuple)):
+        return hash(tuple(hash_value(item) for item in value))
+    if isinstance(value, array.array):
+        h = len(value)
+        for item in enumerate(value):
+            h ^= hash(item)
+        return h
+    try:
+        return hash(value)
+    except TypeError:
+        return 0
+
+"""
+Changes to a world's fluents, entry by entry: the cost of a cell, where an object moved to,
+a flipped fluent (e.g. has_soil_sample[agent]). A delta is applied entry by entry through
+State.set_item, so a world that shares its values with other copies only clones the
+attributes it patches, and is kept in sync without being copied whole. set_item also
+keeps cached hashes up to date and records the changed keys, so caches over those
+attributes (e.g. distance trees over cost) are repaired instead of rebuilt.
+"""
+class WorldDelta(object):
+
+    def __init__(self):
+        self.entries = {} # attr -> {key: new value}
+
+    def set(self, attr, key, value):
+        self.entries.setdefault(attr, {})[key] = value
+        return self
+
+    # The value of attr[key] in state once the delta is applied
+    def get(self, state, attr, key):
+        entries = self.entries.get(attr)
+        if entries != None and key in entries:
+            return entries[key]
+        return getattr(state, attr)[key]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def __repr__(self):
+        return "WorldDelta({})".format(self.entries)
+
+    # Patches state in place and returns it. Values are copied in, never shared with the delta.
+    def apply(self, state):
+        for (attr, entries) in self.entries.items():
+            for (key, new) in entries.items():
+                state.set_item(attr, key, copy.deepcopy(new))
+        return state
+
+"""
+A random.Random that states share instead of copying: every copy (and deep copy) of a
+state draws from the same stream, so a seeded run is reproducible from the seed alone.
+"""
+class RNG(random.Random):
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+""" The random number generator a state's planning and simulation draw from """
+def get_rng(state):
+    rng = state.__dict__.get('__rng__')
+    if rng is None:
+        return random # Unseeded: the global generator
+    return rng
+
+def set_rng(state, rng):
+    if rng is None:
+        state.__dict__.pop('__rng__', None)
+    else:
+        state.__rng__ = rng
 
 class Goal():
     """A goal is just a collection of variable bindings."""
@@ -141,7 +389,7 @@ def print_state(state,indent=4):
     """Print each variable in state, indented by indent spaces."""
     if state != False:
         for (name,val) in vars(state).items():
-            if name != '__name__':
+            if name[0:2] != '__':
                 for x in range(indent): sys.stdout.write(' ')
                 sys.stdout.write(state.__name__ + '.' + name)
                 print(' =', val)
@@ -198,6 +446,17 @@ def declare_methods(task_name,*method_list):
     methods.update({task_name:list(method_list)})
     return methods[task_name]
 
+estimates = {}
+
+def declare_estimate(task_name, estimate):
+    """
+    Optional: tells seek_bb(best_first=True) how to bound the cost of a method task.
+    estimate(state, *task[1:]) must never exceed the cost of any plan for the task
+    from state. Method tasks without an estimate are bounded by 0.
+    """
+    estimates[task_name] = estimate
+    return estimate
+
 ############################################################
 # Commands to find out what the operators and methods are
 
@@ -213,6 +472,102 @@ def print_methods(mlist=methods):
 
 
 
+############################################################
+# Instrumentation
+
+"""
+Counters for one planning call: method decompositions, operator applications (and
+how many failed their preconditions), state copies and deepcopies, branches pruned
+without being expanded, the peak openset sizes of seek_bb and of navigation.a_star
+(with the nodes A* expanded), and per task name the number of calls
+and the time spent in its method or operator (not in the subtasks).
+The engines count into STATS, which is NO_STATS unless collect_stats() is active;
+they only check its enabled flag, so disabled instrumentation costs next to nothing.
+"""
+class PlanStats(object):
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.decompositions = 0
+        self.operator_calls = 0
+        self.failed_preconditions = 0
+        self.copies = 0
+        self.deepcopies = 0
+        self.pruned = 0
+        self.openset_peak = 0
+        self.nav_expansions = 0 # Nodes expanded by navigation.a_star
+        self.nav_openset_peak = 0
+        self.task_calls = collections.defaultdict(int)
+        self.task_time = collections.defaultdict(float)
+
+    def add_task(self, name, seconds):
+        self.task_calls[name] += 1
+        self.task_time[name] += seconds
+
+    def saw_openset(self, size):
+        if size > self.openset_peak:
+            self.openset_peak = size
+
+    def saw_nav_openset(self, size):
+        if size > self.nav_openset_peak:
+            self.nav_openset_peak = size
+
+    def as_dict(self):
+        to_return = dict(self.__dict__)
+        del to_return['enabled']
+        to_return['task_calls'] = dict(self.task_calls)
+        to_return['task_time'] = dict(self.task_time)
+        return to_return
+
+    def __repr__(self):
+        return "PlanStats({})".format(self.as_dict())
+
+NO_STATS = PlanStats(enabled=False)
+STATS = NO_STATS
+
+""" Collects the stats of the planning done in the with-block into stats (or a new PlanStats) """
+@contextlib.contextmanager
+def collect_stats(stats=None):
+    global STATS
+    previous = STATS
+    STATS = PlanStats() if stats is None else stats
+    try:
+        yield STATS
+    finally:
+        STATS = previous
+
+# operator(state, *task[1:]), counted
+def apply_operator(operator, state, task):
+    if not STATS.enabled:
+        return operator(state, *task[1:])
+    start = time.time()
+    newstate = operator(state, *task[1:])
+    STATS.add_task(task[0], time.time() - start)
+    STATS.operator_calls += 1
+    if not newstate:
+        STATS.failed_preconditions += 1
+    return newstate
+
+# method(state, *task[1:]), counted
+def apply_method(method, state, task, **kwargs):
+    if not STATS.enabled:
+        return method(state, *task[1:], **kwargs)
+    start = time.time()
+    decompositions = method(state, *task[1:], **kwargs)
+    STATS.add_task(task[0], time.time() - start)
+    STATS.decompositions += 1
+    return decompositions
+
+def counted_deepcopy(x):
+    if STATS.enabled:
+        STATS.deepcopies += 1
+    return copy.deepcopy(x)
+
+def count_pruned(n=1):
+    if STATS.enabled:
+        STATS.pruned += n
+
+
 ############################################################
 # Original pyhop
 # kgu: Note that the slight modifications:
@@ -250,7 +605,7 @@ def seek_plan(state,tasks,plan,depth,verbose=0):
     if task1[0] in operators:
         if verbose>2: print('depth {} action {}'.format(depth,task1))
         operator = operators[task1[0]]
-        newstate = operator(copy.deepcopy(state),*task1[1:])
+        newstate = apply_operator(operator, counted_deepcopy(state), task1)
         if verbose>2:
             print('depth {} new state:'.format(depth))
             print_state(newstate)
@@ -262,7 +617,7 @@ def seek_plan(state,tasks,plan,depth,verbose=0):
         if verbose>2: print('depth {} method instance {}'.format(depth,task1))
         relevant = methods[task1[0]]
         for method in relevant:
-            subtasks = method(state,*task1[1:])[0]
+            subtasks = apply_method(method, state, task1)[0]
             # Can't just say "if subtasks:", because that's wrong if subtasks == []
             if verbose>2:
                 print('depth {} new tasks: {}'.format(depth,subtasks))
@@ -332,7 +687,7 @@ def seek_plan_2(state,tasks,plan,depth,verbose=0):
     task1 = tasks[0]
     if task1[0] in operators:
         operator = operators[task1[0]]
-        newstate = operator(copy.deepcopy(state),*task1[1:])
+        newstate = apply_operator(operator, counted_deepcopy(state), task1)
         if newstate:
             # Operator Execution complete
             return ([task1], newstate) # Return (Plan, newsate) pair
@@ -340,11 +695,11 @@ def seek_plan_2(state,tasks,plan,depth,verbose=0):
     elif task1[0] in methods:
         relevant = methods[task1[0]]
         for method in relevant:
-            subtasks = method(state,*task1[1:])
+            subtasks = apply_method(method, state, task1)
             if subtasks != False:
-                backup_state = copy.deepcopy(state)
+                backup_state = counted_deepcopy(state)
                 for subtask in subtasks: # For each of the decomposed tasks:
-                    solution = seek_plan_2(copy.deepcopy(state), [subtask], plan, depth+1, verbose)
+                    solution = seek_plan_2(counted_deepcopy(state), [subtask], plan, depth+1, verbose)
                     if solution != False:
                         (partial_plan, newstate) = solution
                         state = newstate
@@ -368,12 +723,12 @@ def seek_plan_all(state,tasks,plan,depth,verbose=0,all_plans=False):
     if verbose>2:print(depth, 'current tasks: ', tasks, 'all_plans=', all_plans)
     plans = []
     if len(tasks) > 1:
-        this_solutions = seek_plan_all(copy.deepcopy(state), [tasks[0]], [], depth+1, verbose, all_plans)
+        this_solutions = seek_plan_all(state.copy(), [tasks[0]], [], depth+1, verbose, all_plans)
         if this_solutions[0] != False:
             for solution in this_solutions:
                 (plan, state_1) = solution
                 prev_state = state if (len(plan) == 0) else state_1[-1]
-                solutions_2 = seek_plan_all(copy.deepcopy(prev_state), tasks[1:], [], depth+1, verbose, all_plans)
+                solutions_2 = seek_plan_all(prev_state.copy(), tasks[1:], [], depth+1, verbose, all_plans)
                 if solutions_2[0] != False:
                     for solution2 in solutions_2:
                         (plan2, state_2) = solution2
@@ -387,7 +742,7 @@ def seek_plan_all(state,tasks,plan,depth,verbose=0,all_plans=False):
         task1 = tasks[0]
         if task1[0] in operators:
             operator = operators[task1[0]]
-            newstate = operator(copy.deepcopy(state),*task1[1:])
+            newstate = apply_operator(operator, state.copy(), task1)
             if newstate:
                 return [([task1], [newstate])]
             else:
@@ -396,17 +751,17 @@ def seek_plan_all(state,tasks,plan,depth,verbose=0,all_plans=False):
             relevant = methods[task1[0]]
             for method in relevant: # All related methods
                 # Returns the set of possible decompositions, in increasing heuristic cost
-                decompositions = method(state,*task1[1:])
+                decompositions = apply_method(method, state, task1)
                 
                 # If we don't care about optimality, then shuffle the decompositions
                 if state.rand and (not all_plans):
                     # shuffle the decompositions
-                    random.shuffle(decompositions) #TODO: This is not right
+                    get_rng(state).shuffle(decompositions) #TODO: This is not right
 
                 for subtasks in decompositions: # Try each decomposition
                     # Solutions: the number of ways to acomplish a given sequence of subtasks
                     # All solutions have OR relationship
-                    solutions = seek_plan_all(copy.deepcopy(state), subtasks, [], depth+1, verbose, all_plans)
+                    solutions = seek_plan_all(state.copy(), subtasks, [], depth+1, verbose, all_plans)
                     if solutions[0] != False:
                         plans = plans + solutions
                         if not all_plans:
@@ -423,78 +778,155 @@ def seek_plan_all(state,tasks,plan,depth,verbose=0,all_plans=False):
 # This is a quick modification of the original planner
 # Returns the first plan found. 
 # Additions: multiple decomposition; heuristics for decomposing; single result
+# The search is iterative: tasks, actions and states are kept in linked (head, rest)
+# cells so that extending them is O(1), and each method task pushes a choice point
+# onto an explicit stack instead of recursing.
 def seek_plan_v13(state,tasks,actions,pstates,depth,verbose=0):
     """
     Workhorse for pyhop. state and tasks are as in pyhop.
-    - plan is the current partial plan.
-    - depth is the recursion depth, for use in debugging
+    - actions and pstates are the current partial plan and its states.
+    - depth is the starting depth, for use in debugging
     - verbose is whether to print debugging messages
     """
-    if verbose>1: print('depth {} tasks {} actions {} pstates {}'.format(depth,tasks, actions, pstates))
-    if tasks == []:
-        if verbose>2: print('depth {} returns plan {}'.format(depth,(actions, pstates)))
-        return [(actions, pstates)]
-    task1 = tasks[0]
-    if task1[0] in operators:
-        if verbose>2: print('depth {} action {}'.format(depth,task1))
-        operator = operators[task1[0]]
-        newstate = operator(copy.deepcopy(state),*task1[1:])
-        if verbose>2:
-            print('depth {} new state:'.format(depth))
-            # print_state(newstate)
-        if newstate:
-            prev_state = copy.deepcopy(newstate)
-            solution = seek_plan_v13(newstate,tasks[1:],actions+[task1],pstates+[prev_state],depth+1,verbose)
-            if solution != False:
-                return solution
-    if task1[0] in methods:
-        if verbose>2: print('depth {} method instance {}'.format(depth,task1))
-        relevant = methods[task1[0]]
-        for method in relevant:
-            # Gets a set of decomp in increasing expected cost order
-            # individual methods takes care of the randomness. 
-            # If two decompositions have the expected cost, then shuffle
-            decompositions = method(state,*task1[1:], rand=state.rand)
-            for subtasks in decompositions:
-                # Can't just say "if subtasks:", because that's wrong if subtasks == []
-                if verbose>2:
-                    print('depth {} new tasks: {}'.format(depth,subtasks))
-                if subtasks != False:
-                    solution = seek_plan_v13(state,subtasks+tasks[1:],actions,pstates,depth+1,verbose)
-                    if solution[0] != False:
-                        return solution
-    if verbose>2: print('depth {} returns failure'.format(depth))
-    return [False]
+    tasks = linked_push(tasks, None)
+    actions = linked_push(reversed(actions), None)
+    pstates = linked_push(reversed(pstates), None)
+    choice_points = [] # (state, remaining tasks, actions, pstates, depth, decompositions)
+    while True:
+        # Apply operators until the next method task
+        while tasks is not None:
+            task1 = tasks[0]
+            if verbose>1: print('depth {} tasks {}'.format(depth,linked_to_list(tasks)))
+            if task1[0] in operators:
+                if verbose>2: print('depth {} action {}'.format(depth,task1))
+                operator = operators[task1[0]]
+                newstate = apply_operator(operator, state.copy(), task1)
+                if newstate:
+                    actions = (task1, actions)
+                    pstates = (newstate.copy(), pstates)
+                    state = newstate
+                    tasks = tasks[1]
+                    depth += 1
+                    continue
+            if task1[0] in methods:
+                if verbose>2: print('depth {} method instance {}'.format(depth,task1))
+                choice_points.append((state, tasks[1], actions, pstates, depth, decompose(state, task1)))
+            elif verbose>2: print('depth {} returns failure'.format(depth))
+            break
+        else:
+            plan = (linked_to_list(actions)[::-1], linked_to_list(pstates)[::-1])
+            if verbose>2: print('depth {} returns plan {}'.format(depth,plan))
+            return [plan]
+
+        # Backtrack to the most recent choice point with a decomposition left
+        while choice_points:
+            (state, rest, actions, pstates, depth, decompositions) = choice_points[-1]
+            subtasks = next(decompositions, False)
+            if subtasks is not False:
+                if verbose>2: print('depth {} new tasks: {}'.format(depth,subtasks))
+                tasks = linked_push(subtasks, rest)
+                depth += 1
+                break
+            if verbose>2: print('depth {} returns failure'.format(depth))
+            choice_points.pop()
+        else:
+            return [False]
+
+# Yields the usable decompositions of a method task lazily, one method at a time.
+# Gets a set of decomp in increasing expected cost order
+# individual methods takes care of the randomness. 
+# If two decompositions have the expected cost, then shuffle
+def decompose(state, task):
+    for method in methods[task[0]]:
+        for subtasks in apply_method(method, state, task, rand=state.rand):
+            # Can't just say "if subtasks:", because that's wrong if subtasks == []
+            if subtasks != False:
+                yield subtasks
+            else:
+                count_pruned()
+
+# Helpers for the linked (head, rest) sequences used by seek_plan_v13; None is empty
+def linked_push(items, rest):
+    for item in reversed(list(items)):
+        rest = (item, rest)
+    return rest
+
+def linked_to_list(linked):
+    to_return = []
+    while linked is not None:
+        to_return.append(linked[0])
+        linked = linked[1]
+    return to_return
 
 
 """
 Below is a rescursive seek-plan that finds all plans and keeps track of subproblems 
 that have been already solved. (It was an attempt to amortization)
 """
-PLAN_LIBRARY = {} # Maps (Task, state) to an array of Plans
+class PlanLibrary():
+    """
+    Size-bounded LRU cache mapping (task, state) to the list of plans found for it.
+    States hash by their fingerprint, so lookups do not walk the state.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.plans = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.plans)
+
+    def get(self, key):
+        plans = self.plans.pop(key, None)
+        if plans is None:
+            self.misses += 1
+            return None
+        self.plans[key] = plans # Most recently used goes last
+        self.hits += 1
+        return plans
+
+    def put(self, key, plans):
+        self.plans.pop(key, None)
+        self.plans[key] = plans
+        while len(self.plans) > self.max_size:
+            self.plans.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.plans.clear()
+
+    def stats(self):
+        return {'size': len(self.plans), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __repr__(self):
+        return "PlanLibrary({})".format(self.stats())
+
+PLAN_LIBRARY = PlanLibrary() # Used when seek_plan_all_r is not given a library
 def reset_plan_library():
-    global PLAN_LIBRARY
-    PLAN_LIBRARY = {}
+    PLAN_LIBRARY.clear()
 
-def seek_plan_all_r(state,tasks,plan,depth,verbose=0, all_plans=False):
+def seek_plan_all_r(state,tasks,plan,depth,verbose=0, all_plans=False, library=None):
 
     if verbose>2:print(depth, 'current tasks: ', tasks, 'all_plans=', all_plans)
 
-    global NUM_RECURSE_CALLS
-    NUM_RECURSE_CALLS += 1 # For benchmarking 
+    if library is None:
+        library = PLAN_LIBRARY
     plans = []
 
     # When given a sequence of tasks, we reduce the problem to finding all possible 
     # solutions for each task and are linked together by the new states between the 
     # task transitions
     if len(tasks) > 1:
-        this_solutions = seek_plan_all_r(copy.deepcopy(state), [tasks[0]], [], depth+1, verbose, all_plans)
+        this_solutions = seek_plan_all_r(state.copy(), [tasks[0]], [], depth+1, verbose, all_plans, library)
         if this_solutions[0] != False:
             for solution in this_solutions:
                 if verbose>2:print(depth, 'one plan:', solution)
                 (plan, state_1) = solution
                 if verbose>2:print('remaining tasks:', tasks[1:])
-                solutions_2 = seek_plan_all_r(copy.deepcopy(state_1[-1]), tasks[1:], [], depth+1, verbose, all_plans)
+                prev_state = state if (len(plan) == 0) else state_1[-1]
+                solutions_2 = seek_plan_all_r(prev_state.copy(), tasks[1:], [], depth+1, verbose, all_plans, library)
                 if solutions_2[0] != False:
                     for solution2 in solutions_2:
                         (plan2, state_2) = solution2
@@ -509,17 +941,17 @@ def seek_plan_all_r(state,tasks,plan,depth,verbose=0, all_plans=False):
         task1 = tasks[0]
 
         # Check if the current subproblem has already been solved
-        global PLAN_LIBRARY
-
-        if (task1, state) in PLAN_LIBRARY:
+        cached = library.get((task1, state))
+        if cached is not None:
             if verbose>2: print(depth, 'skipped recursion for task:{} state:{}'.format(task1, state))
+            count_pruned()
             # PLAN LIBRARY maps to a list of possible plans
-            return PLAN_LIBRARY[(task1, state)] 
+            return cached
 
         # When current task is an operator
         if task1[0] in operators:
             operator = operators[task1[0]]
-            newstate = operator(copy.deepcopy(state),*task1[1:])
+            newstate = apply_operator(operator, state.copy(), task1)
             if newstate:
                 return [([task1], [newstate])]
             else:
@@ -530,28 +962,32 @@ def seek_plan_all_r(state,tasks,plan,depth,verbose=0, all_plans=False):
             if verbose>2: print ('\t is method')
             relevant = methods[task1[0]]
             for method in relevant: # All related methods
-                if all_plans:
-                    decompositions = method(state,*task1[1:], all_decomp=all_plans) # Returns the set of possible decompositions
-                else:
-                    decompositions = [ method(state,*task1[1:], all_decomp=all_plans) ]
+                # Returns the set of possible decompositions, in increasing heuristic cost
+                decompositions = apply_method(method, state, task1, rand=state.rand)
                 if verbose>2: print(depth, 'decomposed {} into \n\t{}'.format(task1, decompositions))
-                if decompositions[0] != False:
-                    for subtasks in decompositions: # For each decomposition
-                        # Solutions: the number of ways to acomplish a given sequence of subtasks
-                        # All solutions have OR relationship
-                        solutions = seek_plan_all_r(copy.deepcopy(state), subtasks, [], depth+1, verbose, all_plans)
-                        if solutions[0] != False:
-                            plans = plans + solutions
+                for subtasks in decompositions: # For each decomposition
+                    if subtasks == False:
+                        count_pruned()
+                        continue
+                    # Solutions: the number of ways to acomplish a given sequence of subtasks
+                    # All solutions have OR relationship
+                    solutions = seek_plan_all_r(state.copy(), subtasks, [], depth+1, verbose, all_plans, library)
+                    if solutions[0] != False:
+                        plans = plans + solutions
+                        if not all_plans:
+                            break
+                if plans and not all_plans:
+                    break
 
 
     if tasks == []:
-        return [([], [state])]
+        return [([], [])]
 
     if plans == []:
         return [False]
     else: 
         # print(depth, 'found plan')
-        PLAN_LIBRARY[(task1, state)] = plans
+        library.put((task1, state.copy()), plans) # Keyed on a snapshot, the caller may edit state later
         if verbose >2: 
             print('added task {} to plan library'.format(task1))
         return plans
@@ -574,19 +1010,19 @@ def seek_plantrees(state, tasks, root, depth, verbose=0, rand=False):
     
     if len(tasks) > 1:
         firstNode = PlanNode(tasks[0], None)
-        first_roots = seek_plantrees(copy.deepcopy(state), [tasks[0]], root, depth+1, verbose)        
+        first_roots = seek_plantrees(state.copy(), [tasks[0]], root, depth+1, verbose)        
         if first_roots[0] == None:
             return [None]
         if verbose: print("\tfound {} plan(s) for first task {}".format(len(first_roots), tasks[0]))
         for new_root in first_roots:
-            rest_plans = seek_plantrees(copy.deepcopy(new_root.get_after_state()), tasks[1:], new_root, depth+1, verbose)
+            rest_plans = seek_plantrees(new_root.get_after_state().copy(), tasks[1:], new_root, depth+1, verbose)
             if rest_plans[0] != None:
                 planTrees += rest_plans
             else: return [None]
         return planTrees
 
     if len(tasks) == 0:
-        to_return = copy.deepcopy(root)
+        to_return = counted_deepcopy(root)
         return [to_return]
 
     task = tasks[0]
@@ -594,24 +1030,24 @@ def seek_plantrees(state, tasks, root, depth, verbose=0, rand=False):
     if task[0] in operators:
         if verbose: print("\t task {} is an operator".format(task[0]))
         operator = operators[task[0]]
-        newstate = operator(copy.deepcopy(state),*task[1:])
+        newstate = apply_operator(operator, state.copy(), task)
         if newstate:
             # Create Leaf Node
-            to_return = copy.deepcopy(root)
+            to_return = counted_deepcopy(root)
             leafNode = PlanNode(task, PlanNode.OPERATOR)
-            leafNode.set_before_state(copy.deepcopy(state))
-            leafNode.set_after_state(copy.deepcopy(newstate))
+            leafNode.set_before_state(state.copy())
+            leafNode.set_after_state(newstate.copy())
             leafNode.set_parent(to_return)
             leafNode.cost = 1
             to_return.add_child(leafNode)
-            to_return.set_after_state(copy.deepcopy(newstate))
+            to_return.set_after_state(newstate.copy())
             return [to_return]
 
     elif task[0] in methods:
         if verbose: print("\t task {} is a method".format(task[0]))
         relevant = methods[task[0]]
         for method in relevant: # All related methods
-            decompositions = method(state,*task[1:]) # Returns the set of possible decompositions
+            decompositions = apply_method(method, state, task) # Returns the set of possible decompositions
             if decompositions[0] == False:
                 # Cannot use this relevant method definition
                 continue
@@ -621,13 +1057,13 @@ def seek_plantrees(state, tasks, root, depth, verbose=0, rand=False):
                 methodNode.set_before_state(state)
                 methodNode.set_after_state(state)
 
-                possible_plans = seek_plantrees(copy.deepcopy(state), subtasks, copy.deepcopy(methodNode), depth+1, verbose)
+                possible_plans = seek_plantrees(state.copy(), subtasks, counted_deepcopy(methodNode), depth+1, verbose)
                 if verbose: 
                     print("depth {}; method task found {} new plans for task {}\
                     \n\twith decomposition {}".format(depth, len(possible_plans), task, subtasks))
                 if possible_plans[0] != None:
                     for node in possible_plans: # Each node is a way of completeing the subtasks
-                        to_return = copy.deepcopy(root)
+                        to_return = counted_deepcopy(root)
                         assert(node.parent == None)
                         node.set_parent(to_return)
                         to_return.add_child(node)
@@ -701,114 +1137,221 @@ def seek_bb_r(state, tasks, parent, root=None):
 
     return to_return
 
-import heapq
+import heapq, itertools
 from plantree import *
 import random_rovers_world as rrw
 from solution import Solution
 
-def seek_bb(state, tasks, verbose=0, all_plans=True):
-
-    if verbose: 
-        print("SEEK_BB: solving problem for task {} and state:".format(tasks))
-        print("STATE:")
-        rrw.print_board(state)
-        print_state(state)
-        print("...")
-        print("VISITED: ", state.visited)
-    
-    root = andNode(state, None, tasks)
-    openset = []
-
-    # Add top-level tasks to openset # AND
-    left_node = None
-    for task in tasks:
-        # Create node to represent task
-        task_node = orNode(state, root, [task])
-        if left_node != None:
-            task_node.left = left_node
-        left_node = task_node
+"""
+Openset of seek_bb(best_first=True): a heap of nodes keyed by plan_lower_bound. It
+takes the list calls seek_bb and plantree make: among nodes with equal bounds, nodes
+added with append come out first (newest first), and nodes added with insert(0, ...)
+last (oldest first), as they would from the list.
+"""
+class PriorityOpenSet(object):
 
-        # Add as part of AND children of root
-        root.children.append(task_node)
+    def __init__(self, key):
+        self.key = key
+        self.heap = []
+        self.counter = itertools.count()
 
-        # Add to openset
-        openset.append(task_node)
+    def append(self, node):
+        heapq.heappush(self.heap, (self.key(node), -next(self.counter), node))
 
-    best_cost = sys.maxint
+    def insert(self, index, node):
+        heapq.heappush(self.heap, (self.key(node), next(self.counter), node))
 
-    # Iterate to decompose until openset is done.
-    while len(openset) != 0:
+    def pop(self):
+        return heapq.heappop(self.heap)[-1]
 
-        if root.success and not all_plans:
-            break
+    def __len__(self):
+        return len(self.heap)
 
-        if verbose: print("root cost:{}".format(root.cost))
+    def __repr__(self):
+        return "PriorityOpenSet({})".format([entry[-1] for entry in sorted(self.heap)])
 
-        cur_node = openset.pop()
-        if verbose: print("Tasks: {}; Parent: {}; Cost: {}".format(cur_node.name, cur_node.parent, cur_node.cost))
-        
-        if cur_node.tasks == []:
-            # Basecase
-            cur_node.success = True
-            cur_node.completed = True
-            cur_node.cost = 0
-            if verbose: print("right", cur_node.right)
-            if verbose: print("parent-right", cur_node.parent.right)
-            cur_node.parent.update(cur_node, openset)
-            continue
-
-        # Otherwise, decompose this node and add new nodes to queue
-        tasks = cur_node.tasks
-        if isinstance(cur_node, andNode): 
-            if verbose: print("is decomposition")
-            left_node = None
-            for task in tasks:
-                child_node = orNode(cur_node.before_state, cur_node, [task])
-                cur_node.add_child(child_node)
-            openset.append(cur_node.children[0])
-        elif isinstance(cur_node, orNode):
-            task = tasks[0]
-            if task[0] in methods:
-                if verbose: print("is method")
-                relevant = methods[task[0]]
-                for method in relevant:
-                    decompositions = method(cur_node.before_state, *task[1:]) # retruns the set of possible decomps
-                    if verbose: print("decompositions: {}".format(decompositions))
-                    if decompositions[0] == False:
-                        # This node failed
-                        cur_node.completed = True
-                        cur_node.success = False
-                        cur_node.parent.update(cur_node, openset)
-                        continue
-                    for sequence in decompositions:
-                        child_node = andNode(cur_node.before_state, cur_node, sequence)
-                        cur_node.add_child(child_node)
-                    openset.append(cur_node.children[0])
-                    
-            elif task[0] in operators:
-                if verbose: print("is operators")
-                cur_node.update(None, openset)
+# Lower bound on the cost of task. Only operators are bounded without a state to start from.
+def task_lower_bound(state, task, at_state=True):
+    if task[0] in operators:
+        return state.cost_func(state, task)
+    if at_state and task[0] in estimates:
+        return estimates[task[0]](state, *task[1:])
+    return 0
 
-        if verbose: print("ACTIVESET: ", openset)
-        # raw_input("...")
+"""
+Lower bound on the cost of any complete plan through node: the cost of the siblings
+already planned along its path to the root (g), plus the estimates of its own tasks
+from its before_state and of the siblings still to plan (h).
+"""
+def plan_lower_bound(node):
+    bound = 0
+    if len(node.tasks) > 0:
+        bound += task_lower_bound(node.before_state, node.tasks[0])
+        for task in node.tasks[1:]:
+            bound += task_lower_bound(node.before_state, task, at_state=False)
+    child = node
+    while child.parent != None:
+        if isinstance(child.parent, andNode):
+            for sibling in child.parent.children:
+                if sibling is child:
+                    continue
+                if sibling.completed:
+                    bound += sibling.cost
+                else:
+                    bound += task_lower_bound(node.before_state, sibling.task, at_state=False)
+        child = child.parent
+    return bound
 
+BOUND_TOLERANCE = 1e-9 # Bounds and costs sum the same floats in different orders
 
-    
+"""
+A seek_bb search that can be run in installments. run() expands nodes until the openset
+is exhausted, or until a budget runs out once the root has a plan: a deadline (a
+time.time() value) or a number of expansions. The root is returned either way, with
+the best plans found so far; running again resumes the search and can only improve them.
+
+With best_first, the openset is a PriorityOpenSet: nodes are expanded in order of
+plan_lower_bound, and once the root has a plan, a node whose bound exceeds the root's
+cost fails without being expanded (with all_plans, nodes that tie are still expanded).
+"""
+class BBSearch(object):
+
+    def __init__(self, state, tasks, verbose=0, all_plans=True, best_first=False):
+        if verbose: 
+            print("SEEK_BB: solving problem for task {} and state:".format(tasks))
+            print("STATE:")
+            rrw.print_board(state)
+            print_state(state)
+            print("...")
+            print("VISITED: ", state.visited)
+
+        if best_first and hasattr(state, 'cost'):
+            # Estimates memoize on the cost table (navigation.cost_lower_bound); make the memo
+            # before the nodes copy the state, so that all of them share it
+            state.memo('cost')
+        self.verbose = verbose
+        self.all_plans = all_plans
+        self.best_first = best_first
+        self.root = andNode(state, None, tasks)
+        self.openset = PriorityOpenSet(plan_lower_bound) if best_first else []
+        self.num_expansions = 0
+
+        # Add top-level tasks to openset # AND
+        left_node = None
+        for task in tasks:
+            # Create node to represent task
+            task_node = orNode(state, self.root, [task])
+            if left_node != None:
+                task_node.left = left_node
+            left_node = task_node
+
+            # Add as part of AND children of root
+            self.root.children.append(task_node)
+
+            # Add to openset
+            self.openset.append(task_node)
+
+    # True once no further run can change the root
+    def done(self):
+        return len(self.openset) == 0
+
+    def run(self, deadline=None, max_expansions=None):
+        root = self.root
+        openset = self.openset
+        verbose = self.verbose
+        best_first = self.best_first
+        stats = STATS
+        if max_expansions != None:
+            max_expansions += self.num_expansions
+
+        # Iterate to decompose until openset is done.
+        while len(openset) != 0:
+            if stats.enabled: stats.saw_openset(len(openset))
+
+            if root.success and not self.all_plans:
+                count_pruned(len(openset))
+                self.openset = openset = []
+                break
+
+            if root.success and ((deadline != None and time.time() >= deadline) or \
+                    (max_expansions != None and self.num_expansions >= max_expansions)):
+                break # Out of budget; resumed by the next run
+
+            if verbose: print("root cost:{}".format(root.cost))
+
+            cur_node = openset.pop()
+            self.num_expansions += 1
+            root.generation += 1
+            if verbose: print("Tasks: {}; Parent: {}; Cost: {}".format(cur_node.name, cur_node.parent, cur_node.cost))
+
+            if best_first and root.success and plan_lower_bound(cur_node) > root.cost + BOUND_TOLERANCE:
+                # Cannot improve on the root's plan
+                cur_node.success = False
+                cur_node.completed = True
+                cur_node.cost = sys.maxint
+                count_pruned()
+                cur_node.parent.update(cur_node, openset)
+                continue
 
-    # one_plan = root.get_plan()
+            if cur_node.tasks == []:
+                # Basecase
+                cur_node.success = True
+                cur_node.completed = True
+                cur_node.cost = 0
+                if verbose: print("right", cur_node.right)
+                if verbose: print("parent-right", cur_node.parent.right)
+                cur_node.parent.update(cur_node, openset)
+                continue
 
-    if verbose:
-        print("root: ", root.get_string())
-        print("get_num_plans:", root.get_num_plans())
-        print("num_opt_plans:", root.get_num_opt_plans())
-        plans = root.get_all_opt_plans()
-        print("all opt plans: {}".format(plans))
-        # for p in plans:
-        #     print("opt p", p[0])
-    
-    
-    # return [one_plan]
-    return root
+            # Otherwise, decompose this node and add new nodes to queue
+            tasks = cur_node.tasks
+            if isinstance(cur_node, andNode): 
+                if verbose: print("is decomposition")
+                left_node = None
+                for task in tasks:
+                    child_node = orNode(cur_node.before_state, cur_node, [task])
+                    cur_node.add_child(child_node)
+                openset.append(cur_node.children[0])
+            elif isinstance(cur_node, orNode):
+                task = tasks[0]
+                if task[0] in methods:
+                    if verbose: print("is method")
+                    relevant = methods[task[0]]
+                    for method in relevant:
+                        decompositions = apply_method(method, cur_node.before_state, task) # retruns the set of possible decomps
+                        if verbose: print("decompositions: {}".format(decompositions))
+                        if decompositions[0] == False:
+                            # This node failed
+                            cur_node.completed = True
+                            cur_node.success = False
+                            cur_node.parent.update(cur_node, openset)
+                            continue
+                        for sequence in decompositions:
+                            child_node = andNode(cur_node.before_state, cur_node, sequence)
+                            cur_node.add_child(child_node)
+                        openset.append(cur_node.children[0])
+                        
+                elif task[0] in operators:
+                    if verbose: print("is operators")
+                    cur_node.update(None, openset)
+
+            if verbose: print("ACTIVESET: ", openset)
+            # raw_input("...")
+
+        if verbose:
+            print("root: ", root.get_string())
+            print("get_num_plans:", root.get_num_plans())
+            print("num_opt_plans:", root.get_num_opt_plans())
+            plans = root.get_all_opt_plans()
+            print("all opt plans: {}".format(plans))
+            # for p in plans:
+            #     print("opt p", p[0])
+
+        return root
+
+""" Runs a BBSearch; see BBSearch for the budget and best_first """
+def seek_bb(state, tasks, verbose=0, all_plans=True, best_first=False, deadline=None, max_expansions=None):
+    return BBSearch(state, tasks, verbose, all_plans, best_first).run(deadline, max_expansions)
 
 
 
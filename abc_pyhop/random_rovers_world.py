@@ -15,6 +15,7 @@ from pyhop import *
 import random
 import time
 import math
+import array
 import rovers_world_operators
 import rovers_world_methods
 import numpy
@@ -196,14 +197,15 @@ the global time-step of the simulation.
 def get_uncertainty_fun(state, num_step, a_prob, sequence=None, randoms=None):
 
     if sequence == None and randoms == None:
+        rng = get_rng(state)
         sequence = [] # Locations of interest
-        randoms = [random.random() * state.RAND_RANGE for i in range(num_step)]
+        randoms = [rng.random() * state.RAND_RANGE for i in range(num_step)]
 
         # TODO: get gaussian dist around rand-range
         # randoms = [state.RAND_RANGE for i in range(num_step)]
 
         for idx in range(num_step):
-            toggle = (random.random() < a_prob)
+            toggle = (rng.random() < a_prob)
             if toggle:
                 available_spaces = state.loc.keys()
                 occupied = set()
@@ -213,7 +215,7 @@ def get_uncertainty_fun(state, num_step, a_prob, sequence=None, randoms=None):
                 for loc in occupied: 
                     available_spaces.remove(loc)
 
-                sequence.append(random.choice(available_spaces))
+                sequence.append(rng.choice(available_spaces))
             else: sequence.append(None)
 
         state.RAND_PROB = a_prob
@@ -226,7 +228,7 @@ def get_uncertainty_fun(state, num_step, a_prob, sequence=None, randoms=None):
             # Make all uncertainties
             for idx in range(len(state.sequence)):
                 if state.sequence[idx] != None:
-                    in_state.cost[state.sequence[idx]] += state.randoms[idx]
+                    in_state.set_item('cost', state.sequence[idx], in_state.cost[state.sequence[idx]] + state.randoms[idx])
 
     return to_return
 
@@ -240,7 +242,8 @@ something about the world. Possible changes are:
 """
 def generate_uncertainty(state, a_prob=1, verbose=False):
     
-    toggle_state = (random.random() < a_prob)
+    rng = get_rng(state)
+    toggle_state = (rng.random() < a_prob)
 
     if toggle_state:
         # First find available spaces
@@ -253,8 +256,8 @@ def generate_uncertainty(state, a_prob=1, verbose=False):
             available_spaces.remove(loc)
 
         # Find a random location and flip the boolean
-        rand_loc = random.choice(available_spaces)
-        state.loc_available[rand_loc] = not state.loc_available[rand_loc]
+        rand_loc = rng.choice(available_spaces)
+        state.mutable('loc_available')[rand_loc] = not state.loc_available[rand_loc]
 
         if verbose: print('changed location {} availability to {}'.format(rand_loc, state.loc_available[rand_loc]))
 
@@ -269,7 +272,7 @@ def act(state, action):
     global operators
     assert(task_name in operators)
     operator = operators[task_name]
-    new_state = operator(copy.deepcopy(state), *action[1:])
+    new_state = operator(state.copy(), *action[1:])
     return new_state
 
 """
@@ -295,17 +298,30 @@ Below is a helper function that takes in the state and prints it in a board
 def print_board(state):
     print(print_board_str(state))
 
+"""
+Wraps a state so that its board is only rendered when converted to a string, e.g. as
+a logging argument: log.info("world:\n%s", BoardStr(state)) costs nothing when INFO is off.
+"""
+class BoardStr(object):
+
+    def __init__(self, state):
+        self.state = state
+
+    def __str__(self):
+        return print_board_str(self.state)
+
 def print_board_str(state): # Makes the string output
     if state == None:
         return 'State is None'
         
-    x = state.prop["num_row"]
-    y = state.prop["num_col"]
+    grid = state.grid
+    x = grid.num_row
+    y = grid.num_col
 
     occupied = {}
     for (thing, loc) in state.at.items():
         if loc != None:
-            (i, j) = state.loc[loc]
+            (i, j) = (grid.x[loc], grid.y[loc])
             if((i, j) in occupied):
                 occupied[(i, j)].append(thing)
             else:
@@ -326,6 +342,93 @@ def print_board_str(state): # Makes the string output
 
     return to_print
 
+"""
+Flat per-cell tables for a num_row x num_col board. Cells are numbered from 1, row by
+row, so every table is indexed by cell id and slot 0 is unused. The world's cost is
+kept in the same layout.
+"""
+class Grid(object):
+
+    def __init__(self, num_row, num_col):
+        self.num_row = num_row
+        self.num_col = num_col
+        self.num_cells = num_row * num_col
+        self.x = array.array('i', [0] * (self.num_cells + 1)) # Row of each cell
+        self.y = array.array('i', [0] * (self.num_cells + 1)) # Column of each cell
+        self.neighbors = [()] # Above, below, left, right; the order A* expands them in
+        for idx in range(1, self.num_cells + 1):
+            (i, j) = divmod(idx - 1, num_col)
+            self.x[idx] = i
+            self.y[idx] = j
+            neighbors = []
+            if i != 0: neighbors.append(idx - num_col)
+            if i != num_row - 1: neighbors.append(idx + num_col)
+            if j != 0: neighbors.append(idx - 1)
+            if j != num_col - 1: neighbors.append(idx + 1)
+            self.neighbors.append(tuple(neighbors))
+        self.adjacent = [frozenset(n) for n in self.neighbors]
+        self.distances = {} # sink -> manhattan distance of every cell to sink
+        self.stencils = {} # range -> cells visible from every cell
+
+    # Manhattan distance of every cell to sink, computed once per sink
+    def manhattan_to(self, sink):
+        distances = self.distances.get(sink)
+        if distances == None:
+            (sink_x, sink_y) = (self.x[sink], self.y[sink])
+            distances = array.array('i', [0] * (self.num_cells + 1))
+            for idx in range(1, self.num_cells + 1):
+                distances[idx] = abs(self.x[idx] - sink_x) + abs(self.y[idx] - sink_y)
+            self.distances[sink] = distances
+        return distances
+
+    # Cells visible from cell (see AgentMind.visible), in cell order; computed once per range
+    def visible_from(self, cell, range):
+        stencil = self.stencils.get(range)
+        if stencil == None:
+            r = 0
+            while (r + 1) ** 2 <= range:
+                r += 1
+            offsets = [(dx, dy) for dx in xrange(-r, r + 1) for dy in xrange(-r, r + 1) if dx ** 2 + dy ** 2 <= range]
+            stencil = [()]
+            for idx in xrange(1, self.num_cells + 1):
+                (x, y) = (self.x[idx], self.y[idx])
+                stencil.append(tuple(sorted((x + dx) * self.num_col + (y + dy) + 1 for (dx, dy) in offsets
+                    if 0 <= x + dx < self.num_row and 0 <= y + dy < self.num_col)))
+            self.stencils[range] = stencil
+        return stencil[cell]
+
+"""
+The part of a rovers world that no operator changes: board topology, objects
+and agent capabilities. It is built once per problem and shared by every
+State copied from that world (see State.__getattr__), so it is never copied
+or compared again.
+"""
+class WorldStatic(object):
+    ATTRS = ['name', 'BOARD_X', 'BOARD_Y', 'NUM_SOILS', 'NUM_ROCKS', 'prop', 'loc',
+        'is_agent', 'is_lab', 'is_lander', 'stores', 'soils', 'rocks',
+        'equipped_for_imaging', 'equipped_for_rock_analysis', 'equipped_for_soil_analysis',
+        'cost_func']
+
+    # Moves the static attributes off world and attaches itself in their place
+    def __init__(self, world):
+        for attr in WorldStatic.ATTRS:
+            if attr in world.__dict__:
+                setattr(self, attr, world.__dict__.pop(attr))
+        self.grid = Grid(self.prop['num_row'], self.prop['num_col'])
+        world.__static__ = self
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, WorldStatic) and self.__dict__ == other.__dict__)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
 """
 Main funciton for generating random world
 Randomly allocate objects onto the world
@@ -442,14 +545,13 @@ def get_random_world(BOARD_X=10, BOARD_Y=10, num_agent=1, a_star=True, name=None
     # World's Location definition
     world.loc = {}
     world.loc_available = {}
-    world.cost = {}
     idx = 1
     for i in range(BOARD_X):
         for j in range(BOARD_Y):
             world.loc[idx] = (i, j)
             world.loc_available[idx] = True
-            world.cost[idx] = 0
             idx += 1
+    world.cost = array.array('d', [0] * idx) # Indexed by location, see Grid
 
 
     world.goals = {}
@@ -470,6 +572,7 @@ def get_random_world(BOARD_X=10, BOARD_Y=10, num_agent=1, a_star=True, name=None
     world.RAND_PROB = 0
 
     world.cost_func = cost_function
+    WorldStatic(world)
     return world
 
 # What is the cost of an action assuming that it can be done.
@@ -527,14 +630,13 @@ def make_world(name, BOARD_X, BOARD_Y, NUM_S, NUM_R, \
     # World's Location definition
     world.loc = {}
     world.loc_available = {}
-    world.cost = {}
     idx = 1
     for i in range(BOARD_X):
         for j in range(BOARD_Y):
             world.loc[idx] = (i, j)
             world.loc_available[idx] = True
-            world.cost[idx] = 0
             idx += 1
+    world.cost = array.array('d', [0] * idx) # Indexed by location, see Grid
     
     # Set Locations
     for obj, loc in AT.items():
@@ -609,6 +711,7 @@ def make_world(name, BOARD_X, BOARD_Y, NUM_S, NUM_R, \
     world.RAND_PROB = RAND_PROB
 
     world.cost_func = cost_function
+    WorldStatic(world)
 
     # Set uncertainty
     world.uncertainties = get_uncertainty_fun(world, None, None, 
@@ -0,0 +1,147 @@
+"""
+Simulation results as typed columns, and vectorized aggregation over them.
+Results are kept in an SQLite table (one row per simulation) and come back as a NumPy
+structured array, with one field per column of the per-simulation files written by
+run.write_result_by_simulation, plus the board size parsed from the problem name.
+"""
+import sqlite3
+import numpy as np
+
+RESULT_DTYPE = np.dtype([('problem_name', 'S64'), ('board_x', 'i4'), ('board_y', 'i4'),
+	('planner', 'S64'), ('model', 'S64'), ('CoC', 'f8'),
+	('final_cost', 'f8'), ('num_obs', 'i4'), ('num_comm', 'i4'), ('num_void', 'i4'), ('num_steps', 'i4')])
+
+def board_of(problem_name):
+	x, y = problem_name.split('_')[0:2]
+	return (int(x), int(y))
+
+# Row of RESULT_DTYPE from a tab-split line of a per-simulation file
+def parse_line(line):
+	fields = line.rstrip('\n').split('\t')[:9]
+	(problem_name, planner, model) = fields[0:3]
+	return (problem_name,) + board_of(problem_name) + (planner, model, float(fields[3]), float(fields[4])) \
+		+ tuple(int(float(f)) for f in fields[5:9])
+
+# A per-simulation file as a structured array. The file is split once and converted a
+# column at a time; files with ragged lines fall back to one line at a time.
+def read_results_file(file_name):
+	lines = open(file_name, 'r').read().splitlines()
+	fields = '\t'.join(lines).split('\t')
+	if len(fields) == 9 * len(lines):
+		columns = [fields[i::9] for i in range(9)]
+	else:
+		rows = [line.split('\t')[:9] for line in lines]
+		columns = zip(*[row for row in rows if len(row) == 9]) or [[]] * 9
+	results = np.zeros(len(columns[0]), dtype=RESULT_DTYPE)
+	if len(results) == 0:
+		return results
+	for (name, column) in zip(['problem_name', 'planner', 'model'], columns[0:3]):
+		results[name] = np.array(column)
+	for (name, column) in zip(['CoC', 'final_cost', 'num_obs', 'num_comm', 'num_void', 'num_steps'], columns[3:9]):
+		results[name] = np.fromstring('\t'.join(column), sep='\t') # Parsed in C
+	# Board size: parsed once per distinct problem
+	(names, inverse) = factorize(results['problem_name'])
+	boards = np.array([board_of(str(name)) for name in names], dtype='i4').reshape(-1, 2)
+	results['board_x'] = boards[inverse, 0]
+	results['board_y'] = boards[inverse, 1]
+	return results
+
+"""
+(uniques, inverse) of a column, as np.unique(column, return_inverse=True). Strings are
+first copied into a contiguous array only as wide as the longest one, and sorted with
+a mergesort: both make the sort several times faster on result columns.
+"""
+def factorize(column):
+	if column.dtype.kind == 'S':
+		as_bytes = np.ascontiguousarray(column).view(np.uint8).reshape(len(column), column.dtype.itemsize)
+		width = max(1, np.flatnonzero(as_bytes.any(axis=0)).max() + 1 if len(column) else 1)
+		column = column.astype('S{}'.format(width))
+	order = np.argsort(column, kind='mergesort')
+	sorted_column = column[order]
+	first = np.concatenate(([True], sorted_column[1:] != sorted_column[:-1]))
+	inverse = np.empty(len(column), dtype=np.intp)
+	inverse[order] = np.cumsum(first) - 1
+	return (sorted_column[first], inverse)
+
+class ResultStore():
+
+	def __init__(self, db_name):
+		self.conn = sqlite3.connect(db_name)
+		self.conn.executescript("""
+			CREATE TABLE IF NOT EXISTS results (
+				id INTEGER PRIMARY KEY, problem_name TEXT, board_x INTEGER, board_y INTEGER,
+				planner TEXT, model TEXT, CoC REAL,
+				final_cost REAL, num_obs INTEGER, num_comm INTEGER, num_void INTEGER, num_steps INTEGER);
+			CREATE INDEX IF NOT EXISTS results_by_params ON results (planner, model, CoC, board_x, board_y);
+			""")
+
+	def add_rows(self, rows):
+		with self.conn:
+			self.conn.executemany("INSERT INTO results ({}) VALUES ({})".format(
+				', '.join(RESULT_DTYPE.names), ', '.join(['?'] * len(RESULT_DTYPE.names))), rows)
+
+	# Same fields as run.write_result_by_simulation
+	def add(self, problem, params, simulation):
+		self.add_rows([(problem.name, problem.BOARD_X, problem.BOARD_Y,
+			params.planner.name, params.model.__name__, params.coc,
+			simulation.get_total_cost(), simulation.total_observations(), simulation.total_messages_sent(),
+			simulation.total_messages_voided(), simulation.total_steps())])
+
+	# Bulk import of a per-simulation file
+	def import_file(self, file_name):
+		self.add_rows(parse_line(line) for line in open(file_name, 'r') if len(line.split('\t')) >= 9)
+
+	# Results whose columns equal the given values (e.g. planner='Det_Astar_OnePlan'), in insertion order
+	def select(self, **where):
+		query = "SELECT {} FROM results".format(', '.join(RESULT_DTYPE.names))
+		if where:
+			query += " WHERE " + ' AND '.join('{} = ?'.format(column) for column in where.keys())
+		rows = self.conn.execute(query + " ORDER BY id", where.values()).fetchall()
+		return np.array([tuple(row) for row in rows], dtype=RESULT_DTYPE)
+
+	def __len__(self):
+		return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+	def close(self):
+		self.conn.close()
+
+"""
+Aggregates field of results over each distinct combination of the key fields.
+Returns a structured array with the key fields (groups sorted by key) followed by
+mean, median and count, computed with sorts and bincounts instead of per-group lists.
+"""
+def group_by(results, keys, field='final_cost'):
+	if len(results) == 0:
+		return np.zeros(0, dtype=[(k, results.dtype[k]) for k in keys] + \
+			[('mean', 'f8'), ('median', 'f8'), ('count', 'i8')])
+
+	# One integer code per row for its combination of keys
+	uniques = []
+	codes = []
+	for k in keys:
+		(unique, inverse) = factorize(results[k])
+		uniques.append(unique)
+		codes.append(inverse)
+	code = np.ravel_multi_index(codes, [len(u) for u in uniques])
+	(group_codes, group) = np.unique(code, return_inverse=True)
+	key_codes = np.unravel_index(group_codes, [len(u) for u in uniques])
+
+	values = results[field].astype('f8')
+	count = np.bincount(group)
+	mean = np.bincount(group, weights=values) / count
+
+	# Median: sort by (group, value), with two stable sorts; each group is then a contiguous run
+	order = np.argsort(values, kind='mergesort')
+	order = order[np.argsort(group[order], kind='mergesort')]
+	sorted_values = values[order]
+	start = np.concatenate(([0], np.cumsum(count)[:-1]))
+	median = (sorted_values[start + (count - 1) // 2] + sorted_values[start + count // 2]) / 2.0
+
+	to_return = np.zeros(len(group_codes), dtype=[(k, results.dtype[k]) for k in keys] + \
+		[('mean', 'f8'), ('median', 'f8'), ('count', 'i8')])
+	for (k, unique, key_code) in zip(keys, uniques, key_codes):
+		to_return[k] = unique[key_code]
+	to_return['mean'] = mean
+	to_return['median'] = median
+	to_return['count'] = count
+	return to_return
@@ -26,17 +26,12 @@ def empty_store_m(state, store, rover, rand=False):
 pyhop.declare_methods('empty_store',empty_store_m)
 
 def can_traverse(state, source, sink):
-	num_col = state.prop["num_col"]
-	num_row = state.prop["num_row"]
-	a = min(source, sink)
-	b = max(source, sink)
-	if (b-a == 1) and (a % num_col != 0):
-		return True
-	elif (b-a == num_col):
-		return True
+	return sink in state.grid.adjacent[source]
 
 def navigate_m(state, agent, sink, rand=False):
 	if state.a_star:
+		if state.oracle:
+			return [navigation.oracle_path(state, agent, sink)]
 		return [navigation.a_star(state, agent, sink)]
 		
 	possible_decomp = []
@@ -50,12 +45,15 @@ def navigate_m(state, agent, sink, rand=False):
 
 pyhop.declare_methods('navigate',navigate_m)
 
+# Every path is charged at least its cheapest cost
+def navigate_estimate(state, agent, sink):
+	return navigation.cost_lower_bound(state, state.at[agent], sink)
+
+pyhop.declare_estimate('navigate', navigate_estimate)
+
 # Multiple Decomp: Yes
 def navigate2_m(state, agent, source, sink, rand=False):
 	possible_decomp = []
-	source_y, source_x = state.loc[source]
-	sink_y, sink_x = state.loc[sink]
-
 	if state.at[agent] == sink:
 		# already at destination
 		possible_decomp.append([])
@@ -105,13 +103,19 @@ def get_sample_data_m(state, agent, rand=False):
 
 	if len(possible_decomp) == 0: return [False]
 	if rock_score == soil_score and rand:
-		random.shuffle(possible_decomp)
+		pyhop.get_rng(state).shuffle(possible_decomp)
 	# print("\t\tMethod:get_sample_data\t toreturn: Possible_decomp={}".format(possible_decomp))
 	return possible_decomp
 
 pyhop.declare_methods('get_sample_data',get_sample_data_m)
 
 
+# Sort key for samples: the true path cost with the distance oracle, else the A* heuristic
+def sample_distance(state, agent, sample):
+	if state.oracle:
+		return navigation.distance(state, state.at[agent], state.at[sample])
+	return navigation.heuristic(state, state.at[agent], state.at[sample])
+
 # Multiple Decomp : yes
 def get_soil_data_m(state, agent, rand=False):
 	keys = []
@@ -126,8 +130,8 @@ def get_soil_data_m(state, agent, rand=False):
 		to_return += [[('get_a_soil_data', agent, state.soil_sample[agent])]] # First
 
 	if rand: 
-		random.shuffle(keys)
-	sorted_keys = sorted(keys, key=lambda n: navigation.heuristic(state, state.at[agent], state.at[n]))
+		pyhop.get_rng(state).shuffle(keys)
+	sorted_keys = sorted(keys, key=lambda n: sample_distance(state, agent, n))
 	for k in sorted_keys:
 		to_return.append([('get_a_soil_data', agent, k)])
 
@@ -157,7 +161,7 @@ def analyze_soil_sample_m(state, rover, store, rand=False):
 		return [[]]
 
 	possible_decomp = []
-	lab = random.choice(state.is_lab.keys())
+	lab = pyhop.get_rng(state).choice(state.is_lab.keys())
 	possible_decomp.append([('navigate', rover, state.at[lab]), 
 			('set_up_soil_experiment', rover, lab),
 			('analyze_soil_sample', rover, store, lab)])
@@ -170,7 +174,7 @@ pyhop.declare_methods('analyze_soil_sample_m',analyze_soil_sample_m)
 def send_soil_data_m(state, rover, rand=False):
 	possible_decomp = []
 	if state.has_soil_analysis[rover]:
-		lander = random.choice(state.is_lander.keys())
+		lander = pyhop.get_rng(state).choice(state.is_lander.keys())
 		lander_loc = state.at[lander]
 		possible_decomp.append([('navigate', rover, lander_loc), ('communicate_data', rover, lander)])
 	else: return [False]
@@ -192,8 +196,8 @@ def get_rock_data_m(state, agent, rand=False):
 		to_return = [[('get_a_rock_data', agent, state.rock_sample[agent])]]
 
 	if rand: 
-		random.shuffle(keys)
-	sorted_keys = sorted(keys, key=lambda n: navigation.heuristic(state, state.at[agent], state.at[n]))
+		pyhop.get_rng(state).shuffle(keys)
+	sorted_keys = sorted(keys, key=lambda n: sample_distance(state, agent, n))
 	for k in sorted_keys:
 		to_return.append([('get_a_rock_data', agent, k)])
 
@@ -222,7 +226,7 @@ def analyze_rock_sample_m(state, rover, s, rand=False):
 		return [[]]
 
 	possible_decomp = []
-	lab = random.choice(state.is_lab.keys())
+	lab = pyhop.get_rng(state).choice(state.is_lab.keys())
 	possible_decomp.append([('navigate', rover, state.at[lab]), 
 			('set_up_rock_experiment', rover, lab),
 			('analyze_rock_sample', rover, s, lab)])
@@ -234,7 +238,7 @@ pyhop.declare_methods('analyze_rock_sample_m',analyze_rock_sample_m)
 def send_rock_data_m(state, rover, rand=False):
 	possible_decomp = []
 	if state.has_rock_analysis[rover]:
-		lander = random.choice(state.is_lander.keys())
+		lander = pyhop.get_rng(state).choice(state.is_lander.keys())
 		lander_loc = state.at[lander]
 		possible_decomp.append([('navigate', rover, lander_loc), ('communicate_data', rover, lander)])
 	else: return [False]
@@ -263,6 +267,24 @@ def retrieve_sample_m(state, agent, obj, rand=False):
 
 pyhop.declare_methods('retrieve_sample',retrieve_sample_m)
 
+# Navigating to the sample and sampling it, unless a sample of its kind is already held
+def retrieve_sample_estimate(state, agent, obj):
+	if (obj in state.rocks) and state.has_rock_sample[agent]:
+		return 0
+	if (obj in state.soils) and state.has_soil_sample[agent]:
+		return 0
+	if state.at[obj] == None:
+		return 0 # Taken; retrieving it fails anyway
+	return navigate_estimate(state, agent, state.at[obj]) + state.cost_func(state, ('sample', agent, None, None, obj))
+
+# Retrieving the sample, and at least communicating the data
+def get_a_sample_data_estimate(state, agent, obj):
+	return retrieve_sample_estimate(state, agent, obj) + state.cost_func(state, ('communicate_data', agent, None))
+
+pyhop.declare_estimate('retrieve_sample', retrieve_sample_estimate)
+pyhop.declare_estimate('get_a_soil_data', get_a_sample_data_estimate)
+pyhop.declare_estimate('get_a_rock_data', get_a_sample_data_estimate)
+
 
 def send_image_data_m(state, rover, objective, mode):
 	pass
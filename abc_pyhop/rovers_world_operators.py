@@ -10,22 +10,16 @@ import random_rovers_world as rrw
 Below are some helper functions for implementing the operators
 """
 def can_traverse(state, source, sink):
-	num_col = state.prop["num_col"]
-	num_row = state.prop["num_row"]
-	a = min(source, sink)
-	b = max(source, sink)
-	if (b-a == 1) and (a % num_col != 0):
-		return True
-	elif (b-a == num_col):
-		return True
+	return sink in state.grid.adjacent[source]
 
 """
 The first argument is the current state, always, and the others are the planning operator's usual arguments.
+The state is a copy-on-write copy of its parent, so writes must go through state.mutable(attr).
 """
 
 def navigate_op(state, a, source, sink):
 	if state.is_agent[a] and state.at[a] == source and can_traverse(state, source, sink) and state.cost[sink] <= state.MAX_COST:
-		state.at[a] = sink
+		state.mutable('at')[a] = sink
 		return state
 	else:
 		return False
@@ -35,33 +29,33 @@ def sample(state, x, s, p, obj):
 	if state.is_agent[x] and (x in state.stores) and (state.at[x] == p) \
 		and (obj in state.at.keys()) and (state.at[obj] == p) \
 		and (obj in state.rocks) and state.equipped_for_rock_analysis[x]:
-		state.empty[s] = False
-		state.store_has[s] = obj
-		state.at[obj] = None
-		state.has_rock_sample[x] = True
-		state.rock_sample[x] = obj
+		state.mutable('empty')[s] = False
+		state.mutable('store_has')[s] = obj
+		state.mutable('at')[obj] = None
+		state.mutable('has_rock_sample')[x] = True
+		state.mutable('rock_sample')[x] = obj
 		return state
 	elif state.is_agent[x] and (x in state.stores) and (state.at[x] == p) \
 		and  (obj in state.at.keys()) and (state.at[obj] == p) \
 		and (obj in state.soils) and state.equipped_for_soil_analysis[x]:
-		state.empty[s] = False
-		state.store_has[s] = obj
-		state.at[obj] = None
-		state.has_soil_sample[x] = True		
-		state.soil_sample[x] = obj
+		state.mutable('empty')[s] = False
+		state.mutable('store_has')[s] = obj
+		state.mutable('at')[obj] = None
+		state.mutable('has_soil_sample')[x] = True		
+		state.mutable('soil_sample')[x] = obj
 		return state
 	else: return False
 
 
 def set_up_soil_experiment(state, agent, lab):
 	if state.is_agent[agent] and (lab in state.is_lab) and (state.at[agent] == state.at[lab]):
-		state.lab_ready[lab].append("SOIL");
+		state.mutable('lab_ready')[lab].append("SOIL");
 		return state
 	else: return False
 
 def set_up_rock_experiment(state, agent, lab):
 	if state.is_agent[agent] and (lab in state.is_lab) and (state.at[agent] == state.at[lab]):
-		state.lab_ready[lab].append("ROCK");
+		state.mutable('lab_ready')[lab].append("ROCK");
 		return state
 	else: return False 
 
@@ -71,9 +65,9 @@ def analyze_soil_sample(state, agent, s, lab):
 	if state.is_agent[agent] and (agent in state.stores) and (s == state.stores[agent]) and (lab in state.is_lab) and (p == state.at[lab]) and (state.at[agent] == p) and (not state.empty[s]) and (state.lab_ready[lab]):
 		state.empty[s] == True
 		sample_obj = state.store_has[s]
-		state.lab_ready[lab].remove("SOIL")
-		state.has_soil_analysis[agent] = True
-		state.soil_analysis[agent] = sample_obj
+		state.mutable('lab_ready')[lab].remove("SOIL")
+		state.mutable('has_soil_analysis')[agent] = True
+		state.mutable('soil_analysis')[agent] = sample_obj
 		return state
 	else: return False
 
@@ -83,9 +77,9 @@ def analyze_rock_sample(state, agent, s, lab):
 	if state.is_agent[agent] and (agent in state.stores) and (s == state.stores[agent]) and (lab in state.is_lab) and (p == state.at[lab]) and (state.at[agent] == p) and (not state.empty[s]) and (state.lab_ready[lab]):
 		state.empty[s] == True
 		sample_obj = state.store_has[s]
-		state.lab_ready[lab].remove("ROCK")
-		state.has_rock_analysis[agent] = True
-		state.rock_analysis[agent] = sample_obj
+		state.mutable('lab_ready')[lab].remove("ROCK")
+		state.mutable('has_rock_analysis')[agent] = True
+		state.mutable('rock_analysis')[agent] = sample_obj
 		return state
 	else: return False
 
@@ -102,9 +96,9 @@ def drop(state, agent, store):
 		obj = state.store_has[store]
 		if(obj == None): pyhop.print_state(state)
 		assert(obj != None)
-		state.at[obj] = cur_loc
-		state.store_has.pop(store)
-		state.empty[store] = True
+		state.mutable('at')[obj] = cur_loc
+		state.mutable('store_has').pop(store)
+		state.mutable('empty')[store] = True
 		return state
 	else: return False
 
@@ -120,11 +114,11 @@ def communicate_data(state, agent, lander):
 	return state
 
 def visit(state, agent, waypoint):
-	state.visited[agent].add(waypoint)
+	state.mutable('visited')[agent].add(waypoint)
 	return state
 
 def unvisit(state, agent, waypoint):
-	state.visited[agent].remove(waypoint)
+	state.mutable('visited')[agent].remove(waypoint)
 	return state
 
 
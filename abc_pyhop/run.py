@@ -10,6 +10,8 @@ import models
 from planners import * 
 import problems as ProblemLib
 import statistics
+import result_store
+import multiprocessing, random, zlib
 
 class SimulationParameters(object):
     def __init__(self, planner, model, coc, num_repeat=1):
@@ -36,37 +38,200 @@ class ProblemParameters(object):
     def __repr__(self):
         return str(self.get_params())
 
-# WIth a given Planner and model and CoC
-def log_problems(SIM_PARAMS, PROBLEMS_DICT, file_obj_sim, file_obj_problem, file_obj_avg=None):
+"""
+The numbers the results files need from a Simulation, without the Simulation itself.
+Unlike a Simulation these can be sent back from a worker process, or read back from a
+per-simulation results file.
+"""
+class SimulationResult(object):
+    def __init__(self, total_cost, observations, messages_sent, messages_voided, steps):
+        self.total_cost = total_cost
+        self.observations = observations
+        self.messages_sent = messages_sent
+        self.messages_voided = messages_voided
+        self.steps = steps
+
+    @staticmethod
+    def from_simulation(simulation):
+        return SimulationResult(simulation.get_total_cost(), simulation.total_observations(), \
+            simulation.total_messages_sent(), simulation.total_messages_voided(), simulation.total_steps())
+
+    def get_total_cost(self):
+        return self.total_cost
+
+    def total_observations(self):
+        return self.observations
+
+    def total_messages_sent(self):
+        return self.messages_sent
+
+    def total_messages_voided(self):
+        return self.messages_voided
+
+    def total_steps(self):
+        return self.steps
+
+# Identifies the simulations of one (problem, params) pair in the per-simulation file
+def result_key(problem, params):
+    return (problem.name, params.planner.name, params.model.__name__, "{}".format(params.coc))
+
+# Identifies the row of one (params, problem_params) group in the per-problem-params file
+def group_key(params, problem_params):
+    return (params.planner.name, params.model.__name__, "{}".format(params.coc)) + \
+        tuple("{}".format(p) for p in problem_params.get_params())
+
+# Keys (the first num_keys fields) of the complete rows of a results file; rows cut short have fewer than num_fields
+def read_written_keys(file_name, num_fields, num_keys):
+    to_return = set()
+    try:
+        file_obj = open(file_name, 'r')
+    except IOError:
+        return to_return
+    for line in file_obj:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) == num_fields:
+            to_return.add(tuple(fields[:num_keys]))
+    file_obj.close()
+    return to_return
+
+# Reads back a per-simulation file written by write_result_by_simulation: key -> [SimulationResult]
+def read_results_by_simulation(file_name):
+    to_return = {}
+    try:
+        file_obj = open(file_name, 'r')
+    except IOError:
+        return to_return
+    for line in file_obj:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 9:
+            continue # Not a complete line, e.g. cut short by a crash
+        result = SimulationResult(float(fields[4]), int(fields[5]), int(fields[6]), int(fields[7]), int(fields[8]))
+        to_return.setdefault(tuple(fields[:4]), []).append(result)
+    file_obj.close()
+    return to_return
 
-    for j, params in enumerate(SIM_PARAMS):
-        k = 0
+# A crash can leave a file's last line unfinished; make sure the next write starts a new one
+def end_last_line(file_obj):
+    try:
+        last = open(file_obj.name, 'rb')
+    except IOError:
+        return
+    last.seek(0, 2)
+    if last.tell() > 0:
+        last.seek(-1, 2)
+        if last.read(1) != '\n':
+            file_obj.write('\n')
+    last.close()
+
+# Jobs of the running log_problems. Worker processes are forked after it is filled, so
+# they find the (unpicklable) planners and problems here instead of being sent them.
+JOBS = []
+LAST_PROBLEM = [None] # Problem of the last job run in this process
+
+def run_job(idx):
+    (params, PROBLEM, repeat, seed) = JOBS[idx]
+    print("Running problem: {} with parameters: {}; repeat {}/{}".format(PROBLEM.name, params, repeat, params.num_repeat))
+    # A seeded job must not see subplans an earlier job (in whichever process) sampled
+    if LAST_PROBLEM[0] is not PROBLEM or seed != None:
+        params.planner.clear_plan_library()
+        LAST_PROBLEM[0] = PROBLEM
+    PROBLEM.COST_OF_COMM = params.coc
+    PROBLEM.COST_REPLAN = 0
+    simulation = Simulation(PROBLEM, params.model, params.planner, seed=seed)
+    simulation.run()
+    return SimulationResult.from_simulation(simulation)
+
+# Seed of one simulation, derived from the sweep's seed and what the simulation is, so
+# it does not depend on the order or the process jobs are run in
+def job_seed(seed, problem, params, repeat):
+    if seed == None:
+        return None
+    return zlib.crc32(repr((seed,) + result_key(problem, params) + (repeat,))) & 0xffffffff
+
+"""
+WIth a given Planner and model and CoC.
+Simulations are independent, so with processes > 1 they are run by a pool of worker
+processes. Results are still written in the serial order, as they come in.
+With resume=True, simulations already in file_obj_sim (e.g. from a sweep that crashed)
+are not run again, and averaged rows are only written if file_obj_avg / file_obj_problem
+do not have them yet.
+Each simulation is seeded from seed (see job_seed), so a sweep gives the same results
+whatever the number of processes; seed=None uses the global random module instead.
+Given a result_store.ResultStore, each result is also added to it as a typed row.
+"""
+def log_problems(SIM_PARAMS, PROBLEMS_DICT, file_obj_sim, file_obj_problem, file_obj_avg=None, \
+        processes=1, resume=False, seed=0, store=None):
+
+    done = {}
+    (written_avg, written_groups) = (set(), set())
+    if resume:
+        done = read_results_by_simulation(file_obj_sim.name)
+        end_last_line(file_obj_sim)
+        written_groups = read_written_keys(file_obj_problem.name, 20, 9)
+        end_last_line(file_obj_problem)
+        if file_obj_avg != None:
+            written_avg = read_written_keys(file_obj_avg.name, 15, 4)
+            end_last_line(file_obj_avg)
+
+    # One entry per (params, problem_params): the problems, and per repeat either a
+    # finished result or the index of the job that will produce it
+    groups = []
+    del JOBS[:]
+    for params in SIM_PARAMS:
         for problem_params, PROBLEMS in PROBLEMS_DICT.items():
+            problems = []
+            for PROBLEM in PROBLEMS:
+                finished = done.get(result_key(PROBLEM, params), [])
+                repeats = []
+                for l in range(params.num_repeat):
+                    if l < len(finished):
+                        repeats.append(finished[l])
+                    else:
+                        JOBS.append((params, PROBLEM, l, job_seed(seed, PROBLEM, params, l)))
+                        repeats.append(len(JOBS) - 1)
+                problems.append((PROBLEM, repeats))
+            groups.append((params, problem_params, problems))
+
+    print("Running {} simulations with {} process(es)".format(len(JOBS), processes))
+    pool = None
+    if processes > 1 and len(JOBS) > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(run_job, range(len(JOBS))) # In order of the jobs
+    else:
+        results = (run_job(idx) for idx in range(len(JOBS)))
+
+    try:
+        for (params, problem_params, problems) in groups:
             simulations = []
-            k += 1
-            for i, PROBLEM in enumerate(PROBLEMS):
-                
+            for (PROBLEM, repeats) in problems:
                 repeated_sims = []
-                for l in range(params.num_repeat):
-                    print("Running problem: {} with parameters: {}\n\tnum_repeat {}/{}; Problem {}/{}; ProblemParams: {}/{}; Param {}/{}".format(\
-                            PROBLEM.name, params, l, params.num_repeat, i, len(PROBLEMS), k, len(PROBLEMS_DICT), j, len(SIM_PARAMS)))
-
-                    PROBLEM.COST_OF_COMM = params.coc
-                    PROBLEM.COST_REPLAN = 0
-                    simulation = Simulation(PROBLEM, params.model, params.planner)
-                    simulation.run()
-
+                for slot in repeats:
+                    if isinstance(slot, SimulationResult):
+                        simulation = slot
+                    else:
+                        simulation = next(results)
+                        # Write result to file
+                        write_result_by_simulation(PROBLEM, params, simulation, file_obj_sim)
+                        if store != None:
+                            store.add(PROBLEM, params, simulation)
                     simulations.append(simulation)
                     repeated_sims.append(simulation)
-                    # Write result to file
-                    write_result_by_simulation(PROBLEM, params, simulation, file_obj_sim)
 
                 file_obj_sim.flush()
-                
-                if file_obj_avg != None and params.num_repeat > 1:
+
+                if file_obj_avg != None and params.num_repeat > 1 and result_key(PROBLEM, params) not in written_avg:
                     write_result_avg_rand_planner(PROBLEM, params, repeated_sims, file_obj_avg)
-                
-            write_result_by_sim_params(params, problem_params, simulations, file_obj_problem)
+
+            if group_key(params, problem_params) not in written_groups:
+                write_result_by_sim_params(params, problem_params, simulations, file_obj_problem)
+    except:
+        if pool != None:
+            pool.terminate() # Don't leave workers running jobs nobody will read
+        raise
+    finally:
+        if pool != None:
+            pool.close()
+            pool.join()
 
 
 # Write simulation results in results directory
@@ -39,7 +39,8 @@ class Simulation():
                 a_star=True, 
                 gui=False, 
                 re_plan=True,
-                use_tree=False):
+                use_tree=False,
+                seed=None):
         
         self.make_logger(world, AgentType)
         self.log.info('Simulation Logger Created')
@@ -65,6 +66,11 @@ class Simulation():
         self.communications = []    # A set of CommMessage objects
         self.comm_buff = []         # Keeps temporary communication during the current step
 
+        # Everything random in the run (plan sampling, tie-breaks, uncertainty) draws from
+        # one generator shared by the world's copies; None keeps the global random module.
+        set_rng(world, None if seed == None else RNG(seed))
+        self.rng = get_rng(world)
+
         self.real_world = copy.deepcopy(world) # Real world has possible uncertainties.
         self.solutions = {}
         self.planTrees = {}
@@ -78,7 +84,7 @@ class Simulation():
             # Get Plan
             # results = pyhop(world, agent_name, plantree=use_tree, verbose=verbose)
             results = planner.plan(world, agent_name)
-            self.solutions[agent_name] = random.choice(results)
+            self.solutions[agent_name] = self.rng.choice(results)
             
         # Create Agent and set solutions
         for agent_name in self.solutions.keys():
@@ -102,7 +108,7 @@ class Simulation():
     """ temporary hack for testing """
     def remove_traps(world):
         for key in world.loc_available:
-            world.loc_available[key] = True
+            world.mutable('loc_available')[key] = True
         return world
 
     @staticmethod # Outdated
@@ -212,7 +218,7 @@ class Simulation():
         step = 0
         while True:
             step += 1
-            self.log.info("========= step {} ========".format(step))
+            self.log.info("========= step %s ========", step, extra={'event': 'sim_step', 'step': step})
             self.step_all()
             if all(agent.is_done() for agent in self.agents.values()):
                 return
@@ -246,21 +252,22 @@ class Simulation():
 
         actions_took = {} # Maps agent names to the set of actions
 
-        self.log.info('REAL WORLD: ' + str(self.real_world.at))
-        self.log.info('REAL WORLD: ' + str(self.real_world.cost))
-        self.log.info(('rock analysis: ', self.real_world.rock_analysis))
-        self.log.info(('soil analysis: ', self.real_world.soil_analysis))
-        self.log.info(('has rock sample: ', self.real_world.has_rock_sample))
-        self.log.info(('has soil sample: ', self.real_world.has_soil_sample))
-        self.log.info("\n" + print_board_str(self.real_world))
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info('REAL WORLD: %s', self.real_world.at)
+            self.log.info('REAL WORLD: %s', self.real_world.cost)
+            self.log.info(('rock analysis: ', self.real_world.rock_analysis))
+            self.log.info(('soil analysis: ', self.real_world.soil_analysis))
+            self.log.info(('has rock sample: ', self.real_world.has_rock_sample))
+            self.log.info(('has soil sample: ', self.real_world.has_soil_sample))
+            self.log.info("\n%s", BoardStr(self.real_world))
 
         for (agent_name, agent) in self.agents.items():
-            self.log.info("\n\nAgent Name: {}\n".format(agent_name))
+            self.log.info("\n\nAgent Name: %s\n", agent_name)
             # info and base-case
             if not agent.is_done():
                 cur_action = agent.get_cur_action()
                 next_state = agent.get_next_state()
-                self.log.info("agent {} current action is {}".format(agent_name, cur_action))
+                self.log.info("agent %s current action is %s", agent_name, cur_action)
 
             # initailize
             actions_took[agent_name] = []
@@ -273,7 +280,7 @@ class Simulation():
 
             # Diffs contains the new observations
             diffs = agent.make_observations(self.real_world)  # 1. Update agent's world model 
-            self.log.info("Agent {} made the following observations: {}\n".format(agent.name, diffs))
+            self.log.info("Agent %s made the following observations: %s\n", agent.name, diffs)
 
 
             # 2. Decide to Communicate ~~~~~~~~~~~~
@@ -283,13 +290,13 @@ class Simulation():
             out_commMsgs = []
             void_msgs = []
             if len(diffs) > 0:
-                self.log.info("****** Agent {} Reasons about Communicaiton ******".format(agent.name))
+                self.log.info("****** Agent %s Reasons about Communicaiton ******", agent.name)
                 (out_commMsgs, void_msgs) = agent.communicate(diffs) # Out_messages is a set of CommMessage
                 self.comm_buff += out_commMsgs # append to comm-buffer
                 
 
-                self.log.info("Agent {} decided to communicate:\n\t{}".format(agent.name, out_commMsgs))
-                self.log.info("Agent {} decide NOT to communicate:\n\t{}".format(agent.name, void_msgs))
+                self.log.info("Agent %s decided to communicate:\n\t%s", agent.name, out_commMsgs)
+                self.log.info("Agent %s decide NOT to communicate:\n\t%s", agent.name, void_msgs)
 
                 # Add communication to actions taken (including all messages NOT sent)
                 for commMsg in out_commMsgs:
@@ -310,7 +317,7 @@ class Simulation():
 
                 # Used for debugging re-planning
                 # if world_changed and not replan:
-                #     self.log.info("Replanning Agent {} due to incoming message!!".format(agent.name))
+                #     self.log.info("Replanning Agent %s due to incoming message!!", agent.name)
                 #     verbose = 10
 
                 if agent.replan(stuck=replan, verbose=verbose):
@@ -416,9 +423,9 @@ class Simulation():
             print_board(self.real_world)
 
             # When re-plan need to reset "visited" from the Real-world
-            self.real_world.visited[agent_name] = set()
+            self.real_world.mutable('visited')[agent_name] = set()
             results = pyhop(copy.deepcopy(self.real_world), agent_name, plantree=self.PARAMS['use_tree'])
-            result = random.choice(results)
+            result = self.rng.choice(results)
 
             if result == None or result == False:
                 print('*** no solution found for agent:{}, goal:{}'.format(agent_name, self.real_world.goals[agent_name]))
@@ -474,6 +481,12 @@ class Simulation():
 
     def total_replans(self):
         return sum([agent.times_replanned for agent in self.agents.values()])
+
+    # (hits, reuses, misses) of the agents' EX_COST plan caches
+    def plan_cache_stats(self):
+        return (sum([agent.plan_cache.hits for agent in self.agents.values()]),
+            sum([agent.plan_cache.reuses for agent in self.agents.values()]),
+            sum([agent.plan_cache.misses for agent in self.agents.values()]))
     
     def total_steps(self):
         return sum([len(agent.get_histories()) for agent in self.agents.values()])
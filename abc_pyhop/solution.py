@@ -1,6 +1,74 @@
 
-import pyhop
+import pyhop, itertools, copy
 from plantree import orNode, andNode
+
+# A copy of state that takes the attributes attrs from world
+def rebased_state(state, world, attrs):
+	new_state = state.copy()
+	for attr in attrs:
+		setattr(new_state, attr, getattr(world, attr))
+	return new_state
+
+# The cell whose cost an operator task's cost reads (see random_rovers_world.cost_function);
+# None for tasks that cost the same in every world
+def cost_cell(task):
+	if task[0] == 'navigate_op':
+		return task[3]
+	return None
+
+"""
+Costs of operator tasks under a world, cached and indexed by the cell each one reads.
+update(world) re-costs only the tasks whose cell costs something else in world than in
+the world last updated to, and returns those cells; None if every task was costed anew
+(the first update, or a world with another cost_func).
+"""
+class CostIndex(object):
+
+	def __init__(self, tasks=[]):
+		self.cost = {} # task -> cost
+		self.by_cell = {} # cell -> tasks that read it
+		self.cell_cost = {} # cell -> its cost when its tasks were last costed
+		self.cost_func = None
+		self.pending = []
+		for task in tasks:
+			self.add(task)
+
+	# task is costed on the next update
+	def add(self, task):
+		if task not in self.cost:
+			self.cost[task] = None
+			self.pending.append(task)
+
+	def update(self, world):
+		changed = []
+		if world.cost_func is not self.cost_func:
+			self.cost_func = world.cost_func
+			self.pending = self.cost.keys()
+			self.by_cell = {}
+			self.cell_cost = {}
+			changed = None
+		for (cell, cost) in self.cell_cost.iteritems():
+			if world.cost[cell] != cost:
+				changed.append(cell)
+		for cell in changed or []:
+			self.cell_cost[cell] = world.cost[cell]
+			for task in self.by_cell[cell]:
+				self.cost[task] = world.cost_func(world, task)
+		for task in self.pending:
+			cell = cost_cell(task)
+			if cell != None:
+				if cell not in self.by_cell:
+					self.by_cell[cell] = []
+					self.cell_cost[cell] = world.cost[cell]
+				self.by_cell[cell].append(task)
+			self.cost[task] = world.cost_func(world, task)
+		self.pending = []
+		return changed
+
+	# Tasks re-costed by an update that returned changed
+	def changed_tasks(self, changed):
+		return [task for cell in changed for task in self.by_cell[cell]]
+
 class Solution(object):
 
 	def __init__(self, problem, agent_name, actions, states):
@@ -9,6 +77,9 @@ class Solution(object):
 		self.actions = actions
 		self.states = states
 		self.cost = sum([problem.cost_func(problem, a) for a in self.actions])
+		self.cost_index = None # Built by get_projected_cost
+		self.positions = None
+		self.action_costs = None
 
 	def __repr__(self):
 		return "Solution Object for Problem:{}; Agent:{}; Expected-Cost:{}\n\tActions:{}"\
@@ -19,7 +90,24 @@ class Solution(object):
 
 	# Get Expected Cost relative to a given world belief
 	def get_exp_cost(self, world):
-		return sum([world.cost_func(world, a) for a in self.actions])
+		return self.get_projected_cost(world)
+
+	# Cost of the actions from start on, relative to world. Only the actions on cells whose
+	# cost changed since the last call are re-costed.
+	def get_projected_cost(self, world, start=0):
+		if self.cost_index == None:
+			self.cost_index = CostIndex(self.actions)
+			self.positions = {} # action -> its indices in actions
+			for (i, action) in enumerate(self.actions):
+				self.positions.setdefault(action, []).append(i)
+		changed = self.cost_index.update(world)
+		if changed == None:
+			self.action_costs = [self.cost_index.cost[a] for a in self.actions]
+		else:
+			for task in self.cost_index.changed_tasks(changed):
+				for i in self.positions[task]:
+					self.action_costs[i] = self.cost_index.cost[task]
+		return sum(self.action_costs[start:])
 
 	def get_actions(self):
 		return self.actions
@@ -34,6 +122,29 @@ class Solution(object):
 	def get_all_plans(self):
 		return [(self.actions, self.states)]
 
+	def get_num_opt_plans(self):
+		return 1
+
+	def iter_plans(self):
+		return iter(self.get_all_plans())
+
+	# At most limit plans, without enumerating the rest
+	def get_plans(self, limit=None):
+		return list(itertools.islice(self.iter_plans(), limit))
+
+	# Operator tasks of the optimal plans
+	def iter_opt_tasks(self):
+		return iter(self.actions)
+
+	"""
+	This solution, for a world that differs from its problem only in attributes that the
+	actions do not read (e.g. the cost of cells the plan never enters). The plan's states
+	take those attributes from world.
+	"""
+	def recosted(self, world):
+		attrs = self.problem.changed_attrs(world)
+		return Solution(world, self.agent, self.actions, [rebased_state(s, world, attrs) for s in self.states])
+
 class SolutionTree(Solution):
 
 	def __init__(self, root, agent_name, rand=False):
@@ -42,7 +153,32 @@ class SolutionTree(Solution):
 		self.root = root
 		self.actions, self.states = self.root.get_plan(rand=rand)
 		self.cost = sum([self.problem.cost_func(self.problem, a) for a in self.actions])
-		
+		self.rebase_attrs = None # Set by recosted: attributes the tree's states take from problem
+		self.rebased = None
+		self.tree_index = None # Built by get_exp_cost
+
+	# Shares the tree; its states are rebased onto world when they are handed out
+	def recosted(self, world):
+		to_return = copy.copy(self)
+		to_return.problem = world
+		to_return.rebase_attrs = self.root.state.changed_attrs(world)
+		to_return.rebased = {}
+		to_return.states = [to_return.rebase(s) for s in self.states]
+		return to_return
+
+	# A state of the tree, as it is in problem
+	def rebase(self, state):
+		if self.rebase_attrs == None:
+			return state
+		new_state = self.rebased.get(id(state))
+		if new_state is None:
+			new_state = rebased_state(state, self.problem, self.rebase_attrs)
+			self.rebased[id(state)] = new_state
+		return new_state
+
+	def rebase_plan(self, plan):
+		(actions, states) = plan
+		return (actions, [self.rebase(s) for s in states])
 
 	def __repr__(self):
 		to_return = super(SolutionTree, self).__repr__()
@@ -50,7 +186,45 @@ class SolutionTree(Solution):
 		return to_return
 
 	def get_all_plans(self):
-		return self.root.get_all_opt_plans()
+		if self.rebase_attrs == None:
+			return self.root.get_all_opt_plans()
+		return list(self.iter_plans()) if self.root.success else None
+
+	# Optimal plans are generated lazily from the tree
+	def iter_plans(self):
+		if self.rebase_attrs == None:
+			return self.root.iter_all_opt_plans()
+		return (self.rebase_plan(plan) for plan in self.root.iter_all_opt_plans())
+
+	# Operator tasks under the good children, without enumerating the plans
+	def iter_opt_tasks(self):
+		if not self.root.success:
+			return
+		stack = [self.root]
+		while len(stack) != 0:
+			node = stack.pop()
+			if isinstance(node, orNode) and len(node.children) == 0:
+				if node.task[0] in pyhop.operators:
+					yield node.task
+			elif isinstance(node, orNode):
+				stack.extend(node.good_children)
+			else:
+				stack.extend(node.children)
+
+	# Samples up to k distinct optimal plans by choosing randomly among the good children top-down
+	def sample_plans(self, k, max_draws=None):
+		if max_draws == None:
+			max_draws = 10 * k
+		to_return = []
+		seen = set()
+		for i in range(max_draws):
+			if len(to_return) == k:
+				break
+			(actions, states) = self.root.get_plan(rand=True)
+			if tuple(actions) not in seen:
+				seen.add(tuple(actions))
+				to_return.append(self.rebase_plan((actions, states)))
+		return to_return
 
 	def get_cost(self):
 		return self.root.cost
@@ -79,9 +253,92 @@ class SolutionTree(Solution):
 		
 		return to_return
 
+	"""
+	get_exp_cost_helper(root, world), kept per node of the optimal subtree along with an
+	index from each cell to the operator leaves that enter it. After the first call, only
+	the leaves on cells whose cost changed, and their ancestors, are re-costed. Each node is
+	re-costed from its children's costs as get_exp_cost_helper adds them up, so both agree
+	to the last bit. The index is rebuilt once the search expands the tree further (a
+	resumed anytime search stamps a new root.generation), or if it meets a node it has not seen.
+	"""
 	def get_exp_cost(self, world):
-		return self.get_exp_cost_helper(self.root, world)
+		if self.tree_index == None or self.tree_index.generation != self.root.generation:
+			self.tree_index = ExpCostTree(self.root)
+		cost = self.tree_index.exp_cost(world)
+		if cost == None:
+			self.tree_index = ExpCostTree(self.root)
+			cost = self.tree_index.exp_cost(world)
+		return cost
 
 	def get_num_opt_plans(self):
 		return self.root.get_num_opt_plans()
 
+
+
+"""
+Expected costs of the subtrees of a SolutionTree's optimal subtree (the good children of
+the OR nodes and the children of the AND nodes), for SolutionTree.get_exp_cost.
+"""
+class ExpCostTree(object):
+
+	def __init__(self, root):
+		self.root = root
+		self.generation = root.generation
+		self.leaves = {} # operator task -> leaves with that task
+		self.nodes = [] # Children before parents
+		stack = [(root, False)]
+		while len(stack) != 0:
+			(node, expanded) = stack.pop()
+			if expanded:
+				self.nodes.append(node)
+				continue
+			assert(node.success)
+			stack.append((node, True))
+			if isinstance(node, orNode):
+				if node.task[0] in pyhop.operators and len(node.children) == 0:
+					self.leaves.setdefault(node.task, []).append(node)
+				stack.extend((c, False) for c in node.good_children)
+			elif isinstance(node, andNode):
+				stack.extend((c, False) for c in node.children)
+			else:
+				assert(False), "Node is neither OR nor AND: {}".format(node)
+		self.cost_index = CostIndex(self.leaves.keys())
+		self.sub_cost = {} # id(node) -> expected cost of its subtree
+
+	def is_leaf(self, node):
+		return isinstance(node, orNode) and node.task[0] in pyhop.operators and len(node.children) == 0
+
+	# As get_exp_cost_helper, from the costs of node's children; None if the index lacks one
+	def node_cost(self, node):
+		if self.is_leaf(node):
+			return self.cost_index.cost.get(node.task)
+		children = node.good_children if isinstance(node, orNode) else node.children
+		if any(id(c) not in self.sub_cost for c in children):
+			return None
+		if isinstance(node, orNode):
+			if len(node.good_children) == 0:
+				return 0
+			k = 1.0/len(node.good_children)
+			return sum(k * self.sub_cost[id(c)] for c in node.good_children)
+		return sum(self.sub_cost[id(c)] for c in node.children)
+
+	def exp_cost(self, world):
+		changed = self.cost_index.update(world)
+		if changed == None:
+			for node in self.nodes:
+				self.sub_cost[id(node)] = self.node_cost(node)
+			return self.sub_cost[id(self.root)]
+
+		# The leaves on changed cells and their ancestors, each once, children first
+		dirty = {}
+		for task in self.cost_index.changed_tasks(changed):
+			for node in self.leaves[task]:
+				while node != None and id(node) not in dirty:
+					dirty[id(node)] = node
+					node = node.parent if node is not self.root else None
+		for node in sorted(dirty.values(), key=lambda n: -n.level):
+			cost = self.node_cost(node)
+			if cost == None:
+				return None # The tree changed under the index
+			self.sub_cost[id(node)] = cost
+		return self.sub_cost[id(self.root)]